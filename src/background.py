@@ -0,0 +1,196 @@
+'''!
+@file background.py
+This file contains a class that learns what each camera pixel normally sees, so targets can be
+found as pixels that are hotter than usual rather than hotter than the rest of the image.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+from array import array
+
+## Fraction bits kept in the background means
+MEAN_FRAC = 4
+## Largest stored variance, so the variances stay small integers
+VAR_MAX = (1 << 30) - 1
+## Extra learning rate shift for target pixels, so a target standing still fades 16 times slower
+TARGET_SHIFT = 4
+
+class BackgroundModel:
+    '''!
+    This class implements a per-pixel background model for integer camera images such as the
+    pixel data of a raw image. Each pixel keeps an exponentially weighted running mean and
+    variance in fixed point, updated with integer arithmetic only. A pixel is a target pixel
+    when it is more than k standard deviations hotter than its mean. Because each pixel is
+    compared with its own history, a warm wall or the sun entering the frame does not change
+    how the other pixels are judged. A drift shared by the whole image, such as the camera
+    warming up, is measured as the average change of the pixels within k standard deviations of
+    their means in each image and taken out of the comparison for the next one, so the means
+    lagging behind it don't look like targets and a large target doesn't pass for a drift.
+    '''
+
+    def __init__(self, width=32, height=24, rate_shift=4, k=3, min_sigma=2, warmup=8, mirror=False):
+        '''!
+        Creates an empty background model.
+        @param width Integer number of pixel columns in the image
+        @param height Integer number of pixel rows in the image
+        @param rate_shift Integer; each new image moves the mean and variance 1/2**rate_shift of the way towards it
+        @param k Number of standard deviations above the mean for a pixel to be a target pixel
+        @param min_sigma Smallest standard deviation used for the test, in image counts, so very quiet pixels don't trigger on noise
+        @param warmup Integer number of images to learn before the model is ready
+        @param mirror If True, the output mask and heat images are mirrored left to right, matching MLX_Cam.get_normalized()
+        '''
+        size = width * height
+        ## Width of the image in pixels
+        self.width = width
+        ## Height of the image in pixels
+        self.height = height
+        ## Mean of each pixel, with MEAN_FRAC fraction bits
+        self.mean = array('i', bytes(4 * size))
+        ## Variance of each pixel, with 2 * MEAN_FRAC fraction bits
+        self.var = array('i', bytes(4 * size))
+        ## Number of images learned so far, counted up to the larger of warmup and 2**rate_shift
+        self.frames = 0
+        ## Whether learning is paused, for example while the turret is moving
+        self.frozen = False
+        ## Average amount by which the pixels within k standard deviations were above their means in the last image, with MEAN_FRAC fraction bits
+        self.drift = 0
+        self._rate_shift = rate_shift
+        self._k2 = k * k
+        self._min_var = (min_sigma << MEAN_FRAC) ** 2
+        self._warmup = warmup
+        # Bit n set once the pixels of subpage n have been seeded with their first values
+        self._seeded = 0
+        self._max_frames = max(warmup, 1 << rate_shift)
+        self._mirror = mirror
+
+    @property
+    def ready(self):
+        '''!
+        Whether enough images have been learned for the model to find targets.
+        '''
+        return self.frames >= self._warmup
+
+    def reset(self):
+        '''!
+        Forgets the learned background, for example after the camera has been pointed somewhere new.
+        '''
+        self.frames = 0
+        self.drift = 0
+        self._seeded = 0
+
+    def freeze(self):
+        '''!
+        Pauses learning. Images are still compared with the background, but don't change it.
+        '''
+        self.frozen = True
+
+    def thaw(self):
+        '''!
+        Resumes learning after freeze().
+        '''
+        self.frozen = False
+
+    def update(self, data, mask=None, heat=None, rows=None, subpage=None):
+        '''!
+        Compares an image with the background and then learns from it, unless the model is frozen.
+        @param data Indexable integer image, row by row, such as RawImage.pix
+        @param mask PackedMask whose rows are set to the target pixels, or None
+        @param heat Array which receives how far each target pixel is above its mean in image counts
+                    (clamped to 65535), and 0 for the other pixels, or None
+        @param rows A (first, last) pair of pixel rows, inclusive, to compare and learn only a region
+                    of interest, or None for the whole image; mask and heat rows outside the region are cleared
+        @param subpage 0 or 1 to compare and learn only the pixels of that chess pattern subpage, just
+                    read from the camera, or None for every pixel. The mask bits and heat of the other
+                    subpage are kept, and an image counts as learned after subpage 1
+        @returns The number of target pixels found
+        '''
+        width = self.width
+        mean = self.mean
+        var = self.var
+        k2 = self._k2
+        min_var = self._min_var
+        mirror = self._mirror
+        learn = not self.frozen
+        # Subpages whose pixels still take their first values as the mean (none once both are seeded)
+        unseeded = 0 if not learn else 3 & ~self._seeded
+        # Learn quickly while warming up, averaging all of the images seen so far
+        div = min(self.frames + 1, 1 << self._rate_shift)
+        # The mask holds two 16-bit words per row, columns 0 to 15 then 16 to 31
+        words = mask.rows if mask is not None else None
+        first_row, last_row = rows if rows is not None else (0, self.height - 1)
+        drift = self.drift
+        found = 0
+        drift_sum = 0
+        count = 0
+
+        if rows is not None:
+            for row in range(self.height):
+                if row < first_row or row > last_row:
+                    if words is not None:
+                        words[2 * row] = 0
+                        words[2 * row + 1] = 0
+                    if heat is not None:
+                        for idx in range(row * width, (row + 1) * width):
+                            heat[idx] = 0
+        for row in range(first_row, last_row + 1):
+            word_lo = word_hi = 0
+            visited_lo = visited_hi = 0
+            base = row * width
+            # Camera columns to visit: all of them, or every other one for a chess pattern subpage
+            if subpage is None:
+                columns = range(width)
+            else:
+                columns = range((row ^ subpage) & 1, width, 2)
+            for cam_col in columns:
+                col = width - 1 - cam_col if mirror else cam_col
+                src = base + cam_col
+                bit = 1 << (col & 15)
+                if col < 16:
+                    visited_lo |= bit
+                else:
+                    visited_hi |= bit
+                x = data[src] << MEAN_FRAC
+                first = unseeded and (unseeded >> ((row ^ cam_col) & 1)) & 1
+                if first:
+                    mean[src] = x
+                    var[src] = min_var
+                d = x - mean[src]
+                e = d - drift
+                d2 = e * e
+                if d2 > VAR_MAX:
+                    d2 = VAR_MAX
+                v = var[src]
+                target = e > 0 and d2 > k2 * (v if v > min_var else min_var)
+                if target:
+                    if col < 16:
+                        word_lo |= bit
+                    else:
+                        word_hi |= bit
+                    found += 1
+                elif d2 <= k2 * (v if v > min_var else min_var):
+                    # Only pixels within k standard deviations either way measure the drift
+                    drift_sum += d
+                    count += 1
+                if heat is not None:
+                    if target:
+                        excess = e >> MEAN_FRAC
+                        heat[base + col] = excess if excess < 65535 else 65535
+                    else:
+                        heat[base + col] = 0
+                if learn and not first:
+                    rate = div << TARGET_SHIFT if target else div
+                    mean[src] += d // rate
+                    var[src] = v + (d2 - v) // rate
+            if words is not None:
+                words[2 * row] = (words[2 * row] & ~visited_lo) | word_lo
+                words[2 * row + 1] = (words[2 * row + 1] & ~visited_hi) | word_hi
+
+        # Keep the last drift if every pixel looked at was an outlier
+        if count:
+            self.drift = drift_sum // count
+        if learn:
+            self._seeded |= 3 if subpage is None else 1 << subpage
+        if learn and self.frames < self._max_frames and subpage != 0:
+            self.frames += 1
+        return found
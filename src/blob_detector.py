@@ -0,0 +1,238 @@
+'''!
+@file blob_detector.py
+This file contains a class that finds separate warm objects (blobs) in a thresholded camera image.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+from array import array
+
+class Blob:
+    '''!
+    This class holds the size, position and heat of one group of connected target pixels.
+    '''
+
+    def __init__(self):
+        '''!
+        Creates an empty blob. Blobs are preallocated by the detector and refilled on every detection.
+        '''
+        ## Label of the blob's pixels in the detector's label image
+        self.label = 0
+        ## Number of pixels in the blob
+        self.area = 0
+        ## Leftmost column of the bounding box
+        self.x_min = 0
+        ## Rightmost column of the bounding box
+        self.x_max = 0
+        ## Top row of the bounding box
+        self.y_min = 0
+        ## Bottom row of the bounding box
+        self.y_max = 0
+        ## Centroid column, measured to pixel centres (a single pixel in column 0 gives 0.5)
+        self.x = 0.0
+        ## Centroid row, measured to pixel centres
+        self.y = 0.0
+        ## Highest heat value in the blob
+        self.peak = 0
+        ## Sum of the heat values of all pixels in the blob
+        self.heat = 0
+
+
+class BlobDetector:
+    '''!
+    This class implements a single-pass connected-component labeller for camera images.
+    Pixels are connected to all eight neighbours. Provisional labels are joined with a union-find
+    and their statistics are merged as they join, so each pixel is visited once. All working
+    storage is preallocated.
+    '''
+
+    def __init__(self, width=32, height=24, max_blobs=16):
+        '''!
+        Creates a blob detector for images of the given size.
+        @param width Integer number of pixel columns in the image
+        @param height Integer number of pixel rows in the image
+        @param max_blobs Integer maximum number of blobs reported per image
+        '''
+        size = width * height
+        # A new label needs an empty pixel before it in its row, so there can be
+        # at most one per two columns in each row
+        max_labels = (width + 1) // 2 * height + 1
+
+        ## Width of the image in pixels
+        self.width = width
+        ## Height of the image in pixels
+        self.height = height
+        ## Label of each pixel after detection, 0 for background; matches Blob.label
+        self.labels = array('H', bytes(2 * size))
+        self._parent = array('H', bytes(2 * max_labels))
+        self._area = array('H', bytes(2 * max_labels))
+        self._sum_x = array('H', bytes(2 * max_labels))
+        self._sum_y = array('H', bytes(2 * max_labels))
+        self._heat = array('i', bytes(4 * max_labels))
+        self._peak = array('i', bytes(4 * max_labels))
+        self._x_min = array('B', bytes(max_labels))
+        self._x_max = array('B', bytes(max_labels))
+        self._y_min = array('B', bytes(max_labels))
+        self._y_max = array('B', bytes(max_labels))
+        ## Preallocated blob objects which are refilled by detect()
+        self.blobs = tuple(Blob() for _ in range(max_blobs))
+
+    def _find(self, label):
+        '''!
+        Finds the root label of a provisional label, halving the path on the way.
+        @param label Integer provisional label
+        @returns The root label
+        '''
+        parent = self._parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    def _union(self, label, other):
+        '''!
+        Joins the set of a neighbouring pixel's label to the set being built for the current pixel.
+        @param label Integer root label found so far for the current pixel, or 0 if none yet
+        @param other Integer label of a neighbouring pixel
+        @returns The root label of the joined set
+        '''
+        root = self._find(other)
+        if not label or root == label:
+            return root
+        if root < label:
+            root, label = label, root
+        self._join(label, root)
+        return label
+
+    def _join(self, root, other):
+        '''!
+        Merges the set with root label other into the set with root label root.
+        @param root Integer root label which is kept
+        @param other Integer root label which is merged away
+        '''
+        self._parent[other] = root
+        self._area[root] += self._area[other]
+        self._sum_x[root] += self._sum_x[other]
+        self._sum_y[root] += self._sum_y[other]
+        self._heat[root] += self._heat[other]
+        if self._peak[other] > self._peak[root]:
+            self._peak[root] = self._peak[other]
+        if self._x_min[other] < self._x_min[root]:
+            self._x_min[root] = self._x_min[other]
+        if self._x_max[other] > self._x_max[root]:
+            self._x_max[root] = self._x_max[other]
+        if self._y_min[other] < self._y_min[root]:
+            self._y_min[root] = self._y_min[other]
+        if self._y_max[other] > self._y_max[root]:
+            self._y_max[root] = self._y_max[other]
+
+    def detect(self, mask, heat=None, min_area=1):
+        '''!
+        Finds the blobs in a mask image.
+        @param mask Indexable image, row by row, which is nonzero for target pixels, or a PackedMask
+        @param heat Indexable image of integer heat values used for the peak and summed heat of each blob, or None to count each pixel as 1
+        @param min_area Integer minimum number of pixels for a blob to be reported; smaller specks are ignored
+        @returns A list of the blobs found, hottest (largest summed heat) first
+        '''
+        width = self.width
+        labels = self.labels
+        parent = self._parent
+        find = self._find
+        union = self._union
+        next_label = 1
+        # A packed mask is read a row (two 16-bit words) at a time so empty rows are skipped
+        rows = getattr(mask, 'rows', None)
+
+        idx = 0
+        for row in range(self.height):
+            if rows is not None:
+                lo = rows[2 * row]
+                hi = rows[2 * row + 1]
+                if not (lo | hi):
+                    for i in range(idx, idx + width):
+                        labels[i] = 0
+                    idx += width
+                    continue
+            for col in range(width):
+                if rows is None:
+                    on = mask[idx]
+                elif col < 16:
+                    on = (lo >> col) & 1
+                else:
+                    on = (hi >> (col - 16)) & 1
+                if not on:
+                    labels[idx] = 0
+                    idx += 1
+                    continue
+
+                # Join the labels of the neighbours which have already been scanned
+                label = 0
+                if col and labels[idx - 1]:
+                    label = find(labels[idx - 1])
+                if row:
+                    up = idx - width
+                    if col and labels[up - 1]:
+                        label = union(label, labels[up - 1])
+                    if labels[up]:
+                        label = union(label, labels[up])
+                    if col < width - 1 and labels[up + 1]:
+                        label = union(label, labels[up + 1])
+
+                value = heat[idx] if heat is not None else 1
+                if not label:
+                    label = next_label
+                    next_label += 1
+                    parent[label] = label
+                    self._area[label] = 1
+                    self._sum_x[label] = col
+                    self._sum_y[label] = row
+                    self._heat[label] = value
+                    self._peak[label] = value
+                    self._x_min[label] = self._x_max[label] = col
+                    self._y_min[label] = self._y_max[label] = row
+                else:
+                    self._area[label] += 1
+                    self._sum_x[label] += col
+                    self._sum_y[label] += row
+                    self._heat[label] += value
+                    if value > self._peak[label]:
+                        self._peak[label] = value
+                    if col < self._x_min[label]:
+                        self._x_min[label] = col
+                    elif col > self._x_max[label]:
+                        self._x_max[label] = col
+                    self._y_max[label] = row
+                labels[idx] = label
+                idx += 1
+
+        # Point every pixel at its root label so the label image matches the blobs
+        for idx in range(len(labels)):
+            if labels[idx]:
+                labels[idx] = find(labels[idx])
+
+        found = []
+        for label in range(1, next_label):
+            if parent[label] != label or self._area[label] < min_area:
+                continue
+            if len(found) < len(self.blobs):
+                blob = self.blobs[len(found)]
+                found.append(blob)
+            else:
+                # Out of blobs, so reuse the coolest one if this blob is hotter
+                blob = min(found, key=lambda blob: blob.heat)
+                if self._heat[label] <= blob.heat:
+                    continue
+            area = self._area[label]
+            blob.label = label
+            blob.area = area
+            blob.x_min = self._x_min[label]
+            blob.x_max = self._x_max[label]
+            blob.y_min = self._y_min[label]
+            blob.y_max = self._y_max[label]
+            blob.x = self._sum_x[label] / area + 0.5
+            blob.y = self._sum_y[label] / area + 0.5
+            blob.peak = self._peak[label]
+            blob.heat = self._heat[label]
+        found.sort(key=lambda blob: blob.heat, reverse=True)
+        return found
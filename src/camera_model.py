@@ -0,0 +1,117 @@
+'''!
+@file camera_model.py
+This file contains a class that converts positions in the camera image into turret angles and
+encoder ticks.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+from array import array
+from math import atan, tan, radians, degrees
+
+class CameraModel:
+    '''!
+    This class implements a pinhole camera model with optional radial lens distortion. The angle
+    of every pixel column and row edge is worked out once, when the model is created, and stored
+    in tables; converting an image position is then two table lookups with linear interpolation.
+    Positions are measured to pixel centres, so 0 is the left (or top) edge of the image and
+    width (or height) the other edge. Distortion is corrected along each axis separately, which
+    is exact on the centre row and column and close elsewhere for a mild lens.
+    '''
+
+    def __init__(self, width=32, height=24, x_fov=55, y_fov=35, distortion=0,
+                 x_offset=0, y_offset=0, x_scale=1, y_scale=1, x_tick_ratio=1, y_tick_ratio=1):
+        '''!
+        Creates a camera model and builds its angle tables.
+        @param width Integer number of pixel columns in the image
+        @param height Integer number of pixel rows in the image
+        @param x_fov Horizontal field of view in degrees
+        @param y_fov Vertical field of view in degrees
+        @param distortion Radial distortion coefficient k1; a point at normalised distance r from the
+                          image centre really lies at r * (1 + k1 * r**2). Negative for barrel distortion
+        @param x_offset Angle added to every horizontal angle, in degrees, to correct the camera mounting
+        @param y_offset Angle added to every vertical angle, in degrees
+        @param x_scale Ratio of the horizontal angle the turret turns to the angle seen by the camera
+        @param y_scale Ratio of the vertical angle the turret turns to the angle seen by the camera
+        @param x_tick_ratio Horizontal axis encoder ticks per degree
+        @param y_tick_ratio Vertical axis encoder ticks per degree
+        '''
+        ## Width of the image in pixels
+        self.width = width
+        ## Height of the image in pixels
+        self.height = height
+        ## Horizontal axis encoder ticks per degree
+        self.x_tick_ratio = x_tick_ratio
+        ## Vertical axis encoder ticks per degree
+        self.y_tick_ratio = y_tick_ratio
+        ## Turret angle in degrees at each pixel column edge, from 0 to width
+        self.x_angles = self._build_table(width, x_fov, distortion, x_offset, x_scale)
+        ## Turret angle in degrees at each pixel row edge, from 0 to height
+        self.y_angles = self._build_table(height, y_fov, distortion, y_offset, y_scale)
+
+    @staticmethod
+    def _build_table(size, fov, distortion, offset, scale):
+        '''!
+        Works out the turret angle of every pixel edge along one axis.
+        @param size Integer number of pixels along the axis
+        @param fov Field of view along the axis in degrees
+        @param distortion Radial distortion coefficient k1
+        @param offset Angle added to every angle, in degrees
+        @param scale Ratio of the turret angle to the camera angle
+        @returns An array of size + 1 angles in degrees
+        '''
+        # Distance from the image centre to the edge in units of the focal length
+        edge = tan(radians(fov / 2))
+        table = array('f', bytes(4 * (size + 1)))
+        for pos in range(size + 1):
+            r = (2 * pos / size - 1) * edge
+            r *= 1 + distortion * r * r
+            table[pos] = (degrees(atan(r)) + offset) * scale
+        return table
+
+    @staticmethod
+    def _lookup(table, pos):
+        '''!
+        Interpolates an angle table at a position.
+        @param table Angle table with one entry per pixel edge
+        @param pos Position along the axis in pixels, clamped to the image
+        @returns The interpolated angle in degrees
+        '''
+        size = len(table) - 1
+        if pos < 0:
+            pos = 0
+        elif pos > size:
+            pos = size
+        idx = int(pos)
+        if idx == size:
+            idx -= 1
+        lower = table[idx]
+        return lower + (table[idx + 1] - lower) * (pos - idx)
+
+    def angles(self, x, y):
+        '''!
+        Converts an image position into the angles the turret must turn to point at it.
+        @param x Horizontal position in pixels, such as a target centroid
+        @param y Vertical position in pixels
+        @returns A tuple of the horizontal and vertical angle in degrees
+        '''
+        return self._lookup(self.x_angles, x), self._lookup(self.y_angles, y)
+
+    def to_ticks(self, x_angle, y_angle):
+        '''!
+        Converts turret angles into encoder ticks.
+        @param x_angle Horizontal angle in degrees
+        @param y_angle Vertical angle in degrees
+        @returns A tuple of the horizontal and vertical encoder ticks
+        '''
+        return x_angle * self.x_tick_ratio, y_angle * self.y_tick_ratio
+
+    def to_degrees(self, x_ticks, y_ticks):
+        '''!
+        Converts encoder ticks into turret angles.
+        @param x_ticks Horizontal encoder ticks
+        @param y_ticks Vertical encoder ticks
+        @returns A tuple of the horizontal and vertical angle in degrees
+        '''
+        return x_ticks / self.x_tick_ratio, y_ticks / self.y_tick_ratio
@@ -7,17 +7,19 @@ This file contains a class that allows the user to instantiate a proportional co
 '''
 
 import utime
+from telemetry import TelemetryRecorder
 
 class cl_loop:
     '''!
     This class implements a proportional controller for an ME 405 kit.
     '''
 
-    def __init__(self, gain, setpoint):
+    def __init__(self, gain, setpoint, telemetry=None):
         '''!
         Creates a proportional controller with a gain and setpoint.
         @param gain Float variable representing the gain coefficient of the proportional control (Kp)
         @param setpoint Integer representing the desired motor position in encoder ticks
+        @param telemetry TelemetryRecorder which receives the time, setpoint, position and pwm of every run call, or None for a small one of its own
         '''
         
         # Class variables necessary for control
@@ -26,8 +28,8 @@ class cl_loop:
         ## Desired position (in encoder ticks)
         self.setpoint = setpoint
         # Class variables used for data plotting
-        ## Single list for both position and data (alternating positions)
-        self.pos_data = []                          
+        ## Fixed-size recorder of time, setpoint, position and pwm
+        self.telemetry = telemetry or TelemetryRecorder()
         ## Reference time to calculate time elapsed between encoder readings
         self.prev_time = utime.ticks_ms()           
         ## Time elapsed since beginning of step response test
@@ -41,21 +43,29 @@ class cl_loop:
         '''
 
         pwm = self.gain*(self.setpoint - output)                        # Generate pwm percentage
+        self._record(output, pwm)
+        return pwm
+
+    def _record(self, output, pwm):
+        '''!
+        Collects time, setpoint, position and pwm data for plotting
 
-        # Collect time and position data for plotting
+        @param output Integer representing current motor position in encoder ticks
+        @param pwm Pwm percentage returned by the run call
+        '''
         interval = utime.ticks_diff(utime.ticks_ms(), self.prev_time)   # Calculate time interval
         self.time += interval                                           # Add to current time
         self.prev_time = utime.ticks_ms()                               # Set reference time for next run call
-        self.pos_data.append(self.time)                                 # Append time and data for transmission back to PC
-        self.pos_data.append(output)
-        return pwm
+        self.telemetry.record(self.time, self.setpoint, output, pwm)    # Store in the recorder for transmission back to PC
 
     def set_setpoint(self, setpoint):
         '''!
-        Sets the setpoint of the controller
+        Sets the setpoint of the controller, and triggers the telemetry capture if it changed
 
         @param setpoint Integer representing desired final motor position in encoder ticks
         '''
+        if setpoint != self.setpoint:
+            self.telemetry.trigger()                                    # Starts the capture if the recorder is armed
         self.setpoint = setpoint
 
     def set_kp(self, gain):
@@ -69,7 +79,179 @@ class cl_loop:
 
     def get_pos_data(self):
         '''!
-        Returns the list of time and data (all in one list to make UART transmission easier)
+        Returns the list of time and data (all in one list to make UART transmission easier).
+        This builds a new list from the recorder; use telemetry.dump() to send everything at once without one.
         '''
 
-        return self.pos_data
\ No newline at end of file
+        pos_data = []
+        for time, position in zip(self.telemetry.samples('time'), self.telemetry.samples('position')):
+            pos_data.append(time)
+            pos_data.append(position)
+        return pos_data
+
+
+class pid_loop(cl_loop):
+    '''!
+    This class implements a PID controller for an ME 405 kit. The integral and derivative use the
+    measured time between run calls. The derivative acts on the measured position rather than the
+    error, so a new setpoint doesn't kick the motor, and is low-pass filtered against encoder
+    quantisation. The integral stops growing while the output is saturated in the direction that
+    would grow it (clamping anti-windup). A feed-forward adds a term for a desired velocity and a
+    constant push against static friction. The time from the start of a move until the position
+    stays within a tolerance is measured, so callers can wait exactly as long as a move takes. A
+    move starts with each new setpoint, or explicitly with start_move() when a move is made of
+    several setpoints, such as aiming at a target that is still being tracked.
+    '''
+
+    def __init__(self, gain, ki, kd, setpoint, limit=100, d_filter=10, kv=0, friction=0,
+                 tolerance=1, settle_window=50, telemetry=None):
+        '''!
+        Creates a PID controller.
+        @param gain Float proportional gain (Kp), in pwm percent per tick
+        @param ki Float integral gain, in pwm percent per tick second
+        @param kd Float derivative gain, in pwm percent per tick per second
+        @param setpoint Integer representing the desired motor position in encoder ticks
+        @param limit Largest pwm percentage the motor driver accepts; the output is saturated to plus or minus this
+        @param d_filter Time constant of the derivative low-pass filter in milliseconds, or 0 for none
+        @param kv Float velocity feed-forward gain, in pwm percent per tick per second of set_velocity()
+        @param friction Float pwm percentage added in the direction of the error while outside the tolerance, to overcome static friction
+        @param tolerance Integer error in encoder ticks within which the motor counts as at the setpoint
+        @param settle_window Integer time in milliseconds the motor must stay within tolerance to count as settled
+        @param telemetry TelemetryRecorder which receives the time, setpoint, position and pwm of every run call, or None for a small one of its own
+        '''
+        super().__init__(gain, setpoint, telemetry)
+        ## Integral gain of the system
+        self.ki = ki
+        ## Derivative gain of the system
+        self.kd = kd
+        ## Largest pwm percentage magnitude
+        self.limit = limit
+        ## Derivative filter time constant in seconds
+        self.d_filter = d_filter / 1000
+        ## Velocity feed-forward gain
+        self.kv = kv
+        ## Static friction feed-forward in pwm percent
+        self.friction = friction
+        ## Error in encoder ticks within which the motor counts as at the setpoint
+        self.tolerance = tolerance
+        ## Time in milliseconds the motor must stay within tolerance to count as settled
+        self.settle_window = settle_window
+        ## Desired velocity in ticks per second, for the feed-forward
+        self.velocity = 0
+        ## Time in milliseconds from the start of the last move until the motor settled, or None while moving
+        self.settle_time = None
+        ## Accumulated integral term in pwm percent
+        self.integral = 0
+        ## Filtered position derivative in ticks per second
+        self.rate = 0
+        self._last_us = None
+        self._last_output = 0
+        self._move_start = utime.ticks_ms()
+        self._inside_since = None
+        self._timing_move = False
+
+    def run(self, output):
+        '''!
+        Evaluates the PID terms for the current motor position, and returns a pwm percentage
+
+        @param output Integer representing current motor position in encoder ticks
+        '''
+        now = utime.ticks_us()
+        error = self.setpoint - output
+        dt = utime.ticks_diff(now, self._last_us) / 1_000_000 if self._last_us is not None else 0
+        self._last_us = now
+
+        # Derivative on measurement, low-pass filtered
+        if dt > 0:
+            raw_rate = (output - self._last_output) / dt
+            self.rate += (raw_rate - self.rate) * dt / (self.d_filter + dt)
+        self._last_output = output
+
+        pwm = self.gain * error + self.integral - self.kd * self.rate + self.kv * self.velocity
+        if error > self.tolerance:
+            pwm += self.friction
+        elif error < -self.tolerance:
+            pwm -= self.friction
+
+        # Saturate, and only integrate when that doesn't push further into saturation
+        if pwm > self.limit:
+            pwm = self.limit
+            saturated = 1
+        elif pwm < -self.limit:
+            pwm = -self.limit
+            saturated = -1
+        else:
+            saturated = 0
+        if dt > 0 and not (saturated > 0 and error > 0) and not (saturated < 0 and error < 0):
+            self.integral += self.ki * error * dt
+            if self.integral > self.limit:
+                self.integral = self.limit
+            elif self.integral < -self.limit:
+                self.integral = -self.limit
+
+        self._check_settled(error)
+        self._record(output, pwm)
+        return pwm
+
+    def _check_settled(self, error):
+        '''!
+        Updates the settle time from the current error.
+
+        @param error Integer error in encoder ticks
+        '''
+        if -self.tolerance <= error <= self.tolerance:
+            now = utime.ticks_ms()
+            if self._inside_since is None:
+                self._inside_since = now
+            elif self.settle_time is None and utime.ticks_diff(now, self._inside_since) >= self.settle_window:
+                self.settle_time = utime.ticks_diff(self._inside_since, self._move_start)
+                self._timing_move = False
+        else:
+            self._inside_since = None
+
+    def set_setpoint(self, setpoint):
+        '''!
+        Sets the setpoint of the controller. A change larger than the tolerance means the motor
+        must settle again, and starts timing a new move unless one started with start_move() is
+        still under way (smaller corrections, such as from tracking a target, continue the move)
+
+        @param setpoint Integer representing desired final motor position in encoder ticks
+        '''
+        if abs(setpoint - self.setpoint) > self.tolerance:
+            if not self._timing_move:
+                self._move_start = utime.ticks_ms()
+            self._inside_since = None
+            self.settle_time = None
+            self.telemetry.trigger()                                    # Starts the capture if the recorder is armed
+        self.setpoint = setpoint
+
+    def start_move(self):
+        '''!
+        Starts timing a move now, which lasts through any setpoint changes until the motor settles
+        '''
+        self._move_start = utime.ticks_ms()
+        self._inside_since = None
+        self.settle_time = None
+        self._timing_move = True
+
+    def set_velocity(self, velocity):
+        '''!
+        Sets the desired velocity used by the feed-forward, such as the speed of a tracked target
+
+        @param velocity Float desired velocity in encoder ticks per second
+        '''
+        self.velocity = velocity
+
+    def settled(self):
+        '''!
+        Returns whether the motor has stayed within tolerance of the setpoint for the settle window
+        '''
+        return self.settle_time is not None
+
+    def reset(self):
+        '''!
+        Clears the integral and derivative state, such as after the motor has been disabled
+        '''
+        self.integral = 0
+        self.rate = 0
+        self._last_us = None
@@ -0,0 +1,164 @@
+'''!
+@file control_scheduler.py
+This file contains a class that runs the motor control loops at a fixed rate from a hardware
+timer, so the motors stay under control while the main program waits on the camera or the shot.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+import micropython
+import pyb
+import utime
+from array import array
+
+# Lets an exception raised in the timer interrupt be reported
+micropython.alloc_emergency_exception_buf(100)
+
+class ControlScheduler:
+    '''!
+    This class implements a fixed-rate control loop. A pyb.Timer interrupt fires at the control
+    rate and only timestamps the tick and schedules the control step with micropython.schedule(),
+    since an interrupt can't allocate memory and the controllers work in floats. The step then
+    runs as soon as the running Python code allows (between bytecodes, or during a sleep): it
+    copies each axis's setpoint and velocity from preallocated buffers into its controller, reads
+    the encoder and sets the motor duty cycle. If a tick fires while the last step still hasn't
+    run, the tick is dropped and counted as an overrun. The step's start time is compared with
+    the nominal period to measure jitter.
+    '''
+
+    def __init__(self, timer, freq, axes):
+        '''!
+        Creates a stopped control scheduler.
+        @param timer Number of a free timer (e.g. 6 for TIM6)
+        @param freq Integer control rate in Hz
+        @param axes Sequence of (MotorDriver, EncoderReader, pid_loop) tuples, one per driven axis
+        '''
+        ## Number of the timer used
+        self.timer = timer
+        ## Control rate in Hz
+        self.freq = freq
+        ## Tuple of (MotorDriver, EncoderReader, pid_loop) tuples
+        self.axes = tuple(axes)
+        ## Setpoint of each axis in encoder ticks, read by the control step
+        self.setpoints = array('f', bytes(4 * len(self.axes)))
+        ## Desired velocity of each axis in encoder ticks per second, read by the control step
+        self.velocities = array('f', bytes(4 * len(self.axes)))
+        ## Number of control steps run
+        self.runs = 0
+        ## Number of ticks dropped because the last step hadn't run yet
+        self.overruns = 0
+        ## Largest difference from the nominal period between two steps, in microseconds
+        self.max_jitter = 0
+        ## Largest delay from a tick to its step starting, in microseconds
+        self.max_latency = 0
+        ## Longest step, in microseconds
+        self.max_duration = 0
+        self._period = 1_000_000 // freq
+        self._tim = None
+        self._pending = False
+        self._tick_time = 0
+        self._last_start = None
+        # Bound once, as creating a bound method in the interrupt would allocate
+        self._step_ref = self._step
+
+    def set_target(self, axis, setpoint, velocity=0):
+        '''!
+        Sets the setpoint and desired velocity of an axis, taken by the next control step.
+        @param axis Integer index of the axis in axes
+        @param setpoint Desired position in encoder ticks
+        @param velocity Desired velocity in encoder ticks per second, for the controller's feed-forward
+        '''
+        self.setpoints[axis] = setpoint
+        self.velocities[axis] = velocity
+
+    def start(self):
+        '''!
+        Starts the timer, taking the current controller setpoints as the targets.
+        '''
+        for axis, (motor, encoder, controller) in enumerate(self.axes):
+            self.setpoints[axis] = controller.setpoint
+        self._pending = False
+        self._last_start = None
+        self._tim = pyb.Timer(self.timer, freq=self.freq, callback=self._tick)
+
+    def stop(self):
+        '''!
+        Stops the timer. The motors keep their last duty cycle, so disable them as well.
+        '''
+        if self._tim is not None:
+            self._tim.deinit()
+            self._tim = None
+
+    def reset_stats(self):
+        '''!
+        Clears the run, overrun and timing counts.
+        '''
+        self.runs = 0
+        self.overruns = 0
+        self.max_jitter = 0
+        self.max_latency = 0
+        self.max_duration = 0
+        self._last_start = None
+
+    def report(self):
+        '''!
+        Describes the timing of the control loop.
+        @returns A string with the run and overrun counts and the largest jitter, latency and step time
+        '''
+        return (f"Control loop: {self.runs} runs, {self.overruns} overruns, jitter {self.max_jitter} us, "
+                f"latency {self.max_latency} us, step {self.max_duration} us ({self._period} us period)")
+
+    def _tick(self, tim):
+        '''!
+        Timer interrupt callback, which schedules the control step. Doesn't allocate memory.
+        @param tim Timer which fired
+        '''
+        if self._pending:
+            self.overruns += 1
+            return
+        self._tick_time = utime.ticks_us()
+        self._pending = True
+        try:
+            micropython.schedule(self._step_ref, 0)
+        except RuntimeError:
+            # The schedule queue is full
+            self._pending = False
+            self.overruns += 1
+
+    def _step(self, _):
+        '''!
+        Runs every controller once and measures the timing. If a controller, encoder or motor
+        raises, the timer is stopped and the motors disabled before the exception is passed on,
+        so the motors aren't left running at their last duty cycle.
+        @param _ Unused argument passed by micropython.schedule()
+        '''
+        try:
+            start = utime.ticks_us()
+            latency = utime.ticks_diff(start, self._tick_time)
+            if latency > self.max_latency:
+                self.max_latency = latency
+            if self._last_start is not None:
+                jitter = abs(utime.ticks_diff(start, self._last_start) - self._period)
+                if jitter > self.max_jitter:
+                    self.max_jitter = jitter
+            self._last_start = start
+
+            setpoints = self.setpoints
+            velocities = self.velocities
+            for axis, (motor, encoder, controller) in enumerate(self.axes):
+                controller.set_setpoint(setpoints[axis])
+                controller.set_velocity(velocities[axis])
+                motor.set_duty_cycle(controller.run(encoder.read()))
+
+            duration = utime.ticks_diff(utime.ticks_us(), start)
+            if duration > self.max_duration:
+                self.max_duration = duration
+            self.runs += 1
+        except Exception:
+            self.stop()
+            for motor, encoder, controller in self.axes:
+                motor.disable_motor()
+            raise
+        finally:
+            self._pending = False
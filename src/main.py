@@ -11,8 +11,19 @@ import servo_driver
 import motor_driver
 import encoder_reader
 import closedloopcontrol
+import telemetry
+import control_scheduler
+import task_scheduler
 # Hardware imports
 import mlx_cam
+import blob_detector
+import packed_mask
+import moments
+import background
+import tracker
+import camera_model
+import turret_pose
+import pyramid
 from pyb import Pin
 from machine import I2C
 # Utility imports
@@ -25,18 +36,58 @@ from array import array
 # MEC1 (horizontal aiming axis)
 MEC1_tickratio = (194000/180)           # Horizontal axis ticks to degrees ratio
 MEC1_gain = 0.7                         # Horizontal axis gain
+MEC1_ki = 0.1                           # Horizontal axis integral gain (per tick second)
+MEC1_kd = 0.001                         # Horizontal axis derivative gain (per tick per second)
+MEC1_friction = 0                       # Horizontal axis static friction feed-forward (pwm %)
+MEC1_tolerance = 100                    # Horizontal axis error counted as on target, in ticks (about 0.1 degree)
+MEC1_travel_limit = 270 * MEC1_tickratio    # Furthest the horizontal axis may turn from where it started, in ticks
 # MEC2 (vertical aiming axis)
 MEC2_tickratio = (2300/100)             # Vertical axis ticks to degrees ratio
 MEC2_gain = 0.7                         # Vertical axis gain
+MEC2_ki = 1.0                           # Vertical axis integral gain (per tick second)
+MEC2_kd = 0.02                          # Vertical axis derivative gain (per tick per second)
+MEC2_friction = 0                       # Vertical axis static friction feed-forward (pwm %)
+MEC2_tolerance = 2                      # Vertical axis error counted as on target, in ticks
+# Telemetry
+telemetry_capacity = 200                # Controller samples kept per axis
+telemetry_decimation = 10               # Keep one controller sample in this many (one per 10 ms)
+telemetry_pre_trigger = 20              # Samples kept from before the aiming move starts
+telemetry_file = 'aim_telemetry.bin'    # File the aiming move of the horizontal axis is saved to
+# Control loop
+control_timer = 6                       # Timer which runs the control loop (not used by the motors, encoders or servo)
+control_rate = 1000                     # Control loop rate in Hz
+# Firing
+spin_up_time = 2000                     # Time for the flywheels to get to speed, in ms
+plunger_step = 200                      # Time the plunger holds each position, in ms
+plunger_sequence = (-100, 20, -100, 20, -100)   # Plunger positions in turn (pushes twice more if the dart sticks)
+# Tasks
+camera_period = 2                       # Time between checks for a new subpage, in ms
+control_period = 10                     # Time between passing setpoints to the control loop, in ms
+fire_period = 10                        # Time between steps of the firing sequence, in ms
+safety_period = 50                      # Time between safety checks, in ms
+camera_timeout = 500                    # Longest time without a subpage before stopping, in ms
+use_asyncio = False                     # Run the duel with the asyncio runtime instead of the tasks and control timer
+async_control_period = 5                # Time between controller runs with the asyncio runtime, in ms
 # MLX Camera
 horiz_correction = 0                    # Angle correction for horizontal axis
 vert_correction = 15                    # Angle correction for vertical axis
 x_fov = 55                              # Camera FOV in x direction
 y_fov = 35                              # Camera FOV in y direction
-mask_threshold = 75                     # Minimum "heat" value to be seen as target pixel
+lens_distortion = 0                     # Radial distortion coefficient of the camera lens (negative for barrel)
+mask_threshold = 75                     # Minimum "heat" value to be seen as target pixel until the background is learned
+background_sigma = 3                    # Standard deviations above the learned background for a pixel to be a target pixel
+background_frames = 8                   # Images to learn before detecting targets against the background
+background_relearns = 2                 # Times to learn the background again if no target stands out from it
+roi_margin = 3                          # Rows read above and below a found target in the next image
+search_contrast = 8                     # How far above the image average (on the 0-99 heat scale) the hottest 4x4 cell must be to look closer
+track_updates = 8                       # Aim updates (two per camera image) against the learned background used to measure the target's motion
+adjust_timeout = 500                    # Longest time to wait for the turret to settle on the target, in ms
+shot_lead = spin_up_time + plunger_step # Time from the turret settling to the dart leaving, in ms (spin up, first push)
+min_target_area = 2                     # Minimum number of connected target pixels to be seen as a target
 width = 32                              # Camera resolution width
 length = 24                             # Camera resolution length
 angle_prescale = 0.5                    # Ratio of the angle to target from camera and angle to target from turret
+camera_profile = 'low_latency'          # Camera configuration (64 Hz refresh, 18 bit ADC, chess pattern)
 
 # -----------------------------------
 # INITIALIZATION
@@ -53,24 +104,55 @@ trigger_pin = Pin('D12', Pin.OUT_PP)
 # Initialize motor/encoder/controller 1
 M1 = motor_driver.MotorDriver('A10', 'B4', 'B5', 3, 1, 2)
 E1 = encoder_reader.EncoderReader('C6', 'C7', 8, 1, 2)
-C1 = closedloopcontrol.cl_loop(MEC1_gain, 0)
+C1 = closedloopcontrol.pid_loop(MEC1_gain, MEC1_ki, MEC1_kd, 0, friction=MEC1_friction, tolerance=MEC1_tolerance,
+                                telemetry=telemetry.TelemetryRecorder(telemetry_capacity, telemetry_decimation))
 M1.enable_motor()
 
 # Initialize motor/encoder/controller 2
 M2 = motor_driver.MotorDriver('C1', 'A0', 'A1', 5, 1, 2)
 E2 = encoder_reader.EncoderReader('B6', 'B7', 4, 1, 2)
-C2 = closedloopcontrol.cl_loop(MEC2_gain, 0)
+C2 = closedloopcontrol.pid_loop(MEC2_gain, MEC2_ki, MEC2_kd, 0, friction=MEC2_friction, tolerance=MEC2_tolerance,
+                                telemetry=telemetry.TelemetryRecorder(telemetry_capacity, telemetry_decimation))
 M2.enable_motor()
 
+# Runs the controllers from a timer, so the motors stay controlled while the camera or the shot
+# keeps the main loop waiting (the vertical axis isn't driven yet; add (M2, E2, C2) to drive it)
+control = control_scheduler.ControlScheduler(control_timer, control_rate, ((M1, E1, C1),))
+
 # MLX IR CAMERA
 # Configure I2C bus
 i2c_bus = I2C(1)
 i2c_address = 0x33
-# Create the camera object and set it up in default mode
-camera = mlx_cam.MLX_Cam(i2c_bus)
-# Set refresh rate to 64 Hz
-ctrl_reg_val = 0b0001101110000001
-i2c_bus.writeto_mem(i2c_address, 0x800D, ctrl_reg_val.to_bytes(16, 'big'))
+# Create the camera object and set the refresh rate to 64 Hz
+camera = mlx_cam.MLX_Cam(i2c_bus, i2c_address)
+frame_period = camera.set_profile(camera_profile)
+print(f"Camera frame period: {frame_period:.1f} ms")
+
+# Preallocated buffers for the pixel heat and the target mask (one bit per pixel)
+pixels = array('H', bytes(2*length*width))
+mask = packed_mask.PackedMask(width, length)
+# Finds the separate targets in the mask
+detector = blob_detector.BlobDetector(width, length)
+# Measures the heat-weighted centre of the chosen target
+target_moments = moments.Moments(width, length)
+# Learns what each pixel normally sees; mirrored to match get_normalized()
+scene = background.BackgroundModel(width, length, k=background_sigma, warmup=background_frames, mirror=True)
+# Rows of the camera image to read next, or None to read the whole image while looking for a target
+roi = None
+# Whether the mask was last set by the warm-up threshold rather than the background model
+threshold_mask = False
+# Follows the target's motion so the turret can aim where it will be when the dart leaves
+target_tracker = tracker.TargetTracker()
+# Converts image positions into turret angles and angles into encoder ticks
+lens = camera_model.CameraModel(width, length, x_fov, y_fov, lens_distortion,
+                                horiz_correction, vert_correction, angle_prescale, 1,
+                                MEC1_tickratio, MEC2_tickratio)
+# Records the encoder positions when each subpage is ready, and the time from the middle of a
+# subpage's exposure to it being ready (half a subpage, a quarter of the frame period), in us
+pose = turret_pose.TurretPose(E1, E2, shared=(E1,))
+exposure_offset = int(frame_period * 250)
+# Binned copies of the raw image for a quick search before looking at single pixels
+coarse = pyramid.ImagePyramid(width, length, mirror=True)
 
 # TURRET SAFE
 servo.set_position(20)
@@ -82,120 +164,135 @@ trigger_pin.low()
 # All the things the turret needs to do
 # -----------------------------------
 
-# Run the motor to the desired setpoint
-def run_motor(motor, encoder, controller):
-    motor_pwm = controller.run(encoder.read())
-    motor.set_duty_cycle(motor_pwm)
-    return
-        
-def aim(camera):
-    # Get raw image
-    image = camera.get_image()
-
-    # Get pixel heat as a number from 0 to 99
-    pixels = array('I')
-    for line in camera.get_csv(image, limits=(0, 99)):
-        #print(line)
-        pixel_row = array('I', [int(str_val) for str_val in line.split(',')])
-        pixels += pixel_row
-     
-    # Mask the pixels, discard 4 pixels on the left and right sides due to noise
-    for pixel in range(length*width):
-        if pixels[pixel] > mask_threshold:
-            pixels[pixel] = 1
+def aim(image, subpage):
+    global roi, threshold_mask
+
+    # The image holds a new subpage (half of the pixels) of the raw image, only the rows around the
+    # target if one was found last time. The mask and heat of the other half are kept, so each
+    # subpage gives a new aimpoint. The encoders were read the moment the subpage was ready.
+    capture_time = time.ticks_add(pose.time_ms, -(exposure_offset // 1000))
+
+    if scene.ready:
+        # Mask the pixels which are hotter than the learned background; their heat is how far above it
+        # they are. Nothing standing out means there is no target, however warm the rest of the view.
+        # The background only matches the image while the turret holds still, so while it moves the
+        # model is frozen and only compared with
+        if threshold_mask:
+            # The other subpage's mask bits are from the warm-up threshold, not the background
+            mask.clear()
+            threshold_mask = False
+        scene.update(image.pix, mask, pixels, rows=roi, subpage=subpage)
+        heat_offset = 0
+    else:
+        # Learn the background from whole images, and meanwhile get pixel heat as a number from 0 to 99
+        # and mask the hottest
+        scene.update(image.pix, subpage=subpage)
+        heat_offset = mask_threshold
+        threshold_mask = True
+        # Find the hottest 4x4 cell first and only look at the pixels around it if it stands out from
+        # the image, so images without a target stop after one cheap pass. The pass also finds the
+        # image's range, so only the pixels around the cell are scaled
+        coarse.build(image.pix)
+        col, row, hottest = coarse.peak()
+        span = (coarse.max - coarse.min) or 1
+        if (hottest - coarse.mean()) * 99 >= search_contrast * 16 * span:
+            window = coarse.window(2, col, row, 4)
+            camera.get_normalized(image, pixels, limits=(0, 99), window=window,
+                                  data_range=(coarse.min, coarse.max))
+            mask.threshold(pixels, mask_threshold, rows=window[2:])
         else:
-            pixels[pixel] = 0
-
-    # Discard outlier pixels
-    for pixel in range(length*width):
-        if pixels[pixel] == 1:
-            neighbors = []
-            try:
-                nb1 = pixels[pixel-width-1]
-                neighbors.append(nb1)
-            except IndexError:
-                pass
-            try:
-                nb2 = pixels[pixel-width]
-                neighbors.append(nb2)
-            except IndexError:
-                pass
-            try:
-                nb3 = pixels[pixel-width+1]
-                neighbors.append(nb3)
-            except IndexError:
-                pass
-            try:
-                nb4 = pixels[pixel-1]
-                neighbors.append(nb4)
-            except IndexError:
-                pass
-            try:
-                nb6 = pixels[pixel+1]
-                neighbors.append(nb6)
-            except IndexError:
-                pass
-            try:
-                nb7 = pixels[pixel+width-1]
-                neighbors.append(nb7)
-            except IndexError:
-                pass
-            try:
-                nb8 = pixels[pixel+width]
-                neighbors.append(nb8)
-            except IndexError:
-                pass
-            try:
-                nb9 = pixels[pixel+width+1]
-                neighbors.append(nb9)
-            except IndexError:
-                pass
-            if 1 not in neighbors:
-                pixels[pixel] = 0
-
-    # Compute center of mass (aimpoint)
-    # Y coordinate
-    mask_sum_y = 0
-    wtd_sum_y = 0
-    for row in range(length):
-        mask_sum = sum(pixels[row*width : (row+1)*width-1])
-        mask_sum_y += mask_sum
-        wtd_sum_y += mask_sum * (row + 0.5)
-    try:
-        com_y = wtd_sum_y / mask_sum_y
-    except ZeroDivisionError:
-        com_y = 11.5
+            mask.clear()
+
+    # Discard single hot pixels, which are noise
+    mask.remove_isolated()
 
-    # X coordinate
-    mask_sum_x = 0
-    wtd_sum_x = 0
-    for col in range(width):
-        mask_sum = 0
-        for row in range(length):
-            mask_sum += pixels[row * width + col]
-        mask_sum_x += mask_sum 
-        wtd_sum_x += mask_sum * (col + 0.5)
-    try:
-        com_x = wtd_sum_x / mask_sum_x
-    except ZeroDivisionError:
+    # Find the separate targets, ignoring specks smaller than the minimum area
+    blobs = detector.detect(mask, pixels, min_area=min_target_area)
+
+    # Aim at the heat-weighted centre of the hottest target, or straight ahead if there is none.
+    # Weighing by heat above the threshold pulls the aimpoint towards the warmest part of the target.
+    found = bool(blobs)
+    if found:
+        blob = blobs[0]
+        target_moments.reset()
+        target_moments.accumulate(pixels, detector.labels, blob.label,
+                                  (blob.x_min, blob.x_max, blob.y_min, blob.y_max), heat_offset)
+        com_x, com_y = target_moments.centroid()
+        # Read just the rows around the target next time, once the background has been learned from
+        # whole images
+        if scene.ready:
+            roi = (max(blob.y_min - roi_margin, 0), min(blob.y_max + roi_margin, length - 1))
+    else:
         com_x = 15.5
+        com_y = 11.5
+        # Lost the target, so search the whole image again
+        roi = None
 
-    # Defining the range of degrees from center
-    x_min = -(x_fov/2)
-    x_max = (x_fov/2)
-    y_min = -(y_fov/2)
-    y_max = (y_fov/2)
+    # Find the target angles of both axes, in degrees, from the turret's position in the middle of the
+    # subpage's exposure and the COM's angle from it
+    x_turret, y_turret = lens.to_degrees(*pose.at(time.ticks_add(pose.time, -exposure_offset)))
+    x_adj, y_adj = lens.angles(com_x, com_y)
+    return found, x_turret - x_adj, y_turret - y_adj, capture_time
 
-    # Mapping the COM to the FOV
-    x_adj = (com_x) * (x_max - x_min) / (width) + x_min
-    y_adj = (com_y) * (y_max - y_min) / (length) + y_min
 
-    # Create setpoints
-    x_adj += horiz_correction
-    y_adj += vert_correction
-    new_setpoint_x = E1.read() - (x_adj * MEC1_tickratio * angle_prescale)
-    new_setpoint_y = E2.read() - (y_adj * MEC2_tickratio)
-    return new_setpoint_x, new_setpoint_y
+def make_safe():
+    # Disable everything
+    servo.set_position(20)
+    trigger_pin.low()
+    control.stop()
+    M1.disable_motor()
+    M2.disable_motor()
+
+
+# Measure the target in the next subpage, for the asyncio runtime
+async def measure():
+    image, subpage = await camera.next_frame(rows=roi, on_ready=pose.capture)
+    return aim(image, subpage)
+
+
+# The camera sees a new view, so learn its background from scratch, from whole images
+def new_view():
+    global roi
+    scene.reset()
+    scene.thaw()
+    roi = None
+
+
+# Shared between the tasks
+subpage_image = None                    # Newest subpage not yet aimed with, from the camera task
+subpage_number = None                   # Number (0 or 1) of that subpage
+last_subpage = time.ticks_ms()          # Time the camera task last got a subpage
+x_target_stpt = 0                       # Horizontal axis setpoint in ticks, from the aim task
+y_target_stpt = 0                       # Vertical axis setpoint in ticks
+x_target_vel = 0                        # Horizontal axis feed-forward velocity in ticks per second
+y_target_vel = 0                        # Vertical axis feed-forward velocity in ticks per second
+on_target = False                       # Whether the horizontal axis has settled on its setpoint, from the control task
+fire_request = False                    # Set by the aim task to start the shot
+fire_done = False                       # Set by the fire task once the shot is over
+
+
+# Read each subpage as soon as the camera has it, without waiting
+def camera_task():
+    global subpage_image, subpage_number, last_subpage
+    while True:
+        image, subpage = camera.get_subpage(rows=roi, on_ready=pose.capture, wait=False)
+        if image is not None:
+            subpage_image = image
+            subpage_number = subpage
+            last_subpage = time.ticks_ms()
+        yield subpage
+
+
+# Pass the setpoints to the control loop, which runs from its timer, and watch it settle
+def control_task():
+    global on_target
+    while True:
+        # The controller's setpoint must be the current one, or it has only settled on an old target
+        on_target = C1.settled() and abs(C1.setpoint - x_target_stpt) <= MEC1_tolerance
+        control.set_target(0, x_target_stpt, x_target_vel)
+        C2.set_setpoint(y_target_stpt)
+        C2.set_velocity(y_target_vel)
+        yield on_target
 
 
 # ------------------------------------
@@ -210,78 +307,208 @@ S3_ADJUST = 3
 S4_SHOOT = 4
 S5_SAFE = 5
 
+F0_IDLE = 0
+F1_SPIN_UP = 1
+F2_PUSH = 2
+F3_DONE = 3
+
+
+# Turn around, find and track the target, and aim the turret at it until it has been shot
+def aim_task():
+    global subpage_image, x_target_stpt, y_target_stpt, x_target_vel, y_target_vel, on_target, fire_request
+    state = S0_INIT
+    while True:
+        # Measure the target in each new subpage once the turret has turned around
+        measured = found = learned = False
+        if state >= S2_AIM and subpage_image is not None:
+            # Whether this subpage is compared with a learned background
+            learned = scene.ready
+            found, x_angle, y_angle, capture_time = aim(subpage_image, subpage_number)
+            subpage_image = None
+            measured = True
+            if found:
+                target_tracker.update(x_angle, y_angle, capture_time)
+
+        if state == S0_INIT:
+            # Start the turret, begin a 5 second timer
+            time_start180 = time.ticks_ms()
+            control.start()
+            state = S1_TURN180
+
+        elif state == S1_TURN180:
+            # Turn the turret 180 degrees
+            x_target_stpt = 180 * MEC1_tickratio
+            if time.ticks_diff(time.ticks_ms(), time_start180) > 5000:
+                # The camera sees a new view, so learn its background from scratch
+                new_view()
+                target_tracker.reset()
+                subpage_image = None
+                aim_updates = 0
+                aim_finds = 0
+                relearns = 0
+                state = S2_AIM
+
+        elif state == S2_AIM:
+            # Learn the background, then measure the target over a few subpages compared with it
+            if measured and learned:
+                aim_updates += 1
+                if found:
+                    aim_finds += 1
+            if aim_updates >= track_updates and not aim_finds and relearns < background_relearns:
+                # A target which stood still while the background was learned is part of it, so learn
+                # the view again; the target stands out once it has moved. The tracker keeps what the
+                # warm-up saw, which is aimed at if it never does
+                new_view()
+                aim_updates = 0
+                relearns += 1
+            elif aim_updates >= track_updates:
+                # Aim where the target will be when the dart leaves
+                adjust_time = time.ticks_ms()
+                fire_time = time.ticks_add(adjust_time, adjust_timeout + shot_lead)
+                if target_tracker.count:
+                    x_angle, y_angle = target_tracker.predict(fire_time)
+                x_target_stpt, y_target_stpt = lens.to_ticks(x_angle, y_angle)
+                # Not on target until the control task has seen the new setpoints
+                on_target = False
+                # Don't learn the background while the turret moves
+                scene.freeze()
+                # Capture the aiming move, starting when the new setpoints are set, and time it from
+                # now through the tracking corrections that follow
+                C1.telemetry.arm(telemetry_pre_trigger)
+                C2.telemetry.arm(telemetry_pre_trigger)
+                C1.start_move()
+                C2.start_move()
+                state = S3_ADJUST
+
+        elif state == S3_ADJUST:
+            # Keep tracking while the turret moves; the encoder snapshots place each measurement
+            # at the turret's position when it was captured
+            if found:
+                # Fire as soon as the turret settles, and follow the target's speed meanwhile
+                fire_time = time.ticks_add(time.ticks_ms(), shot_lead)
+                x_target_stpt, y_target_stpt = lens.to_ticks(*target_tracker.predict(fire_time))
+                x_target_vel = target_tracker.vx * MEC1_tickratio
+                y_target_vel = target_tracker.vy * MEC2_tickratio
+            # Shoot once the horizontal axis has settled on the target (the vertical axis isn't driven yet)
+            adjusting = time.ticks_diff(time.ticks_ms(), adjust_time)
+            if on_target or adjusting > adjust_timeout:
+                print(f"Settle time: {C1.settle_time} ms (adjusted for {adjusting} ms)")
+                x_target_vel = y_target_vel = 0
+                fire_time = time.ticks_add(time.ticks_ms(), shot_lead)
+                fire_request = True
+                state = S4_SHOOT
+
+        elif state == S4_SHOOT:
+            # Keep aiming where the target will be when the dart leaves while the fire task
+            # spins up the flywheels and pushes the dart
+            if found:
+                x_target_stpt, y_target_stpt = lens.to_ticks(*target_tracker.predict(fire_time))
+            if fire_done:
+                state = S5_SAFE
+
+        else:
+            make_safe()
+            tasks.stop()
+
+        yield state
+
+
+# Spin up the flywheels and push the dart once the aim task asks for a shot
+def fire_task():
+    global fire_done
+    state = F0_IDLE
+    while True:
+        if state == F0_IDLE:
+            if fire_request:
+                # Spin up the flywheels, give them time to get to speed
+                trigger_pin.high()
+                step_time = time.ticks_ms()
+                state = F1_SPIN_UP
+
+        elif state == F1_SPIN_UP:
+            if time.ticks_diff(time.ticks_ms(), step_time) >= spin_up_time:
+                push = 0
+                servo.set_position(plunger_sequence[push])
+                step_time = time.ticks_ms()
+                state = F2_PUSH
+
+        elif state == F2_PUSH:
+            # Shoot once (sometimes the dart needs extra encouragement so the plunger pushes twice)
+            if time.ticks_diff(time.ticks_ms(), step_time) >= plunger_step:
+                push += 1
+                if push < len(plunger_sequence):
+                    servo.set_position(plunger_sequence[push])
+                    step_time = time.ticks_ms()
+                else:
+                    # Save the aiming move for plotting
+                    with open(telemetry_file, 'wb') as file:
+                        C1.telemetry.dump(file)
+                    print(control.report())
+                    fire_done = True
+                    state = F3_DONE
+
+        yield state
+
+
+# Stop everything if the control loop stalls, the turret turns too far or the camera goes quiet
+def safety_task():
+    last_runs = 0
+    while True:
+        fault = None
+        if last_runs and control.runs == last_runs:
+            fault = 'the control loop stalled'
+        elif abs(E1.position) > MEC1_travel_limit:
+            fault = 'the horizontal axis turned too far'
+        elif time.ticks_diff(time.ticks_ms(), last_subpage) > camera_timeout:
+            fault = 'the camera stopped sending images'
+        last_runs = control.runs
+        if fault is not None:
+            print(f"Safety stop: {fault}")
+            make_safe()
+            tasks.stop()
+        yield fault
+
+
 # ------------------------------------
 # ACTUAL PROGRAM
 # Pew pew
 # ------------------------------------
 
 if __name__ == '__main__':
-    
-    state = S0_INIT
-    #time.sleep(5)
 
-    while True:
+    if use_asyncio:
+        # The control loops, camera and firing sequence run as coroutines instead, both axes'
+        # controllers included (the vertical axis isn't driven yet); only this runtime needs asyncio
+        import uasyncio as asyncio
+        import turret_runtime
+        runtime = turret_runtime.TurretRuntime(measure, ((M1, E1, C1), (None, E2, C2)), servo, trigger_pin,
+                                               target_tracker, lens, 180, 5000, track_updates, adjust_timeout,
+                                               spin_up_time, plunger_step, plunger_sequence,
+                                               async_control_period, telemetry_pre_trigger,
+                                               on_turned=new_view, on_aim=scene.freeze,
+                                               ready=lambda: scene.ready, travel_limit=MEC1_travel_limit,
+                                               camera_timeout=camera_timeout, safety_period=safety_period,
+                                               relearns=background_relearns)
         try:
-            if state == S0_INIT:
-                # Start the turret, begin a 5 second timer
-                time_start180 = time.ticks_ms()
-                state = S1_TURN180
-                
-            elif state == S1_TURN180:
-                # Turn the turret 180 degrees
-                C1.set_setpoint(180 * MEC1_tickratio)
-                if time.ticks_diff(time.ticks_ms(), time_start180) > 5000:
-                    state = S2_AIM
-                
-            elif state == S2_AIM:
-                # Allow camera to refresh
-                time.sleep(1/32)
-                x_target_stpt, y_target_stpt = aim(camera)
-                state = S3_ADJUST
-                adjust_time = time.ticks_ms()
-            
-            elif state == S3_ADJUST:
-                # Change setpoints to aim turret at target                
-                C1.set_setpoint(x_target_stpt)
-                C2.set_setpoint(y_target_stpt)
-                if time.ticks_diff(time.ticks_ms(), adjust_time) > 500:
-                    state = S4_SHOOT
-                
-            elif state == S4_SHOOT:
-                
-                # Spin up the flywheels, wait for them to get to speed
-                trigger_pin.high()
-                time.sleep(2)
-                
-                # Shoot once (sometimes the dart needs extra encouragement so the plunger pushes twice)
-                servo.set_position(-100)
-                time.sleep(0.2)
-                servo.set_position(20)
-                time.sleep(0.2)
-                servo.set_position(-100)
-                time.sleep(0.2)
-                servo.set_position(20)
-                time.sleep(0.2)
-                servo.set_position(-100)
-                time.sleep(0.2)
-                
-                state = S5_SAFE
-            else:
-                # Disable everything
-                servo.set_position(20)
-                trigger_pin.low()
-                M1.disable_motor()
-                M2.disable_motor()
-
-            # Run motors
-            run_motor(M1, E1, C1)
-            #run_motor(M2, E2, C2)
-            time.sleep_ms(5)
+            asyncio.run(runtime.run())
+        except KeyboardInterrupt:
+            runtime.make_safe()
+        # Save the aiming move for plotting
+        with open(telemetry_file, 'wb') as file:
+            C1.telemetry.dump(file)
+
+    else:
+        # Each task runs at its own period (0 for every pass), highest priority first; a run
+        # finishing more than its deadline after the task was due counts as a miss
+        tasks = task_scheduler.TaskScheduler()
+        tasks.add(task_scheduler.Task(safety_task, 'safety', safety_period, safety_period, priority=4))
+        tasks.add(task_scheduler.Task(control_task, 'control', control_period, control_period, priority=3))
+        tasks.add(task_scheduler.Task(camera_task, 'camera', camera_period, int(frame_period / 2), priority=2))
+        tasks.add(task_scheduler.Task(fire_task, 'fire', fire_period, fire_period, priority=1))
+        tasks.add(task_scheduler.Task(aim_task, 'aim'))
+
+        try:
+            tasks.run()
         except KeyboardInterrupt:
-            # Disable everything
-            servo.set_position(20)
-            trigger_pin.low()
-            M1.disable_motor()
-            M2.disable_motor()
-            break
-        
+            make_safe()
+        print(tasks.report())
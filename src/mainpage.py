@@ -9,11 +9,24 @@
 The following files are included in this software:\n\n
 main.py: The main turret duel program\n
 mlx_cam.py: A driver for the MLX90640 camera\n
+blob_detector.py: A library containing a class that finds separate targets in a camera image\n
+packed_mask.py: A library containing a class for a one bit per pixel target mask\n
+moments.py: A library containing a class that measures a target's centre, size and orientation from its image moments\n
+background.py: A library containing a class that learns the background of the camera image so targets stand out\n
+tracker.py: A library containing a class that follows a moving target and predicts where it will be\n
+camera_model.py: A library containing a class that converts camera image positions into turret angles\n
+turret_pose.py: A library containing a class that records the turret's position when each camera image is captured\n
+pyramid.py: A library containing a class that bins a camera image into coarser images for a quick search\n
+telemetry.py: A library containing a class that records controller data into fixed-size buffers\n
+control_scheduler.py: A library containing a class that runs the motor control loops from a hardware timer\n
+task_scheduler.py: A library containing classes that run the turret's tasks cooperatively, each at its own period\n
+turret_runtime.py: A library containing a class that runs a turret duel as asyncio coroutines\n
+stand_in.py: A library containing stand-ins for the turret hardware, to run the asyncio runtime on a computer\n
 mlx90640: A folder containing dependencies required to run the MLX90640 camera driver\n
 motor_driver.py: A library containing a class for a motor driver\n
 servo_driver.py: A library containing a class for a servo driver\n
 encoder_reader.py: A library containing a class for an encoder reader\n
-closedloopcontrol.py: A library containing a class for a proportional system controller
+closedloopcontrol.py: A library containing classes for proportional and PID system controllers
 
 
 
@@ -3,14 +3,17 @@
 This file contains a class which controls an MLX90640 thermal infrared camera.
 
 RAW VERSION
-This version is a stripped down MLX90640 driver which produces only raw data,
-not calibrated data, in order to save memory.
+This version is a stripped down MLX90640 driver which produces raw data by
+default, in order to save memory. Calibrated data is available through a
+compact ProcessedImage when setup() is asked for it.
 """
 
 from gc import collect, mem_free
 from ucollections import namedtuple
+from utime import ticks_us, ticks_diff, sleep_us
 from mlx90640.regmap import (
     REGISTER_MAP,
+    VOLATILE_REGISTERS,
     EEPROM_MAP,
     RegisterMap,
     CameraInterface,
@@ -18,8 +21,15 @@ from mlx90640.regmap import (
     EEPROM_ADDRESS,
     EEPROM_SIZE,
 )
-# from mlx90640.calibration import CameraCalibration, TEMP_K
-from mlx90640.image import RawImage, Subpage, get_pattern_by_id
+from mlx90640.calibration import load_calibration, CACHE_PATH, TEMP_K, NUM_ROWS
+from mlx90640.image import (
+    RawImage,
+    ProcessedImage,
+    QuantizedImage,
+    Subpage,
+    ChessPattern,
+    get_pattern_by_id,
+)
 
 
 class CameraDetectError(Exception):
@@ -57,11 +67,40 @@ class RefreshRate:
         return value
 
 
+class CameraConfigError(Exception):
+    pass
+
+
+# refresh rate in Hz, ADC resolution in bits and read pattern, applied together
+CameraProfile = namedtuple('CameraProfile',
+                           ('refresh_rate', 'adc_resolution', 'pattern'))
+
+PROFILES = {
+    'low_latency': CameraProfile(64, 18, ChessPattern),
+    'balanced':    CameraProfile(16, 18, ChessPattern),
+    'low_noise':   CameraProfile(8, 19, ChessPattern),
+    'default':     CameraProfile(2, 18, ChessPattern),
+}
+
+ADC_MIN_BITS = const(16)
+
+
 # container for momentary state needed for image compensation
 CameraState = namedtuple('CameraState',
                          ('vdd', 'ta', 'ta_r', 'gain', 'gain_cp'))
 
 
+# contents of the status register, decoded from a single read
+CameraStatus = namedtuple('CameraStatus', ('ready', 'subpage'))
+
+# written over the status register once a subpage has been read
+_CLEAR_DATA_AVAILABLE = {'data_available': 0}
+
+# wake up this long before a subpage is due, then poll at this interval
+WAIT_LEAD_US = const(2000)
+POLL_INTERVAL_US = const(250)
+
+
 class DataNotAvailableError(Exception):
     pass
 
@@ -72,29 +111,58 @@ class MLX90640:
         """!
         """
         self.iface = CameraInterface(i2c, addr)
-        self.registers = RegisterMap(self.iface, REGISTER_MAP)
-        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True)
+        self.registers = RegisterMap(self.iface, REGISTER_MAP, cached=True,
+                                     volatile=VOLATILE_REGISTERS)
+        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True,
+                                  cached=True)
         self.calib = None
         self.raw = None
-#         self.image = None
+        self.image = None
         self.last_read = None
+        self._last_ready = None
 
 
-    def setup(self, *, calib=None, raw=None, image=None):
+    def setup(self, *, calib=None, raw=None, image=None, calibrate=False,
+              cache_path=CACHE_PATH, temperature=False, quantized=False):
         """!
+        Allocate the image buffers and, if @c calibrate is set or a @c calib
+        is given, the camera calibration and a calibrated @c ProcessedImage
+        (in degC if @c temperature is set). With @c quantized set, a
+        fixed-point @c QuantizedImage is used instead, which needs less than
+        half the RAM but cannot give temperatures; its calibration is loaded
+        straight into int16 tables. The calibration comes from a cache
+        file keyed by the camera's device ID when there is one, so only the
+        first boot with a given camera has to read and parse the EEPROM.
+
+        The calibrated image takes over the calibration's per-pixel tables
+        and fuses them for the current read pattern, so a @c calib can only
+        be used for one image, and after @c set_pattern() or
+        @c apply_profile() changes the pattern, call @c setup() again (with
+        @c calibrate set, which reloads the calibration) to rebuild the image.
         """
         # We've been having some memory allocation errors which usually happen
         # as this method runs. As a workaround, run gc.collect() several times
         # to keep memory cleaned up, as when the process is finished, there is
         # a bunch of free memory (~27KB or more on STM32L476) available
-#         collect()
-#         self.calib = calib or CameraCalibration(self.iface, self.eeprom)
+        if calib or calibrate:
+            # drop the old image first, so its tables are freed before the
+            # calibration is loaded again
+            self.image = None
+            collect()
+            self.calib = calib or load_calibration(self.iface,
+                                                   cache_path=cache_path,
+                                                   quantized=quantized)
         collect()
 #         print(f"setup: {mem_free()}", end='')
         self.raw = raw or RawImage()
         collect()
 #         print(f" -> {mem_free()}")
-#         self.image = image or ProcessedImage(self.calib)
+        if self.calib and quantized:
+            self.image = image or QuantizedImage(self.calib, self.get_pattern())
+        elif self.calib:
+            self.image = image or ProcessedImage(
+                self.calib, self.get_pattern(), temperature=temperature)
+            collect()
 
 
     @property
@@ -122,55 +190,89 @@ class MLX90640:
         self.registers['read_pattern'] = pat.pattern_id
 
 
+    def apply_profile(self, profile):
+        """!
+        Write a whole camera configuration to control register 1 in one
+        transaction, then read it back from the camera to make sure it took.
+        @param profile A @c CameraProfile, or the name of one in @c PROFILES
+        @returns The frame period (both subpages) in microseconds at the
+                 refresh rate read back from the camera
+        """
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        adc_resolution = profile.adc_resolution - ADC_MIN_BITS
+        if adc_resolution not in range(4):
+            raise ValueError(f"unsupported ADC resolution: {profile.adc_resolution}")
+
+        fields = {
+            'subpage_enable': 1,
+            'refresh_rate': RefreshRate.from_freq(profile.refresh_rate),
+            'adc_resolution': adc_resolution,
+            'read_pattern': profile.pattern.pattern_id,
+        }
+        self.registers.update(fields)
+
+        ctrl = self.registers.read_struct('refresh_rate')
+        for name, value in fields.items():
+            if ctrl[name] != value:
+                raise CameraConfigError(
+                    f"{name} reads back as {ctrl[name]}, expected {value}")
+
+        # the subpage timing starts over with the new settings
+        self._last_ready = None
+        return 2 * self.subpage_period_us
+
+
     def read_vdd(self):
         """!
-        Turned off to save memory for raw driver version.
+        Supply voltage deviation from 3.3 V. Without calibration data this is
+        the raw ADC reading.
         """
         # supply voltage calculation (delta Vdd)
         # type: (self) -> float
+        if self.calib is None:
+            return float(self.registers['vdd_pix'])
         vdd_pix = self.registers['vdd_pix'] * self._adc_res_corr()
-#         return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
-        return float(vdd_pix)
+        return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
 
 
     def _adc_res_corr(self):
         """!
-        Turned off to save memory for raw driver version.
         """
         # type: (self) -> float
-#         res_exp = self.calib.res_ee - self.registers['adc_resolution']
-#         return 1 << res_exp
-        return 0
+        res_exp = self.calib.res_ee - self.registers['adc_resolution']
+        return 2.0**res_exp
 
 
-    def read_ta(self):
+    def read_ta(self, vdd=None):
         """!
-        Turned off to save memory for raw driver version.
+        Ambient temperature deviation from 25 degC. Without calibration data
+        this is always zero.
         """
         # ambient temperature calculation (delta Ta in degC)
         # type: (self) -> float
+        if self.calib is None:
+            return 0.0
+        if vdd is None:
+            vdd = self.read_vdd()
         v_ptat = self.registers['ta_ptat']
         v_be = self.registers['ta_vbe']
-#         v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
-# 
-#         v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*self.read_vdd() - self.calib.ptat_25)
+        v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
 
-        # print('v_ptat: ', v_ptat)
-        # print('v_be:', v_be)
-        # print('v_ptat_art: ', v_ptat_art)
-
-#         return v_ta/self.calib.kt_ptat
-        return 0.0
+        v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*vdd) - self.calib.ptat_25
+        return v_ta/self.calib.kt_ptat
 
 
     def read_gain(self):
         """!
-        Turned off to save memory for raw driver version.
+        Gain correction for the current frame. Without calibration data this
+        is the raw gain reading.
         """
         # gain calculation
         # type: (self) -> float
-#         return self.calib.gain / self.registers['gain']
-        return float(self.registers['gain'])
+        if self.calib is None:
+            return float(self.registers['gain'])
+        return self.calib.gain / self.registers['gain']
 
 
     # tr - temperature of reflected environment
@@ -181,19 +283,20 @@ class MLX90640:
         cp_sp_0 = gain * self.registers['cp_sp_0']
         cp_sp_1 = gain * self.registers['cp_sp_1']
 
-        ta = self.read_ta()
+        vdd = self.read_vdd()
+        ta = self.read_ta(vdd)
 
         ta_abs = ta + 25
-#         if self.calib.emissivity == 1:
-        ta_r = (ta_abs + TEMP_K)**4
-#         else:
-#             tr = tr if tr is not None else ta_abs - 8
-#             ta_k4 = (ta_abs + TEMP_K)**4
-#             tr_k4 = (tr + TEMP_K)**4
-#             ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
+        ta_k4 = (ta_abs + TEMP_K)**4
+        if self.calib is None or self.calib.emissivity == 1:
+            ta_r = ta_k4
+        else:
+            tr = tr if tr is not None else ta_abs - 8
+            tr_k4 = (tr + TEMP_K)**4
+            ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
 
         return CameraState(
-            vdd = self.read_vdd(),
+            vdd = vdd,
             ta = ta,
             ta_r = ta_r,
             gain = gain,
@@ -201,12 +304,62 @@ class MLX90640:
         )
 
 
+    @property
+    def subpage_period_us(self):
+        """!
+        The time the camera takes to measure one subpage at the configured
+        refresh rate, in microseconds.
+        """
+        return int(1_000_000 / self.refresh_rate)
+
+
+    def read_status(self):
+        """!
+        Read the status register once and decode both whether a subpage is
+        ready and which subpage it was.
+        @returns A @c CameraStatus tuple
+        """
+        status = self.registers.read_struct('data_available')
+        return CameraStatus(bool(status['data_available']),
+                            status['last_subpage'])
+
+
+    def wait_for_data(self, timeout_us=None):
+        """!
+        Wait for the next subpage. The camera is left alone until shortly
+        before the subpage is due at the configured refresh rate, then the
+        status register is polled at a fine interval.
+        @param timeout_us How long to wait in total before giving up; the
+               default is two subpage periods plus 100 ms
+        @returns The @c CameraStatus of the ready subpage
+        """
+        period = self.subpage_period_us
+        if timeout_us is None:
+            timeout_us = 2 * period + 100_000
+        start = ticks_us()
+
+        if self._last_ready is not None:
+            due = period - WAIT_LEAD_US - ticks_diff(start, self._last_ready)
+            if due > 0:
+                sleep_us(due)
+
+        while True:
+            status = self.read_status()
+            now = ticks_us()
+            if status.ready:
+                self._last_ready = now
+                return status
+            if ticks_diff(now, start) > timeout_us:
+                raise DataNotAvailableError
+            sleep_us(POLL_INTERVAL_US)
+
+
     @property
     def has_data(self):
         """!
         Report whether there's data available from the camera.
         """
-        return bool(self.registers['data_available'])
+        return self.read_status().ready
 
 
     @property
@@ -216,39 +369,57 @@ class MLX90640:
         return self.registers['last_subpage']
 
 
-    def read_image(self, sp_id = None):
+    def read_image(self, sp_id = None, *, block = True, status = None,
+                   image = None, rows = None):
         """!
+        Read the pixels of one subpage into the raw image, or into @c image if
+        another @c RawImage is given. With @c block set the pixel RAM is
+        fetched in a few burst transfers rather than one I2C transaction per
+        pixel. A @c status just returned by @c read_status() or
+        @c wait_for_data() saves reading the status register again. If
+        @c rows is a (first, last) pair of pixel rows, only those rows are
+        read, and only they are calibrated by the next @c process_image();
+        the other pixels keep their old values.
         """
-        if not self.has_data:
+        if status is None:
+            status = self.read_status()
+        if not status.ready:
             raise DataNotAvailableError
 
         if sp_id is None:
-            sp_id = self.last_subpage
+            sp_id = status.subpage
 
-        subpage = Subpage(self.get_pattern(), sp_id)
+        if rows is not None:
+            first, last = rows
+            if not 0 <= first <= last < NUM_ROWS:
+                raise ValueError(f"rows {first}..{last} are outside the image")
+        subpage = Subpage(self.get_pattern(), sp_id, rows)
         self.last_read = subpage
 
         # print(f"read SP {subpage.id}")
-        self.raw.read(self.iface, subpage.sp_range())
-        self.registers['data_available'] = 0
-        return self.raw
-
-
-#     def process_image(self, sp_id = None, state = None):
-#         """!
-#         """
-#         if self.last_read is None:
-#             raise DataNotAvailableError
-# 
-#         subpage = self.last_read
-#         if sp_id is not None:
-#             subpage.id = sp_id
-# 
-#         state = state or self.read_state()
-# 
-#         # print(f"process SP {subpage.id}")
-#         raw_data = ((idx, self.raw[idx]) for idx in subpage.sp_range())
-#         self.image.update(raw_data, subpage, state)
-#         return self.image
+        image = image or self.raw
+        if block:
+            image.read_block(self.iface, subpage.sp_runs())
+        else:
+            image.read(self.iface, subpage.sp_range())
+        self.registers.update(_CLEAR_DATA_AVAILABLE, reread=False)
+        return image
+
+
+    def process_image(self, sp_id = None, state = None, raw = None):
+        """!
+        Calibrate the pixels of the subpage last read, from @c raw or the
+        driver's own raw image, into the processed image.
+        """
+        if self.last_read is None or self.image is None:
+            raise DataNotAvailableError
+
+        subpage = self.last_read
+        if sp_id is not None:
+            subpage.id = sp_id
 
+        state = state or self.read_state()
 
+        # print(f"process SP {subpage.id}")
+        self.image.update(raw or self.raw, subpage, state)
+        return self.image
@@ -1,10 +1,19 @@
+import struct
 from array import array
+from ubinascii import hexlify
 from mlx90640.utils import (
     Struct, 
     StructProto,
     field_desc,
+    array_filled,
+    array_quantized,
+)
+from mlx90640.regmap import (
+    REG_SIZE,
+    EEPROM_MAP,
+    RegisterMap,
+    EepromSnapshot,
 )
-from mlx90640.regmap import REG_SIZE
 
 NUM_ROWS = const(24)
 NUM_COLS = const(32)
@@ -63,7 +72,7 @@ class PixelCalibrationData:
         buf = bytearray(REG_SIZE)
         for idx in range(pix_count):
             offset = idx * REG_SIZE
-            iface.read_into(PIX_CALIB_ADDRESS + offset, buf)
+            iface.read_into(PIX_CALIB_ADDRESS + idx, buf)
             if buf != bytes(REG_SIZE):
                 self._data[offset:offset+REG_SIZE] = buf
             else:
@@ -81,9 +90,84 @@ class PixelCalibrationData:
 
 TEMP_K = 273.15
 
+DEVICE_ID_ADDRESS = const(0x2407)
+DEVICE_ID_SIZE = const(3)
+
+def read_device_id(iface):
+    # the three device ID words in one read, used to key the calibration cache
+    buf = bytearray(DEVICE_ID_SIZE * REG_SIZE)
+    iface.read_into(DEVICE_ID_ADDRESS, buf)
+    return bytes(buf)
+
+## Calibration cache
+
+CACHE_PATH = 'mlx90640_{}.cal'
+CACHE_MAGIC = b'MLXC'
+CACHE_VERSION = const(2)
+
+# magic, version, device ID, use_tgc, whether the float tables were rounded
+# through int16 by a quantized calibration, number of outliers
+_CACHE_HEADER = '<4sB6sBBH'
+
+# coefficients stored in a cache file, in order, after the header
+_CACHE_INTS = ('k_vdd', 'vdd_25', 'res_ee', 'ptat_25', 'gain',
+               'kta_scale_1', 'kta_scale_2', 'kv_scale', 'ksto_scale')
+_CACHE_FLOATS = ('kv_ptat', 'kt_ptat', 'alpha_ptat', 'ksta', 'il_chess_c1',
+                 'il_chess_c2', 'il_chess_c3', 'drift')
+_CACHE_TGC_FLOATS = ('tgc', 'kta_cp', 'kv_cp')
+_CACHE_ARRAYS = (('pix_os_ref', 'h'), ('pix_kta', 'f'), ('pix_alpha', 'f'),
+                 ('il_offset', 'f'))
+
+def _read_array(f, typecode, length):
+    arr = array_filled(typecode, length)
+    if f.readinto(arr) != length * struct.calcsize(typecode):
+        raise ValueError("calibration cache is truncated")
+    return arr
+
+def load_calibration(iface, *, cache_path=CACHE_PATH, **kwargs):
+    """ Get the camera calibration, from the cache file for this device if
+    there is one; otherwise the EEPROM is read in one burst, parsed from
+    memory and the result saved to the cache for next time. Set cache_path
+    to None to always parse the EEPROM. With quantized=True the float pixel
+    tables are turned into int16 as each one is loaded, for QuantizedImage.
+    A cache written by a quantized calibration holds the rounded tables, so
+    a float calibration parses the EEPROM again and rewrites it.
+    """
+    path = None
+    if cache_path:
+        device_id = read_device_id(iface)
+        path = cache_path.format(hexlify(device_id).decode())
+        try:
+            return CameraCalibration.from_cache(path, device_id, **kwargs)
+        except (OSError, ValueError):
+            pass
+
+    snapshot = EepromSnapshot(iface)
+    eeprom = RegisterMap(snapshot, EEPROM_MAP, readonly=True)
+    calib = CameraCalibration(snapshot, eeprom, **kwargs)
+    calib.pix_data = None  # only needed while parsing, as for a cached load
+    del snapshot, eeprom
+
+    if path:
+        try:
+            calib.save(path, device_id)
+        except OSError:
+            # flash full or read-only: the calibration is still good, it
+            # just isn't cached (a partly written file fails its length
+            # checks next time and is rewritten)
+            pass
+    return calib
+
 class CameraCalibration:
-    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False):
+    # The float pixel tables (pix_kta, pix_alpha, il_offset) are array('f')
+    # unless the calibration is quantized, in which case each is an int16
+    # array with its own exponent in <name>_exp, value ~= item * 2**-exp.
+    # A quantized calibration converts each table as soon as it's built or
+    # read, so no more than one float table is ever held.
+    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False,
+                 quantized=False):
         self.emissivity = emissivity
+        self.quantized = quantized
 
         # restore VDD sensor parameters
         self.k_vdd = eeprom['k_vdd'] * 32
@@ -110,6 +194,7 @@ class CameraCalibration:
         self.kta_scale_1 = 1 << (eeprom['kta_scale_1'] + 8)
         self.kta_scale_2 = 1 << eeprom['kta_scale_2']
         self.pix_kta = array('f', self._calc_pix_kta(eeprom))
+        self._quantize_table('pix_kta')
 
         self.kv_scale = 1 << eeprom['kv_scale']
         self.kv_avg = (
@@ -135,6 +220,7 @@ class CameraCalibration:
 
         # sensitivity normalization
         self.pix_alpha = array('f', self._calc_pix_alpha_ref(iface, eeprom))
+        self._quantize_table('pix_alpha')
         self.ksta = eeprom['ksta'] / 8192.0
 
         if use_tgc:
@@ -149,6 +235,7 @@ class CameraCalibration:
         self.il_chess_c2 = eeprom['il_chess_c2'] / 2.0
         self.il_chess_c3 = eeprom['il_chess_c3'] / 8.0
         self.il_offset = array('f', self._calc_il_offset())
+        self._quantize_table('il_offset')
 
         # temperature calculation
         self.drift = 0  # temperature drift correction
@@ -173,6 +260,82 @@ class CameraCalibration:
         alpha_4 = alpha_3*(1.0 + ksto3*(ct4 - ct3))
         self.alpha_ext = (alpha_1, alpha_2, alpha_3, alpha_4)
 
+    def save(self, path, device_id):
+        with open(path, 'wb') as f:
+            f.write(struct.pack(_CACHE_HEADER, CACHE_MAGIC, CACHE_VERSION,
+                                device_id, self.use_tgc, self.quantized,
+                                len(self.outliers)))
+            f.write(array('i', [getattr(self, name) for name in _CACHE_INTS]))
+            f.write(array('f', [getattr(self, name) for name in _CACHE_FLOATS]))
+            f.write(array('f', self.kv_avg[0] + self.kv_avg[1]))
+            f.write(array('f', self.ksto + self.alpha_ext))
+            f.write(array('i', self.ct))
+            if self.use_tgc:
+                f.write(array('f', [getattr(self, name) for name in _CACHE_TGC_FLOATS]))
+                f.write(array('f', self.pix_alpha_cp))
+                f.write(array('i', self.pix_os_cp))
+            f.write(array('H', self.outliers))
+            # the cache always holds floats; a quantized table is expanded
+            # one at a time as it's written, and the header says it was rounded
+            for name, typecode in _CACHE_ARRAYS:
+                table = getattr(self, name)
+                if typecode == 'f' and self.quantized:
+                    scale = 2.0**-getattr(self, name + '_exp')
+                    table = array('f', (v * scale for v in table))
+                f.write(table)
+
+    @classmethod
+    def from_cache(cls, path, device_id, *, emissivity=1, use_tgc=False,
+                   quantized=False):
+        # rebuild a calibration saved by save() without touching the camera
+        with open(path, 'rb') as f:
+            header = f.read(struct.calcsize(_CACHE_HEADER))
+            if len(header) != struct.calcsize(_CACHE_HEADER):
+                raise ValueError("calibration cache is truncated")
+            (magic, version, cached_id, cached_tgc, rounded,
+             num_outliers) = struct.unpack(_CACHE_HEADER, header)
+            if (magic != CACHE_MAGIC or version != CACHE_VERSION
+                    or cached_id != device_id or bool(cached_tgc) != use_tgc):
+                raise ValueError("calibration cache doesn't match this camera")
+            # int16-rounded tables are only good enough for a quantized load
+            if rounded and not quantized:
+                raise ValueError("calibration cache is quantized")
+
+            calib = object.__new__(cls)
+            calib.emissivity = emissivity
+            calib.use_tgc = use_tgc
+            calib.quantized = quantized
+            calib.pix_data = None  # only needed while parsing the EEPROM
+
+            for name, value in zip(_CACHE_INTS, _read_array(f, 'i', len(_CACHE_INTS))):
+                setattr(calib, name, value)
+            for name, value in zip(_CACHE_FLOATS, _read_array(f, 'f', len(_CACHE_FLOATS))):
+                setattr(calib, name, value)
+            kv_avg = _read_array(f, 'f', 4)
+            calib.kv_avg = ((kv_avg[0], kv_avg[1]), (kv_avg[2], kv_avg[3]))
+            ksto_alpha = tuple(_read_array(f, 'f', 8))
+            calib.ksto = ksto_alpha[:4]
+            calib.alpha_ext = ksto_alpha[4:]
+            calib.ct = tuple(_read_array(f, 'i', 4))
+            if use_tgc:
+                for name, value in zip(_CACHE_TGC_FLOATS, _read_array(f, 'f', len(_CACHE_TGC_FLOATS))):
+                    setattr(calib, name, value)
+                calib.pix_alpha_cp = tuple(_read_array(f, 'f', 2))
+                calib.pix_os_cp = tuple(_read_array(f, 'i', 2))
+            calib.outliers = tuple(_read_array(f, 'H', num_outliers))
+            for name, typecode in _CACHE_ARRAYS:
+                setattr(calib, name, _read_array(f, typecode, IMAGE_SIZE))
+                if typecode == 'f':
+                    calib._quantize_table(name)
+        return calib
+
+    def _quantize_table(self, name):
+        # with quantized set, replace a float table by int16 and its exponent
+        if self.quantized:
+            table, exp = array_quantized('h', getattr(self, name))
+            setattr(self, name, table)
+            setattr(self, name + '_exp', exp)
+
     def _calc_pix_os_ref(self, iface, eeprom):
         offset_avg = eeprom['pix_os_average']
         occ_scale_row = 1 << eeprom['scale_occ_row']
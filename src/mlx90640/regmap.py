@@ -49,12 +49,19 @@ REGISTER_MAP = {
     0x072A : field_desc('vdd_pix',      FD_WORD, signed=True),
 }
 
+# Registers the camera updates on its own; everything else in REGISTER_MAP only
+# changes when we write it, so a cached RegisterMap can serve it from a shadow
+VOLATILE_REGISTERS = (0x8000, 0x0700, 0x0708, 0x070A, 0x0720, 0x0728, 0x072A)
+
 # Calibration Data
 EEPROM_ADDRESS = const(0x2400)
 EEPROM_SIZE    = const(0x340)
 
 # From table on page 21
 EEPROM_MAP = {
+    0x2407 : field_desc('device_id_0', FD_WORD),
+    0x2408 : field_desc('device_id_1', FD_WORD),
+    0x2409 : field_desc('device_id_2', FD_WORD),
     0x2410 : (
         field_desc('k_ptat',         4, 12),
         field_desc('scale_occ_row',  4,  8),
@@ -154,11 +161,41 @@ class CameraInterface:
 
 class ReadOnlyError(Exception): pass
 
+class EepromSnapshot:
+    # the whole calibration EEPROM read in a single burst; it stands in for
+    # the CameraInterface so RegisterMap and the calibration parsers can work
+    # from memory instead of the bus
+    def __init__(self, iface):
+        self.data = bytearray(EEPROM_SIZE * REG_SIZE)
+        iface.read_into(EEPROM_ADDRESS, self.data)
+        self._view = memoryview(self.data)
+
+    def _offset(self, mem_addr, size):
+        offset = (mem_addr - EEPROM_ADDRESS) * REG_SIZE
+        if offset < 0 or offset + size > len(self.data):
+            raise ValueError(f"0x{mem_addr:04X} is outside the EEPROM")
+        return offset
+
+    def read(self, mem_addr):
+        offset = self._offset(mem_addr, REG_SIZE)
+        return self.data[offset:offset+REG_SIZE]
+    def read_into(self, mem_addr, buf):
+        offset = self._offset(mem_addr, len(buf))
+        buf[:] = self._view[offset:offset+len(buf)]
+    def write(self, mem_addr, buf):
+        raise ReadOnlyError(f"can't write to 0x{mem_addr:04X}: EEPROM snapshot")
+
 class RegisterMap:
-    def __init__(self, iface, register_map, readonly=False):
+    def __init__(self, iface, register_map, readonly=False, *,
+                 cached=False, volatile=()):
         # register_map should be a dict of { I2C address : FieldDesc(s) }
+        # with cached set, registers are read once and kept in a shadow copy,
+        # except the addresses listed in volatile which always go to the bus
         self.iface = iface
         self.readonly = readonly
+        self.cached = cached
+        self._volatile = tuple(volatile)
+        self._shadow = {}  # address -> (buffer, Struct)
         self._fields = self._build_lookup(register_map)
 
     @staticmethod
@@ -185,19 +222,62 @@ class RegisterMap:
 
     def __getitem__(self, name):
         address, proto = self._fields[name]
-
-        buf = self.iface.read(address)
-        struct = Struct(buf, proto)
-        return struct[name]
+        return self._fetch(address, proto)[1][name]
 
     def __setitem__(self, name, value):
-        if self.readonly:
-            raise ReadOnlyError(f"can't write to '{name}': not permitted")
+        self.update({name: value})
 
+    def read_struct(self, name):
+        # read the register holding this field from the bus in one transaction
+        # and return it whole, so several of its fields can be decoded at once
         address, proto = self._fields[name]
+        return self._fetch(address, proto, True)[1]
+
+    def update(self, fields, *, reread=None):
+        # write several fields at once; each register touched is committed in
+        # a single transaction no matter how many of its fields changed.
+        # reread=False writes over the shadow of a volatile register as it was
+        # last read, rather than fetching it from the bus again first
+        if self.readonly:
+            names = ", ".join(fields)
+            raise ReadOnlyError(f"can't write to '{names}': not permitted")
+
+        pending = {}
+        for name, value in fields.items():
+            address, proto = self._fields[name]
+            if address not in pending:
+                pending[address] = self._fetch(address, proto, reread)
+            pending[address][1][name] = value
+
+        for address, (buf, _) in pending.items():
+            try:
+                self.iface.write(address, buf)
+            except OSError:
+                # the shadow no longer matches the device
+                self._shadow.pop(address, None)
+                raise
+
+    def invalidate(self, name=None):
+        # drop the shadow copy of one field's register, or of all registers,
+        # e.g. after something else has written to the device
+        if name is None:
+            self._shadow.clear()
+        else:
+            self._shadow.pop(self._fields[name][0], None)
+
+    def _fetch(self, address, proto, reread=None):
+        if self.cached:
+            shadow = self._shadow.get(address)
+            if shadow is not None:
+                if reread is None:
+                    reread = address in self._volatile
+                if reread:
+                    self.iface.read_into(address, shadow[0])
+                return shadow
 
         buf = bytearray(REG_SIZE)
         self.iface.read_into(address, buf)
-        struct = Struct(buf, proto)
-        struct[name] = value
-        self.iface.write(address, buf)
+        shadow = (buf, Struct(buf, proto))
+        if self.cached:
+            self._shadow[address] = shadow
+        return shadow
@@ -17,6 +17,44 @@ from uctypes import (
 def array_filled(typecode, length, fill=0):
     return array(typecode, (fill for i in range(length)))
 
+_QUANT_LIMITS = {'b': 127, 'h': 32767}
+
+def _quant_exp(peak, limit, max_exp):
+    # largest exponent for which peak * 2**exp still fits in limit
+    exp = 0
+    if peak:
+        while peak * 2.0**exp > limit:
+            exp -= 1
+        while peak * 2.0**(exp + 1) <= limit:
+            exp += 1
+    if max_exp is not None and exp > max_exp:
+        exp = max_exp
+    return exp
+
+def array_quantized(typecode, values, max_exp=None):
+    # scale a sequence of floats into an int8 ('b') or int16 ('h') array with
+    # one exponent for the whole table, so that value ~= item * 2**-exp; the
+    # exponent is as large as the biggest value allows, capped at max_exp
+    peak = max(max(values), -min(values))
+    exp = _quant_exp(peak, _QUANT_LIMITS[typecode], max_exp)
+    scale = 2.0**exp
+    return array(typecode, (int(round(v * scale)) for v in values)), exp
+
+def quantize_into(table, typecode, value, max_exp=None):
+    # like array_quantized, but fills the existing int array table in place
+    # with value(idx) for every index, so no float table is built; value(idx)
+    # may read table[idx] itself but no other item. Returns the exponent
+    peak = 0
+    for idx in range(len(table)):
+        v = abs(value(idx))
+        if v > peak:
+            peak = v
+    exp = _quant_exp(peak, _QUANT_LIMITS[typecode], max_exp)
+    scale = 2.0**exp
+    for idx in range(len(table)):
+        table[idx] = int(round(value(idx) * scale))
+    return exp
+
 def twos_complement(bits, value):
     if value < 0:
         return value + (1 << bits)
@@ -2,8 +2,9 @@
 @file mlx_cam.py
 
 RAW VERSION
-This version uses a stripped down MLX90640 driver which produces only raw data,
-not calibrated data, in order to save memory.
+This version uses a stripped down MLX90640 driver which produces raw data by
+default, in order to save memory; calibrated images can be turned on with
+@c calibrated=True when memory allows.
 
 This file contains a wrapper that facilitates the use of a Melexis MLX90640
 thermal infrared camera for general use. The wrapper contains a class MLX_Cam
@@ -24,11 +25,209 @@ example.
     version 3.
 """
 
+import gc
 import utime as time
 from machine import Pin, I2C
-from mlx90640 import MLX90640
+from mlx90640 import MLX90640, WAIT_LEAD_US, DataNotAvailableError
 from mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
-from mlx90640.image import ChessPattern, InterleavedPattern
+from mlx90640.image import ChessPattern, InterleavedPattern, RawImage
+
+
+def _pixels(image):
+    """!
+    @brief   Get the flat array of pixel values behind an image object.
+    @param   image A @c RawImage, a calibrated image, or a plain array
+    @returns The array holding the pixel values
+    """
+    if isinstance(image, RawImage):
+        return image.pix
+    return getattr(image, 'buf', image)
+
+
+class StreamOverrunError(Exception):
+    """!
+    @brief   Raised when a frame stream needs a buffer which the consumer is
+             still holding.
+    """
+    pass
+
+
+class Frame:
+    """!
+    @brief   One complete image captured by a @c FrameStream.
+    @details The frame stays held, and its buffer is never reused, until the
+             consumer calls @c release().
+    """
+
+    def __init__(self):
+        """!
+        @brief   Create an empty frame with its own image buffer.
+        """
+        ## The raw image holding both subpages of this frame
+        self.image = RawImage()
+        ## Sequence number of the frame within its stream, counting from 0
+        self.seq = -1
+        ## Time at which the last subpage of the frame was ready, from
+        #  @c time.ticks_ms()
+        self.timestamp = 0
+        ## Whether the consumer still owns this frame
+        self.held = False
+
+    def release(self):
+        """!
+        @brief   Hand the frame's buffer back to the stream for reuse.
+        """
+        self.held = False
+
+
+class FrameStream:
+    """!
+    @brief   Captures complete images into a small set of preallocated
+             buffers used in rotation, one subpage at a time.
+    @details The stream is driven by calling @c poll() often, for example
+             from a camera task, or by running @c run() as a coroutine. Each
+             call reads a subpage if one is ready and returns at once
+             otherwise, so the consumer can work on one frame while the next
+             is captured into another buffer. A frame holds subpage 0 and then
+             subpage 1 of one measurement. The two subpages of a measurement
+             are always found ready less than two subpage periods apart, so
+             a longer gap means at least one measurement was missed, even if
+             the subpage numbers still alternate, and the frame is started
+             again; a frame never mixes measurements. Finished frames wait,
+             held, until the consumer takes them with @c get() and hands them
+             back with @c Frame.release(). If the buffer due to be filled next
+             is still held, a @c StreamOverrunError is raised rather than
+             overwriting it.
+    """
+
+    def __init__(self, camera, buffers=2, block=True, on_ready=None):
+        """!
+        @brief   Set up a stream of frames from an MLX90640 driver object.
+        @param   camera The @c MLX90640 object which reads the images
+        @param   buffers The number of image buffers to rotate, 2 or 3
+        @param   block Whether to read the pixel RAM in burst transfers
+        @param   on_ready A function called with no arguments as soon as each
+                 subpage is ready, before its pixels are read, or @c None
+        """
+        if buffers not in (2, 3):
+            raise ValueError("a frame stream needs 2 or 3 buffers")
+        self._camera = camera
+        self._block = block
+        self._on_ready = on_ready
+        self._frames = tuple(Frame() for _ in range(buffers))
+        self._slot = 0
+        self._seq = 0
+        ## Finished frames which haven't been taken yet, oldest first
+        self._done = []
+        ## Time at which subpage 0 of the frame being filled was ready, from
+        #  @c time.ticks_us(), or @c None if the frame hasn't started
+        self._started = None
+        ## Time at which the last subpage was ready, or @c None
+        self._last_ready = None
+        ## Number of subpages thrown away because a measurement was missed
+        self.dropped = 0
+
+    def poll(self):
+        """!
+        @brief   Read the next subpage into the frame being filled, if one is
+                 ready, without waiting.
+        @returns The @c Frame which this subpage finished, or @c None
+        """
+        status = self._camera.read_status()
+        if not status.ready:
+            return None
+        now = time.ticks_us()
+        frame = self._frames[self._slot]
+        if frame.held:
+            raise StreamOverrunError(f"frame {frame.seq} is still held")
+        if self._on_ready is not None:
+            self._on_ready()
+        self._camera.read_image(status.subpage, block=self._block,
+                                status=status, image=frame.image)
+        self._last_ready = now
+
+        if status.subpage == 0:
+            if self._started is not None:
+                # the subpage 1 between was missed
+                self.dropped += 1
+            self._started = now
+            return None
+        started = self._started
+        self._started = None
+        if (started is None or time.ticks_diff(now, started)
+                >= 2 * self._camera.subpage_period_us):
+            self.dropped += 1 if started is None else 2
+            return None
+
+        frame.timestamp = time.ticks_ms()
+        frame.seq = self._seq
+        frame.held = True
+        self._seq += 1
+        self._slot = (self._slot + 1) % len(self._frames)
+        self._done.append(frame)
+        return frame
+
+    def get(self):
+        """!
+        @brief   Take the oldest finished frame.
+        @returns The @c Frame, which stays held until it is released, or
+                 @c None if no frame has finished since the last one taken
+        """
+        if self._done:
+            return self._done.pop(0)
+        return None
+
+    async def run(self, poll_ms=1):
+        """!
+        @brief   Keep capturing frames while other coroutines run.
+        @details The coroutine sleeps until shortly before each subpage is
+                 due at the configured refresh rate, then polls every
+                 @c poll_ms milliseconds; run it as a task next to the
+                 coroutines which take the frames.
+        @param   poll_ms The time between status checks in milliseconds
+        """
+        try:
+            import uasyncio as asyncio
+        except ImportError:
+            import asyncio
+        period = self._camera.subpage_period_us
+        while True:
+            self.poll()
+            due = 0
+            if self._last_ready is not None:
+                due = (period - WAIT_LEAD_US
+                       - time.ticks_diff(time.ticks_us(), self._last_ready))
+            await asyncio.sleep(due / 1_000_000 if due > 0
+                                else poll_ms / 1000)
+
+    async def next_frame(self, poll_ms=1):
+        """!
+        @brief   Wait for the next finished frame while other coroutines,
+                 such as @c run(), keep running.
+        @param   poll_ms The time between checks in milliseconds
+        @returns The oldest finished @c Frame, held until it is released
+        """
+        try:
+            import uasyncio as asyncio
+        except ImportError:
+            import asyncio
+        while True:
+            frame = self.get()
+            if frame is not None:
+                return frame
+            await asyncio.sleep(poll_ms / 1000)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # Blocking use, for simple loops: wait for each subpage in turn
+        while True:
+            frame = self.get()
+            if frame is not None:
+                return frame
+            self._camera.wait_for_data()
+            self.poll()
 
 
 class MLX_Cam:
@@ -38,7 +237,8 @@ class MLX_Cam:
     """
 
     def __init__(self, i2c, address=0x33, pattern=ChessPattern,
-                 width=NUM_COLS, height=NUM_ROWS):
+                 width=NUM_COLS, height=NUM_ROWS, profile=None,
+                 calibrated=False, temperature=False, quantized=False):
         """!
         @brief   Set up an MLX90640 camera.
         @param   i2c An I2C bus which has been set up to talk to the camera;
@@ -48,6 +248,19 @@ class MLX_Cam:
                  the pixels at a time (default ChessPattern)
         @param   width The width of the image in pixels; leave it at default
         @param   height The height of the image in pixels; leave it at default
+        @param   profile A configuration profile to apply, given as a
+                 @c CameraProfile or a name from @c mlx90640.PROFILES such as
+                 @c "low_latency"; if given, its pattern is used instead of
+                 @c pattern
+        @param   calibrated If @c True, load the camera's calibration and have
+                 @c get_image() return calibrated images; this needs about
+                 10 KB more RAM than the raw images
+        @param   temperature If @c True as well as @c calibrated, calibrated
+                 images hold temperatures in degrees C rather than
+                 compensated IR signal
+        @param   quantized If @c True as well as @c calibrated, keep the
+                 calibration as fixed-point int16 tables (about 6 KB in all)
+                 and return int16 images; not available with @c temperature
         """
         ## The I2C bus to which the camera is attached
         self._i2c = i2c
@@ -62,12 +275,22 @@ class MLX_Cam:
 
         # The MLX90640 object that does the work
         self._camera = MLX90640(i2c, address)
-        #self._camera.refresh_rate(2)
-        self._camera.set_pattern(pattern)
-        self._camera.setup()
-
+        if profile is None:
+            self._camera.set_pattern(pattern)
+        else:
+            self._camera.apply_profile(profile)
+        if temperature and quantized:
+            raise ValueError("quantized calibration can't give temperatures")
+        self._camera.setup(calibrate=calibrated, temperature=temperature,
+                           quantized=quantized)
+
+        ## Whether images are calibrated before being returned
+        self._calibrated = calibrated
         ## A local reference to the image object within the camera driver
-        self._image = self._camera.raw
+        self._image = self._camera.image if calibrated else self._camera.raw
+        ## Time at which @c next_frame() last found a subpage ready, from
+        #  @c time.ticks_us(), or @c None before the first one
+        self._frame_ready = None
 
 
     def ascii_image(self, array, pixel="██", textcolor="0;180;0"):
@@ -168,7 +391,70 @@ class MLX_Cam:
         return
 
 
-    def get_image(self):
+    def get_normalized(self, array, out, limits=(0, 99), window=None,
+                       data_range=None):
+        """!
+        @brief   Scale image data into a preallocated array of numbers.
+        @details This does the same job as @c get_csv() with @c limits, without
+                 making any strings: the pixels are scaled so the coldest one
+                 becomes @c limits[0] and the hottest @c limits[1], mirrored
+                 left to right in the same way, and written as integers into
+                 @c out row by row. The minimum and maximum are found in one
+                 pass, unless they are already known. Integer data such as raw
+                 images is scaled with integer arithmetic only, so no float
+                 objects are made either.
+        @param   array The image or array of data to be scaled
+        @param   out An array of at least (width * height) items to be filled,
+                 such as @c array('B', bytes(768)) for limits up to 255
+        @param   limits A 2-iterable with the values to which the minimum and
+                 maximum pixels are scaled
+        @param   window An (x_min, x_max, y_min, y_max) tuple of the pixels of
+                 @c out to scale, inclusive and in the mirrored output
+                 columns, or @c None for all of them. The rest of those rows
+                 are set to @c limits[0] and the other rows are left as they are
+        @param   data_range A (minimum, maximum) tuple of the data if it is
+                 already known, such as from an @c ImagePyramid, to skip the
+                 pass which finds them, or @c None
+        @returns A tuple with the minimum and maximum of the original data
+        """
+        data = _pixels(array)
+        if data_range is None:
+            minny = maxy = data[0]
+            for pix in data:
+                if pix < minny:
+                    minny = pix
+                elif pix > maxy:
+                    maxy = pix
+        else:
+            minny, maxy = data_range
+
+        low, high = limits
+        span = (maxy - minny) or 1
+        fixed = isinstance(span, int)
+        scale = high - low if fixed else (high - low) / span
+
+        width = self._width
+        x_min, x_max, y_min, y_max = window or (0, width - 1, 0, self._height - 1)
+        for row in range(y_min, y_max + 1):
+            idx = row * width
+            for _ in range(x_min):
+                out[idx] = low
+                idx += 1
+            src = row * width + width - 1 - x_min
+            for _ in range(x_max - x_min + 1):
+                if fixed:
+                    out[idx] = (data[src] - minny) * scale // span + low
+                else:
+                    out[idx] = int((data[src] - minny) * scale) + low
+                idx += 1
+                src -= 1
+            for _ in range(width - 1 - x_max):
+                out[idx] = low
+                idx += 1
+        return minny, maxy
+
+
+    def get_image(self, block=True, rows=None):
         """!
         @brief   Get one image from a MLX90640 camera.
         @details Grab one image from the given camera and return it. Both
@@ -176,18 +462,194 @@ class MLX_Cam:
                  grabbed and combined (maybe; this is the raw version, so the
                  combination is sketchy and not fully tested). It is assumed
                  that the camera is in the ChessPattern (default) mode as it
-                 probably should be.
+                 probably should be. Each subpage is waited for with a
+                 deadline based on the camera's refresh rate, so there is no
+                 fixed polling delay on top of the sensor's own timing. If the
+                 camera was set up with @c calibrated=True, each subpage is
+                 calibrated as it arrives and the calibrated image returned.
+                 Subpages are read in whichever order the camera finishes
+                 them, until both have arrived.
+        @param   block If @c True (default), read the pixel RAM in burst
+                 transfers; if @c False, use the slower one-word-per-pixel
+                 reads
+        @param   rows A (first, last) pair of pixel rows, inclusive, to read
+                 only a region of interest such as the rows around a tracked
+                 target, or @c None (default) for the whole image. Pixels
+                 outside the rows keep the values of an earlier image.
         @returns A reference to the image object we've just filled with data
         """
-        for subpage in (0, 1):
-            while not self._camera.has_data:
-                time.sleep_ms(50)
-                print('.', end='')
-            image = self._camera.read_image(subpage)
+        arrived = 0
+        while arrived != 0b11:
+            status = self._camera.wait_for_data()
+            image = self._camera.read_image(status.subpage, block=block,
+                                            status=status, rows=rows)
+            if self._calibrated:
+                image = self._camera.process_image()
+            arrived |= 1 << status.subpage
 
         return image
 
 
+    def get_subpage(self, block=True, rows=None, on_ready=None, wait=True):
+        """!
+        @brief   Get the next subpage from a MLX90640 camera.
+        @details Wait for whichever subpage the camera finishes next and read
+                 it into the image, which still holds the other subpage from
+                 before. This lets the caller update its results twice per
+                 frame, each time a half of the pixels is new, instead of
+                 waiting for both subpages as @c get_image() does. If the
+                 camera was set up with @c calibrated=True, the subpage is
+                 calibrated too.
+        @param   block If @c True (default), read the pixel RAM in burst
+                 transfers; if @c False, use one-word-per-pixel reads
+        @param   rows A (first, last) pair of pixel rows, inclusive, to read
+                 only a region of interest, or @c None (default) for the
+                 whole subpage
+        @param   on_ready A function called with no arguments as soon as the
+                 subpage is ready, before its pixels are read, such as one
+                 that records the turret's encoder positions at capture time
+        @param   wait If @c True (default), wait for the next subpage; if
+                 @c False, return at once when no subpage is ready
+        @returns A tuple of the image and the number (0 or 1) of the subpage
+                 which was just read, or @c (None, None) if @c wait is
+                 @c False and no subpage was ready
+        """
+        if wait:
+            status = self._camera.wait_for_data()
+        else:
+            status = self._camera.read_status()
+            if not status.ready:
+                return None, None
+        if on_ready is not None:
+            on_ready()
+        image = self._camera.read_image(status.subpage, block=block,
+                                        status=status, rows=rows)
+        if self._calibrated:
+            image = self._camera.process_image()
+        return image, status.subpage
+
+
+    async def next_frame(self, block=True, rows=None, on_ready=None,
+                         poll_ms=1, timeout_ms=None):
+        """!
+        @brief   Wait for the next subpage while other coroutines run.
+        @details This is the asyncio version of @c get_subpage(). While the
+                 camera integrates, the coroutine sleeps until shortly before
+                 the subpage is due at the configured refresh rate, then it
+                 checks the status register every @c poll_ms milliseconds,
+                 yielding to other coroutines in between. Only reading the
+                 pixels holds up the event loop, e.g.
+                 @code
+                 image, subpage = await camera.next_frame()
+                 @endcode
+        @param   block If @c True (default), read the pixel RAM in burst
+                 transfers; if @c False, use one-word-per-pixel reads
+        @param   rows A (first, last) pair of pixel rows, inclusive, to read
+                 only a region of interest, or @c None (default) for the
+                 whole subpage
+        @param   on_ready A function called with no arguments as soon as the
+                 subpage is ready, before its pixels are read
+        @param   poll_ms The time between status checks in milliseconds
+        @param   timeout_ms How long to wait in total before giving up, in
+                 milliseconds; the default is two subpage periods plus 100 ms
+        @returns A tuple of the image and the number (0 or 1) of the subpage
+                 which was just read
+        @raises  DataNotAvailableError if no subpage is ready in time
+        """
+        # only the asyncio programs pay for loading it
+        try:
+            import uasyncio as asyncio
+        except ImportError:
+            import asyncio
+        if timeout_ms is None:
+            timeout_ms = 2 * self._camera.subpage_period_us // 1000 + 100
+        start = time.ticks_ms()
+        if self._frame_ready is not None:
+            due = (self._camera.subpage_period_us - WAIT_LEAD_US
+                   - time.ticks_diff(time.ticks_us(), self._frame_ready))
+            if due > 0:
+                await asyncio.sleep(due / 1_000_000)
+
+        while True:
+            checked = time.ticks_us()
+            image, subpage = self.get_subpage(block, rows, on_ready,
+                                              wait=False)
+            if image is not None:
+                self._frame_ready = checked
+                return image, subpage
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                raise DataNotAvailableError
+            await asyncio.sleep(poll_ms / 1000)
+
+
+    def set_profile(self, profile, frames=4):
+        """!
+        @brief   Configure the camera's refresh rate, ADC resolution and read
+                 pattern together.
+        @details The settings are written to the camera in one transaction and
+                 read back to check them; a @c CameraConfigError is raised if
+                 they don't match. Then a few images are grabbed to measure the
+                 frame period the camera actually achieves.
+        @param   profile A @c CameraProfile, or the name of one in
+                 @c mlx90640.PROFILES: @c "low_latency" (64 Hz),
+                 @c "balanced" (16 Hz), @c "low_noise" (8 Hz, 19 bit ADC) or
+                 @c "default" (2 Hz)
+        @param   frames The number of images to time, or 0 to skip measuring
+        @returns The measured frame period in milliseconds, or the configured
+                 one if @c frames is 0
+        """
+        period_us = self._camera.apply_profile(profile)
+        if not frames:
+            return period_us / 1000
+        return 1000 / self.measure_fps(frames)
+
+
+    def stream(self, buffers=2, block=True, on_ready=None):
+        """!
+        @brief   Capture images continuously into rotating buffers.
+        @details The returned stream gives a @c Frame for each complete
+                 image, with a sequence number and timestamp. Call
+                 @c release() on each frame when finished with it. To work on
+                 one frame while the next is read, capture from a coroutine
+                 (or call @c poll() from a task) and take the frames in
+                 another, e.g.
+                 @code
+                 frames = camera.stream()
+                 asyncio.create_task(frames.run())
+                 while True:
+                     frame = await frames.next_frame()
+                     process(frame.image)
+                     frame.release()
+                 @endcode
+                 The stream can also simply be iterated, which waits for each
+                 subpage in turn. Unlike @c get_image(), the image in a frame
+                 is not overwritten by the next capture.
+        @param   buffers The number of image buffers to rotate, 2 or 3
+        @param   block Whether to read the pixel RAM in burst transfers
+        @param   on_ready A function called with no arguments as soon as each
+                 subpage is ready, or @c None
+        @returns A @c FrameStream
+        """
+        return FrameStream(self._camera, buffers, block, on_ready)
+
+
+    def measure_fps(self, frames=10, block=True):
+        """!
+        @brief   Measure how many full images per second can be grabbed.
+        @details Calls @c get_image() @c frames times in a row and times the
+                 whole run, so the figure includes waiting for the camera as
+                 well as reading and decoding the pixel data.
+        @param   frames The number of images to grab for the measurement
+        @param   block Passed on to @c get_image() to choose the read method
+        @returns The measured frame rate in frames per second
+        """
+        begin = time.ticks_us()
+        for _ in range(frames):
+            self.get_image(block=block)
+        elapsed = time.ticks_diff(time.ticks_us(), begin)
+        return frames * 1_000_000 / elapsed
+
+
 # The test code sets up the sensor, then grabs and shows an image in a terminal
 # every ten and a half seconds or so.
 ## @cond NO_DOXY don't document the test code in the driver documentation
@@ -214,11 +676,23 @@ if __name__ == "__main__":
     scanhex = [f"0x{addr:X}" for addr in i2c_bus.scan()]
     print(f"I2C Scan: {scanhex}")
 
-    # Create the camera object and set it up in default mode
-    camera = MLX_Cam(i2c_bus)
+    # Create the camera object and set it up in default mode, or calibrated
+    # to show temperatures; see how much RAM the driver takes either way
+    calibrated = False
+    gc.collect()
+    free_before = gc.mem_free()
+    camera = MLX_Cam(i2c_bus, i2c_address, calibrated=calibrated,
+                     temperature=calibrated)
+    gc.collect()
+    print(f"Camera driver RAM: {free_before - gc.mem_free()} bytes")
+
+    # Run at 16 Hz and check what we actually get
+    period = camera.set_profile("balanced")
+    print(f"Frame period: {period:.1f} ms")
 
-    ctrl_reg_val = 0b0001101010000001
-    i2c_bus.writeto_mem(i2c_address, 0x800D, ctrl_reg_val.to_bytes(16, 'big'))
+    # Compare the burst pixel reads with the old one-word-per-pixel reads
+    print(f"Block read: {camera.measure_fps(block=True):.1f} fps")
+    print(f"Word read:  {camera.measure_fps(block=False):.1f} fps")
 
     while True:
         try:
@@ -227,6 +701,12 @@ if __name__ == "__main__":
             begintime = time.ticks_ms()
             image = camera.get_image()
             print(f" {time.ticks_diff(time.ticks_ms(), begintime)} ms")
+            if calibrated:
+                # Time the calibration alone by redoing both subpages
+                begintime = time.ticks_us()
+                camera._camera.process_image(0)
+                camera._camera.process_image(1)
+                print(f"Calibration: {time.ticks_diff(time.ticks_us(), begintime)} us/frame")
 
             # Can show image.v_ir, image.alpha, or image.buf; image.v_ir best?
             # Display pixellated grayscale or numbers in CSV format; the CSV
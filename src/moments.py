@@ -0,0 +1,145 @@
+'''!
+@file moments.py
+This file contains a class that measures the position, size and orientation of a target in a
+camera image from its image moments.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+from math import atan2, sqrt
+
+class Moments:
+    '''!
+    This class accumulates the raw image moments m00, m10, m01, m11, m20 and m02 of an image
+    in one pass. Each pixel adds its weight (its value in a weighted image, or 1 for a mask)
+    times x**i * y**j to moment mij, with x and y counted in whole pixels. The centroid is
+    reported to pixel centres, so a single pixel in column 0 has x = 0.5.
+    '''
+
+    def __init__(self, width=32, height=24):
+        '''!
+        Creates a moment accumulator for images of the given size.
+        @param width Integer number of pixel columns in the image
+        @param height Integer number of pixel rows in the image
+        '''
+        ## Width of the image in pixels
+        self.width = width
+        ## Height of the image in pixels
+        self.height = height
+        self.reset()
+
+    def reset(self):
+        '''!
+        Clears the accumulated moments.
+        '''
+        ## Total weight; the pixel count for a mask
+        self.m00 = 0
+        ## Weighted sum of x
+        self.m10 = 0
+        ## Weighted sum of y
+        self.m01 = 0
+        ## Weighted sum of x * y
+        self.m11 = 0
+        ## Weighted sum of x squared
+        self.m20 = 0
+        ## Weighted sum of y squared
+        self.m02 = 0
+
+    def accumulate(self, image=None, mask=None, label=None, bounds=None, offset=0):
+        '''!
+        Adds the moments of an image to the accumulated moments.
+        @param image Indexable image, row by row, of pixel weights, or None to weigh every selected pixel as 1
+        @param mask Indexable image, row by row, which selects the pixels to add, or None to add every pixel
+        @param label Value of the mask pixels to add, or None to add every nonzero mask pixel; use with a label image
+        @param bounds Tuple of x_min, x_max, y_min and y_max (inclusive) limiting the pixels visited, or None for the whole image
+        @param offset Value subtracted from every pixel weight, such as the mask threshold; weights that end up negative are skipped
+        @returns self, so the results can be read straight away
+        '''
+        width = self.width
+        if bounds is None:
+            x_min, x_max, y_min, y_max = 0, width - 1, 0, self.height - 1
+        else:
+            x_min, x_max, y_min, y_max = bounds
+
+        m00 = m10 = m01 = m11 = m20 = m02 = 0
+        for y in range(y_min, y_max + 1):
+            # Sum the row first so y only multiplies once per row
+            r00 = r10 = r20 = 0
+            idx = y * width + x_min
+            for x in range(x_min, x_max + 1):
+                if mask is not None:
+                    sel = mask[idx]
+                    if (label is None and not sel) or (label is not None and sel != label):
+                        idx += 1
+                        continue
+                weight = image[idx] - offset if image is not None else 1
+                idx += 1
+                if weight <= 0:
+                    continue
+                wx = weight * x
+                r00 += weight
+                r10 += wx
+                r20 += wx * x
+            if r00:
+                m00 += r00
+                m10 += r10
+                m01 += r00 * y
+                m11 += r10 * y
+                m20 += r20
+                m02 += r00 * y * y
+        self.m00 += m00
+        self.m10 += m10
+        self.m01 += m01
+        self.m11 += m11
+        self.m20 += m20
+        self.m02 += m02
+        return self
+
+    def area(self):
+        '''!
+        Gets the total weight, which is the number of pixels when no weight image is used.
+        @returns The zeroth moment m00
+        '''
+        return self.m00
+
+    def centroid(self):
+        '''!
+        Finds the centre of mass, measured to pixel centres.
+        @returns A tuple of the x and y centroid, or None if nothing was accumulated
+        '''
+        if not self.m00:
+            return None
+        return self.m10 / self.m00 + 0.5, self.m01 / self.m00 + 0.5
+
+    def _central(self):
+        '''!
+        Computes the second central moments, normalised by the total weight.
+        @returns A tuple of the x variance, y variance and xy covariance
+        '''
+        m00 = self.m00
+        x = self.m10 / m00
+        y = self.m01 / m00
+        return self.m20 / m00 - x * x, self.m02 / m00 - y * y, self.m11 / m00 - x * y
+
+    def spread(self):
+        '''!
+        Finds the standard deviations of the target along its major and minor axes, in pixels.
+        @returns A tuple of the major and minor spread, or None if nothing was accumulated
+        '''
+        if not self.m00:
+            return None
+        mu20, mu02, mu11 = self._central()
+        mean = (mu20 + mu02) / 2
+        diff = sqrt(((mu20 - mu02) / 2) ** 2 + mu11 * mu11)
+        return sqrt(max(mean + diff, 0)), sqrt(max(mean - diff, 0))
+
+    def orientation(self):
+        '''!
+        Finds the angle of the major axis of the target, measured from the x axis towards the y axis.
+        @returns The angle in radians between -pi/2 and pi/2, or None if nothing was accumulated
+        '''
+        if not self.m00:
+            return None
+        mu20, mu02, mu11 = self._central()
+        return 0.5 * atan2(2 * mu11, mu20 - mu02)
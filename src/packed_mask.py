@@ -0,0 +1,266 @@
+'''!
+@file packed_mask.py
+This file contains a class that stores a thresholded camera image as one bit per pixel and
+filters it with bitwise operations on whole rows.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+from array import array
+
+## Columns held by each row word, kept to 16 so every word and mask is a MicroPython small int
+HALF = const(16)
+
+def popcount(word):
+    '''!
+    Counts the set bits in a word of up to 16 bits.
+    @param word Integer word to count
+    @returns The number of set bits
+    '''
+    word -= (word >> 1) & 0x5555
+    word = (word & 0x3333) + ((word >> 2) & 0x3333)
+    word = (word + (word >> 4)) & 0x0F0F
+    return (word + (word >> 8)) & 0x1F
+
+
+class PackedMask:
+    '''!
+    This class implements a binary image stored as two 16-bit words per row: the first holds
+    columns 0 to 15 and the second columns 16 to 31, with bit n of a word set when the pixel in
+    column n of that half is a target pixel. Keeping the words to 16 bits means they, and every
+    shift and mask applied to them, stay MicroPython small ints, so no operation allocates.
+    Morphology works on whole row halves with shifts, ANDs and ORs, carrying the bit at the
+    boundary across, so filtering the mask takes a few operations per row rather than several
+    per pixel. Pixels outside the image count as background.
+    '''
+
+    def __init__(self, width=32, height=24):
+        '''!
+        Creates an empty mask.
+        @param width Integer number of pixel columns, at most 32
+        @param height Integer number of pixel rows
+        '''
+        if not 0 < width <= 2 * HALF:
+            raise ValueError('width must be 1 to 32 pixels')
+
+        ## Width of the mask in pixels
+        self.width = width
+        ## Height of the mask in pixels
+        self.height = height
+        ## Two words per row: rows[2 * row] for columns 0 to 15, rows[2 * row + 1] for 16 to 31
+        self.rows = array('H', bytes(4 * height))
+        self._scratch = array('H', bytes(4 * height))
+        ## Number of columns in each half of a row
+        self._widths = (min(width, HALF), max(width - HALF, 0))
+        self._full = ((1 << self._widths[0]) - 1, (1 << self._widths[1]) - 1)
+        # Bit-sliced column counters for column_sums(), enough planes to count every row
+        planes = 1
+        while (1 << planes) <= height:
+            planes += 1
+        self._planes = array('H', bytes(4 * planes))
+
+    def __len__(self):
+        '''!
+        Gets the number of pixels in the mask.
+        @returns The number of pixels in the mask
+        '''
+        return self.width * self.height
+
+    def __getitem__(self, idx):
+        '''!
+        Gets one pixel of the mask, indexed row by row like a camera image.
+        @param idx Integer pixel index
+        @returns 1 for a target pixel, otherwise 0
+        '''
+        row, col = divmod(idx, self.width)
+        return (self.rows[(row << 1) | (col >> 4)] >> (col & 15)) & 1
+
+    def clear(self):
+        '''!
+        Clears every pixel of the mask.
+        '''
+        for idx in range(2 * self.height):
+            self.rows[idx] = 0
+
+    def threshold(self, image, level, rows=None):
+        '''!
+        Sets the mask from an image, marking pixels hotter than a level as target pixels.
+        @param image Indexable image, row by row
+        @param level Pixels with a value greater than this are target pixels
+        @param rows A (first, last) pair of pixel rows, inclusive, to look at, or None for the whole
+                    image; the other rows are cleared
+        '''
+        first, last = rows if rows is not None else (0, self.height - 1)
+        words = self.rows
+        widths = self._widths
+        for row in range(self.height):
+            if row < first or row > last:
+                words[2 * row] = 0
+                words[2 * row + 1] = 0
+        for row in range(first, last + 1):
+            idx = row * self.width
+            for half in range(2):
+                word = 0
+                bit = 1
+                for _ in range(widths[half]):
+                    if image[idx] > level:
+                        word |= bit
+                    bit <<= 1
+                    idx += 1
+                words[2 * row + half] = word
+
+    def _spread(self, combine, masks):
+        '''!
+        Computes, for every row, the horizontal neighbourhood of each pixel with a row operation.
+        The shifted words carry the boundary bit from one half of the row to the other.
+        @param combine Function which combines a row word with its left and right shifted words
+        @param masks Pair of words the low and high combined words are limited to
+        @returns The scratch array holding the combined row words
+        '''
+        rows = self.rows
+        spread = self._scratch
+        full_lo, full_hi = self._full
+        mask_lo, mask_hi = masks
+        for row in range(self.height):
+            lo = rows[2 * row]
+            hi = rows[2 * row + 1]
+            spread[2 * row] = combine(lo, ((lo << 1) & full_lo), (lo >> 1) | ((hi & 1) << 15)) & mask_lo
+            spread[2 * row + 1] = combine(hi, ((hi << 1) | (lo >> 15)) & full_hi, hi >> 1) & mask_hi
+        return spread
+
+    def dilate(self):
+        '''!
+        Grows the target by one pixel in every direction, including diagonals.
+        '''
+        rows = self.rows
+        spread = self._spread(lambda word, left, right: word | left | right, self._full)
+        last = 2 * self.height - 2
+        for idx in range(2 * self.height):
+            word = spread[idx]
+            if idx > 1:
+                word |= spread[idx - 2]
+            if idx < last:
+                word |= spread[idx + 2]
+            rows[idx] = word
+
+    def erode(self):
+        '''!
+        Shrinks the target by one pixel from every direction, including diagonals.
+        Target pixels touching the edge of the image are removed.
+        '''
+        rows = self.rows
+        # Pixels on the left and right edges have a background neighbour outside the image
+        edge = self.width - 1
+        edges = [self._full[0] & ~1, self._full[1]]
+        edges[edge >> 4] &= ~(1 << (edge & 15))
+        spread = self._spread(lambda word, left, right: word & left & right, edges)
+        last = 2 * self.height - 2
+        for idx in range(2 * self.height):
+            if idx > 1 and idx < last:
+                rows[idx] = spread[idx - 2] & spread[idx] & spread[idx + 2]
+            else:
+                rows[idx] = 0
+
+    def remove_isolated(self):
+        '''!
+        Clears target pixels which have no target pixels among their eight neighbours.
+        '''
+        rows = self.rows
+        full_lo, full_hi = self._full
+        spread = self._spread(lambda word, left, right: word | left | right, self._full)
+        last = self.height - 1
+        for row in range(self.height):
+            lo = rows[2 * row]
+            hi = rows[2 * row + 1]
+            # Neighbours in the same row, then the three neighbours above and below
+            lo_near = ((lo << 1) & full_lo) | (lo >> 1) | ((hi & 1) << 15)
+            hi_near = (((hi << 1) | (lo >> 15)) & full_hi) | (hi >> 1)
+            if row:
+                lo_near |= spread[2 * row - 2]
+                hi_near |= spread[2 * row - 1]
+            if row < last:
+                lo_near |= spread[2 * row + 2]
+                hi_near |= spread[2 * row + 3]
+            rows[2 * row] = lo & lo_near
+            rows[2 * row + 1] = hi & hi_near
+
+    def count(self):
+        '''!
+        Counts the target pixels.
+        @returns The number of target pixels in the mask
+        '''
+        total = 0
+        for word in self.rows:
+            total += popcount(word)
+        return total
+
+    def row_sums(self, out):
+        '''!
+        Counts the target pixels in each row.
+        @param out Array with one entry per row which receives the counts
+        @returns out
+        '''
+        rows = self.rows
+        for row in range(self.height):
+            out[row] = popcount(rows[2 * row]) + popcount(rows[2 * row + 1])
+        return out
+
+    def column_sums(self, out):
+        '''!
+        Counts the target pixels in each column.
+        The rows are added into bit-sliced counters, one word per bit of the count for each half of
+        the row, so each row costs a few word operations however many pixels it has; each column's
+        count is then read back from the bit planes.
+        @param out Array with one entry per column which receives the counts
+        @returns out
+        '''
+        # planes[2 * k + half] holds bit k of the counts of that half's columns
+        planes = self._planes
+        num = len(planes)
+        for idx in range(num):
+            planes[idx] = 0
+        rows = self.rows
+        for idx in range(2 * self.height):
+            carry = rows[idx]
+            plane = idx & 1
+            while carry:
+                bits = planes[plane]
+                planes[plane] = bits ^ carry
+                carry &= bits
+                plane += 2
+        widths = self._widths
+        col = 0
+        for half in range(2):
+            for bit in range(widths[half]):
+                total = 0
+                for plane in range(half, num, 2):
+                    total |= ((planes[plane] >> bit) & 1) << (plane >> 1)
+                out[col] = total
+                col += 1
+        return out
+
+    def centroid(self):
+        '''!
+        Finds the centre of mass of all target pixels, measured to pixel centres.
+        The column sum is built from the bit planes of the column index: each row half adds
+        2**k times the number of its target pixels whose column has bit k set.
+        @returns A tuple of the x and y centroid, or None if the mask is empty
+        '''
+        rows = self.rows
+        area = 0
+        sum_x = 0
+        sum_y = 0
+        for row in range(self.height):
+            for half in range(2):
+                word = rows[2 * row + half]
+                if not word:
+                    continue
+                count = popcount(word)
+                area += count
+                sum_y += count * row
+                sum_x += (HALF * half * count + popcount(word & 0xAAAA) + 2 * popcount(word & 0xCCCC)
+                          + 4 * popcount(word & 0xF0F0) + 8 * popcount(word & 0xFF00))
+        if not area:
+            return None
+        return sum_x / area + 0.5, sum_y / area + 0.5
@@ -0,0 +1,114 @@
+'''!
+@file pyramid.py
+This file contains a class that bins a camera image into coarser images, so a target can be
+searched for in a few large cells before looking at single pixels.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+from array import array
+
+class ImagePyramid:
+    '''!
+    This class implements a two level image pyramid of an integer image. Level 1 holds the sums of
+    2x2 pixel blocks and level 2 the sums of 4x4 blocks, both built in one pass over the image into
+    preallocated arrays, along with the image's smallest and largest pixel. Summing blocks averages
+    away single-pixel noise, so a target shows up as a hot cell while a hot pixel does not.
+    '''
+
+    def __init__(self, width=32, height=24, mirror=False):
+        '''!
+        Creates an empty pyramid for images of the given size, which must be multiples of 4.
+        @param width Integer number of pixel columns in the image
+        @param height Integer number of pixel rows in the image
+        @param mirror If True, the levels are mirrored left to right, matching MLX_Cam.get_normalized()
+        '''
+        if width % 4 or height % 4:
+            raise ValueError('image size must be a multiple of 4 pixels')
+        ## Width of the image in pixels
+        self.width = width
+        ## Height of the image in pixels
+        self.height = height
+        ## Sums of 2x2 pixel blocks, row by row
+        self.level1 = array('i', bytes(4 * (width // 2) * (height // 2)))
+        ## Sums of 4x4 pixel blocks, row by row
+        self.level2 = array('i', bytes(4 * (width // 4) * (height // 4)))
+        ## Smallest pixel in the last image
+        self.min = 0
+        ## Largest pixel in the last image
+        self.max = 0
+        self._mirror = mirror
+
+    def build(self, data):
+        '''!
+        Bins an image into both levels.
+        @param data Indexable integer image, row by row, such as RawImage.pix
+        '''
+        width = self.width
+        half = width // 2
+        level1 = self.level1
+        level2 = self.level2
+        for idx in range(len(level1)):
+            level1[idx] = 0
+
+        low = high = data[0]
+        idx = 0
+        for row in range(self.height):
+            base = (row >> 1) * half
+            for col in range(width):
+                pix = data[idx]
+                idx += 1
+                if pix < low:
+                    low = pix
+                elif pix > high:
+                    high = pix
+                cell = half - 1 - (col >> 1) if self._mirror else col >> 1
+                level1[base + cell] += pix
+        self.min = low
+        self.max = high
+
+        # Each level 2 cell is four level 1 cells
+        quarter = width // 4
+        for row in range(self.height // 4):
+            top = 2 * row * half
+            for col in range(quarter):
+                idx = top + 2 * col
+                level2[row * quarter + col] = (level1[idx] + level1[idx + 1]
+                                               + level1[idx + half] + level1[idx + half + 1])
+
+    def peak(self, level=2):
+        '''!
+        Finds the hottest cell of a level.
+        @param level 1 for the 2x2 blocks or 2 for the 4x4 blocks
+        @returns A tuple of the cell's column, row and sum
+        '''
+        cells = self.level2 if level == 2 else self.level1
+        cols = self.width >> level
+        best = 0
+        for idx in range(1, len(cells)):
+            if cells[idx] > cells[best]:
+                best = idx
+        return best % cols, best // cols, cells[best]
+
+    def mean(self, level=2):
+        '''!
+        Finds the average cell sum of a level.
+        @param level 1 for the 2x2 blocks or 2 for the 4x4 blocks
+        @returns The average cell sum
+        '''
+        cells = self.level2 if level == 2 else self.level1
+        return sum(cells) / len(cells)
+
+    def window(self, level, col, row, margin=0):
+        '''!
+        Finds the pixels covered by a cell, plus a margin.
+        @param level 1 for the 2x2 blocks or 2 for the 4x4 blocks
+        @param col Integer column of the cell
+        @param row Integer row of the cell
+        @param margin Integer number of pixels added on every side
+        @returns A tuple of x_min, x_max, y_min and y_max in pixels (inclusive), clipped to the image
+        '''
+        size = 1 << level
+        return (max(col * size - margin, 0), min((col + 1) * size - 1 + margin, self.width - 1),
+                max(row * size - margin, 0), min((row + 1) * size - 1 + margin, self.height - 1))
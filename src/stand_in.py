@@ -0,0 +1,285 @@
+'''!
+@file stand_in.py
+This file contains stand-ins for the turret hardware, so the asyncio turret runtime can be run
+and tried out under CPython on a computer, with a simulated turret and target.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+import sys
+
+try:
+    import utime
+except ImportError:
+    # CPython has no utime, so make one from time with the same wrap-around ticks
+    import time
+    import types
+
+    _TICKS_PERIOD = 1 << 30
+    _TICKS_HALF = _TICKS_PERIOD // 2
+    utime = types.ModuleType('utime')
+    utime.ticks_ms = lambda: int(time.perf_counter() * 1000) & (_TICKS_PERIOD - 1)
+    utime.ticks_us = lambda: int(time.perf_counter() * 1_000_000) & (_TICKS_PERIOD - 1)
+    utime.ticks_add = lambda ticks, delta: (ticks + delta) & (_TICKS_PERIOD - 1)
+    utime.ticks_diff = lambda end, start: ((end - start + _TICKS_HALF) & (_TICKS_PERIOD - 1)) - _TICKS_HALF
+    utime.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    utime.sleep_us = lambda us: time.sleep(us / 1_000_000)
+    sys.modules['utime'] = utime
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+from array import array
+
+class Axis:
+    '''!
+    This class simulates a motor turning a turret axis. The speed follows the duty cycle with a
+    first order lag, and the position is worked out from the real time between calls.
+    '''
+
+    def __init__(self, max_speed=200000, time_constant=0.05):
+        '''!
+        Creates a stopped axis at position 0.
+        @param max_speed Speed at 100 % duty cycle, in encoder ticks per second
+        @param time_constant Time constant of the speed in seconds
+        '''
+        ## Speed at 100 % duty cycle, in encoder ticks per second
+        self.max_speed = max_speed
+        ## Time constant of the speed in seconds
+        self.time_constant = time_constant
+        ## Position in encoder ticks
+        self.position = 0.0
+        ## Speed in encoder ticks per second
+        self.speed = 0.0
+        ## Duty cycle driving the axis, in percent
+        self.duty = 0
+        self._time = utime.ticks_us()
+
+    def update(self):
+        '''!
+        Moves the axis on to the current time.
+        '''
+        now = utime.ticks_us()
+        dt = utime.ticks_diff(now, self._time) / 1_000_000
+        self._time = now
+        if dt > 0:
+            self.speed += (self.duty / 100 * self.max_speed - self.speed) * dt / (self.time_constant + dt)
+            self.position += self.speed * dt
+
+
+class Motor:
+    '''!
+    This class stands in for a MotorDriver driving a simulated axis.
+    '''
+
+    def __init__(self, axis):
+        '''!
+        Creates a disabled motor.
+        @param axis Axis the motor turns
+        '''
+        ## Axis the motor turns
+        self.axis = axis
+        ## Whether the motor is enabled
+        self.enabled = False
+        self._level = 0
+
+    def enable_motor(self):
+        '''!
+        Enables the motor.
+        '''
+        self.enabled = True
+        self.set_duty_cycle(self._level)
+
+    def disable_motor(self):
+        '''!
+        Disables the motor, which then coasts to a stop.
+        '''
+        self.enabled = False
+        self.set_duty_cycle(self._level)
+
+    def set_duty_cycle(self, level):
+        '''!
+        Drives the motor at a given duty cycle.
+        @param level PWM duty cycle from -100 to 100; larger values are limited
+        '''
+        self._level = max(-100, min(100, level))
+        self.axis.update()
+        self.axis.duty = self._level if self.enabled else 0
+
+
+class Encoder:
+    '''!
+    This class stands in for an EncoderReader on a simulated axis.
+    '''
+
+    def __init__(self, axis):
+        '''!
+        Creates an encoder reading the axis position.
+        @param axis Axis the encoder is on
+        '''
+        ## Axis the encoder is on
+        self.axis = axis
+        ## Position at the last read, in encoder ticks
+        self.position = 0
+
+    def zero(self):
+        '''!
+        Sets the current position to zero.
+        '''
+        self.axis.update()
+        self.axis.position = 0.0
+        self.position = 0
+
+    def read(self):
+        '''!
+        Reads the position of the axis.
+        @returns The position in encoder ticks
+        '''
+        self.axis.update()
+        self.position = int(self.axis.position)
+        return self.position
+
+
+class Servo:
+    '''!
+    This class stands in for a ServoDriver, remembering its position.
+    '''
+
+    def __init__(self):
+        '''!
+        Creates a servo at position 0.
+        '''
+        ## Last position set
+        self.position = 0
+
+    def set_position(self, position):
+        '''!
+        Moves the servo.
+        @param position Position from -100 to 100
+        '''
+        self.position = position
+
+
+class Pin:
+    '''!
+    This class stands in for an output pyb.Pin, remembering its level.
+    '''
+
+    def __init__(self):
+        '''!
+        Creates a low pin.
+        '''
+        self._value = 0
+
+    def high(self):
+        '''!
+        Sets the pin high.
+        '''
+        self._value = 1
+
+    def low(self):
+        '''!
+        Sets the pin low.
+        '''
+        self._value = 0
+
+    def value(self):
+        '''!
+        Reads the pin level.
+        @returns 1 if the pin is high, otherwise 0
+        '''
+        return self._value
+
+
+class RawImage:
+    '''!
+    This class stands in for the camera driver's RawImage.
+    '''
+
+    def __init__(self, width, height):
+        '''!
+        Creates a blank image.
+        @param width Integer number of pixel columns
+        @param height Integer number of pixel rows
+        '''
+        ## Pixel values, row by row
+        self.pix = array('H', bytes(2 * width * height))
+
+
+class Camera:
+    '''!
+    This class stands in for MLX_Cam, showing a simulated target moving at a constant angular
+    speed. Each subpage, the target is drawn as a hot pixel where the camera model puts it, given
+    the turret's horizontal angle; it stays on the middle row.
+    '''
+
+    def __init__(self, axis, lens, target_angle=180, target_speed=0, frame_period=31.25,
+                 background=1000, heat=200):
+        '''!
+        Creates a camera.
+        @param axis Horizontal Axis the camera turns with
+        @param lens CameraModel of the camera
+        @param target_angle Horizontal target angle when the camera is created, in degrees
+        @param target_speed Horizontal target speed in degrees per second
+        @param frame_period Time for both subpages, in milliseconds
+        @param background Raw value of pixels without a target
+        @param heat Raw value added where the target is
+        '''
+        ## Horizontal Axis the camera turns with
+        self.axis = axis
+        ## CameraModel of the camera
+        self.lens = lens
+        ## Horizontal target speed in degrees per second
+        self.target_speed = target_speed
+        ## Time for both subpages, in milliseconds
+        self.frame_period = frame_period
+        ## Image holding the last subpage
+        self.image = RawImage(lens.width, lens.height)
+        self._start_angle = target_angle
+        self._start = utime.ticks_ms()
+        self._subpage = 1
+        self._background = background
+        self._heat = heat
+
+    def target_angle(self, time=None):
+        '''!
+        Finds the horizontal target angle.
+        @param time Integer time from utime.ticks_ms(), or None for now
+        @returns The target angle in degrees
+        '''
+        if time is None:
+            time = utime.ticks_ms()
+        return self._start_angle + self.target_speed * utime.ticks_diff(time, self._start) / 1000
+
+    def _render(self):
+        '''!
+        Draws the target where the camera sees it.
+        '''
+        self.axis.update()
+        turret = self.axis.position / self.lens.x_tick_ratio
+        # The camera model gives the angle from the target to the turret for each pixel
+        offset = turret - self.target_angle()
+        col = min(range(self.lens.width), key=lambda c: abs(self.lens.angles(c + 0.5, 0)[0] - offset))
+        pix = self.image.pix
+        for idx in range(len(pix)):
+            pix[idx] = self._background
+        pix[(self.lens.height // 2) * self.lens.width + col] += self._heat
+
+    async def next_frame(self, block=True, rows=None, on_ready=None, poll_ms=1, timeout_ms=None):
+        '''!
+        Waits for the next subpage while other coroutines run, like MLX_Cam.next_frame().
+        @param block Ignored
+        @param rows Ignored; the whole image is drawn
+        @param on_ready A function called with no arguments as soon as the subpage is ready
+        @param poll_ms Ignored
+        @param timeout_ms Ignored; the stand-in always has a subpage
+        @returns A tuple of the image and the number (0 or 1) of the subpage
+        '''
+        await asyncio.sleep(self.frame_period / 2000)
+        if on_ready is not None:
+            on_ready()
+        self._render()
+        self._subpage ^= 1
+        return self.image, self._subpage
@@ -0,0 +1,180 @@
+'''!
+@file task_scheduler.py
+This file contains classes that run several generator tasks in turn, each at its own period,
+so no part of the turret program has to wait for another.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+import utime
+
+class Task:
+    '''!
+    This class wraps a generator as a cooperative task. Each run advances the generator to its
+    next yield, so the task must yield often and never sleep; it keeps its state in the generator
+    between runs. A task with a period runs at a fixed rate, skipping runs it has fallen too far
+    behind for; a task with no period runs on every pass of the scheduler. The time of every run
+    is measured, and runs which finish more than the deadline after the task was due are counted
+    as misses.
+    '''
+
+    def __init__(self, gen_fun, name, period=0, deadline=None, priority=0):
+        '''!
+        Creates a task.
+        @param gen_fun Generator function of the task, called once with no arguments
+        @param name String name of the task, for the report
+        @param period Integer time between runs in milliseconds, or 0 to run on every pass
+        @param deadline Integer longest time in milliseconds from the task being due until its run finishes, or None for no deadline
+        @param priority Integer priority; on each pass, tasks run from the highest priority to the lowest
+        '''
+        ## Name of the task
+        self.name = name
+        ## Time between runs in microseconds, or 0 to run on every pass
+        self.period = period * 1000
+        ## Longest time from due to finished in microseconds, or None
+        self.deadline = None if deadline is None else deadline * 1000
+        ## Priority of the task
+        self.priority = priority
+        ## Number of runs
+        self.runs = 0
+        ## Total run time in microseconds
+        self.run_time = 0
+        ## Longest run in microseconds
+        self.max_time = 0
+        ## Number of runs which missed the deadline
+        self.misses = 0
+        ## Number of runs skipped because the task fell more than a period behind
+        self.skipped = 0
+        ## Whether the generator has returned
+        self.done = False
+        self._gen = gen_fun()
+        self._due = utime.ticks_us()
+
+    def ready(self, now):
+        '''!
+        Checks whether the task is due to run.
+        @param now Integer time from utime.ticks_us()
+        @returns True if the task should run now
+        '''
+        if self.done:
+            return False
+        if not self.period:
+            self._due = now
+            return True
+        return utime.ticks_diff(now, self._due) >= 0
+
+    def run(self):
+        '''!
+        Runs the task until its next yield and measures the run.
+        @returns The value the task yielded, or None if it has returned
+        '''
+        start = utime.ticks_us()
+        try:
+            value = next(self._gen)
+        except StopIteration:
+            self.done = True
+            value = None
+        end = utime.ticks_us()
+
+        duration = utime.ticks_diff(end, start)
+        self.runs += 1
+        self.run_time += duration
+        if duration > self.max_time:
+            self.max_time = duration
+        if self.deadline is not None and utime.ticks_diff(end, self._due) > self.deadline:
+            self.misses += 1
+
+        if self.period:
+            self._due = utime.ticks_add(self._due, self.period)
+            behind = utime.ticks_diff(end, self._due)
+            if behind >= self.period:
+                # Too far behind to catch up, so start again from now
+                self.skipped += behind // self.period
+                self._due = utime.ticks_add(end, self.period)
+        return value
+
+    def reset_stats(self):
+        '''!
+        Clears the run counts and times.
+        '''
+        self.runs = 0
+        self.run_time = 0
+        self.max_time = 0
+        self.misses = 0
+        self.skipped = 0
+
+
+class TaskScheduler:
+    '''!
+    This class implements a cooperative scheduler. Each pass runs every task which is due, highest
+    priority first. The share of the time since the start spent in each task is its CPU use.
+    Interrupts and scheduled callbacks, such as a ControlScheduler step, count towards whichever
+    task they interrupted.
+    '''
+
+    def __init__(self):
+        '''!
+        Creates a scheduler with no tasks.
+        '''
+        ## Tasks, highest priority first
+        self.tasks = []
+        ## Whether run() keeps going
+        self.running = False
+        self._start = utime.ticks_us()
+
+    def add(self, task):
+        '''!
+        Adds a task.
+        @param task Task to run
+        @returns The task
+        '''
+        self.tasks.append(task)
+        self.tasks.sort(key=lambda t: -t.priority)
+        return task
+
+    def run_once(self):
+        '''!
+        Runs every task which is due once.
+        '''
+        for task in self.tasks:
+            if task.ready(utime.ticks_us()):
+                task.run()
+
+    def run(self):
+        '''!
+        Runs passes until stop() is called, by a task or otherwise.
+        '''
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        '''!
+        Makes run() return after the current pass.
+        '''
+        self.running = False
+
+    def reset_stats(self):
+        '''!
+        Clears the run counts and times of every task and restarts the CPU use measurement.
+        '''
+        for task in self.tasks:
+            task.reset_stats()
+        self._start = utime.ticks_us()
+
+    def report(self):
+        '''!
+        Describes the run time and CPU use of every task.
+        @returns A string with one line per task and a line for the time spent outside the tasks
+        '''
+        elapsed = utime.ticks_diff(utime.ticks_us(), self._start) or 1
+        lines = ['Task        runs   avg us   max us  misses skipped   cpu %']
+        busy = 0
+        for task in self.tasks:
+            busy += task.run_time
+            average = task.run_time // task.runs if task.runs else 0
+            lines.append(f"{task.name:<10}{task.runs:>6}{average:>9}{task.max_time:>9}"
+                         f"{task.misses:>8}{task.skipped:>8}{100 * task.run_time / elapsed:>8.1f}")
+        lines.append(f"{'(other)':<10}{'':>6}{'':>9}{'':>9}{'':>8}{'':>8}{100 * (elapsed - busy) / elapsed:>8.1f}")
+        return '\n'.join(lines)
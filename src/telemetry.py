@@ -0,0 +1,146 @@
+'''!
+@file telemetry.py
+This file contains a class that records controller data into fixed-size buffers, so logging
+uses the same memory however long the turret runs.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+import struct
+from array import array
+
+## Column names, in the order they are stored and dumped
+COLUMNS = ('time', 'setpoint', 'position', 'pwm')
+## Header of a binary dump: magic, number of samples, number of columns, bytes per item
+DUMP_HEADER = '<4sHBB'
+## Magic bytes at the start of a binary dump
+DUMP_MAGIC = b'TLM1'
+
+class TelemetryRecorder:
+    '''!
+    This class implements a ring buffer of controller samples in preallocated integer arrays, one
+    per column: time in ms, setpoint and position in encoder ticks, and pwm in hundredths of a
+    percent. When full, the oldest samples are overwritten. Only every n-th sample can be kept
+    (decimation). For a capture window around an event, arm() the recorder with a number of
+    samples to keep from before the event, then call trigger() when it happens; recording stops
+    by itself once the rest of the buffer has filled after the trigger.
+    '''
+
+    def __init__(self, capacity=200, decimation=1):
+        '''!
+        Creates an empty recorder.
+        @param capacity Integer number of samples kept
+        @param decimation Integer; only one sample in this many is kept
+        '''
+        ## Number of samples kept
+        self.capacity = capacity
+        ## Only one sample in this many is kept
+        self.decimation = decimation
+        ## One array per column, in the order of COLUMNS
+        self.columns = tuple(array('l', (0 for _ in range(capacity))) for _ in COLUMNS)
+        ## Number of valid samples in the buffer
+        self.count = 0
+        self._head = 0
+        self._skip = 0
+        self._armed = False
+        self._pre_trigger = 0
+        self._remaining = -1
+
+    def clear(self):
+        '''!
+        Empties the buffer and cancels any trigger, so recording runs freely again.
+        '''
+        self.count = 0
+        self._head = 0
+        self._skip = 0
+        self._armed = False
+        self._remaining = -1
+
+    @property
+    def stopped(self):
+        '''!
+        Whether a triggered capture is complete and recording has stopped.
+        '''
+        return self._remaining == 0
+
+    def arm(self, pre_trigger):
+        '''!
+        Prepares a capture window, which starts when trigger() is called.
+        @param pre_trigger Integer number of samples to keep from before the trigger
+        '''
+        self.clear()
+        self._armed = True
+        self._pre_trigger = min(pre_trigger, self.capacity)
+
+    def trigger(self):
+        '''!
+        Marks the event of an armed capture. The buffer then fills up after it and stops, keeping
+        up to pre_trigger samples from before. Does nothing if the recorder isn't armed.
+        '''
+        if self._armed:
+            self._armed = False
+            self._remaining = self.capacity - min(self.count, self._pre_trigger)
+
+    def record(self, time, setpoint, position, pwm):
+        '''!
+        Adds a sample, subject to decimation. Nothing is allocated.
+        @param time Integer time in ms
+        @param setpoint Setpoint in encoder ticks
+        @param position Integer position in encoder ticks
+        @param pwm Pwm output in percent
+        '''
+        if self._remaining == 0:
+            return
+        if self._skip:
+            self._skip -= 1
+            return
+        self._skip = self.decimation - 1
+
+        head = self._head
+        time_col, setpoint_col, position_col, pwm_col = self.columns
+        time_col[head] = time
+        setpoint_col[head] = int(setpoint)
+        position_col[head] = position
+        pwm_col[head] = int(pwm * 100)
+        head += 1
+        self._head = 0 if head == self.capacity else head
+        if self.count < self.capacity:
+            self.count += 1
+        if self._remaining > 0:
+            self._remaining -= 1
+
+    def _spans(self):
+        '''!
+        Finds where the samples are in the buffer, oldest first.
+        @returns A tuple of up to two (start, end) index pairs
+        '''
+        start = self._head - self.count
+        if start >= 0:
+            return ((start, self._head),)
+        return ((start + self.capacity, self.capacity), (0, self._head))
+
+    def samples(self, column):
+        '''!
+        Iterates over one column of samples, oldest first.
+        @param column Integer column index or name from COLUMNS
+        '''
+        if not isinstance(column, int):
+            column = COLUMNS.index(column)
+        data = self.columns[column]
+        for start, end in self._spans():
+            for idx in range(start, end):
+                yield data[idx]
+
+    def dump(self, stream):
+        '''!
+        Writes all samples to a stream or file in one binary block: a DUMP_HEADER header, then
+        each column in the order of COLUMNS, oldest sample first, as native-endian integers.
+        @param stream Object with a write() method taking bytes, such as an open file or a UART
+        '''
+        stream.write(struct.pack(DUMP_HEADER, DUMP_MAGIC, self.count, len(COLUMNS),
+                                 struct.calcsize('l')))
+        for data in self.columns:
+            view = memoryview(data)
+            for start, end in self._spans():
+                stream.write(view[start:end])
@@ -0,0 +1,112 @@
+'''!
+@file tracker.py
+This file contains a class that follows a moving target and predicts where it will be, so the
+turret can aim ahead of it.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+import utime
+
+class TargetTracker:
+    '''!
+    This class implements an alpha-beta filter with a constant velocity model in both turret axes.
+    Each measured target position corrects the predicted position by alpha times the error, and
+    the velocity by beta times the error divided by the time step. The velocity starts from the
+    first two measurements, so a prediction is useful after two images.
+    '''
+
+    def __init__(self, alpha=0.5, beta=0.2, max_speed=90, max_gap=500):
+        '''!
+        Creates a tracker with no target.
+        @param alpha Float from 0 to 1, the share of the position error taken from each measurement
+        @param beta Float from 0 to 1, the share of the implied velocity error taken from each measurement
+        @param max_speed Largest target speed that is believed, in degrees per second
+        @param max_gap Integer time in milliseconds without a measurement after which the target counts as lost
+        '''
+        ## Share of the position error corrected by each measurement
+        self.alpha = alpha
+        ## Share of the velocity error corrected by each measurement
+        self.beta = beta
+        ## Largest target speed that is believed, in degrees per second
+        self.max_speed = max_speed
+        ## Time in milliseconds without a measurement after which the target counts as lost
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        '''!
+        Forgets the target.
+        '''
+        ## Estimated horizontal target angle, in degrees
+        self.x = 0.0
+        ## Estimated vertical target angle, in degrees
+        self.y = 0.0
+        ## Estimated horizontal target speed, in degrees per second
+        self.vx = 0.0
+        ## Estimated vertical target speed, in degrees per second
+        self.vy = 0.0
+        ## Number of measurements since the target was found
+        self.count = 0
+        ## Time of the last measurement, from utime.ticks_ms()
+        self.time = 0
+
+    def _clamp(self, speed):
+        '''!
+        Limits a speed to the largest believable target speed.
+        @param speed Float speed in degrees per second
+        @returns The limited speed
+        '''
+        if speed > self.max_speed:
+            return self.max_speed
+        if speed < -self.max_speed:
+            return -self.max_speed
+        return speed
+
+    def update(self, x, y, time):
+        '''!
+        Corrects the estimate with a measured target position.
+        @param x Float measured horizontal target angle, in degrees
+        @param y Float measured vertical target angle, in degrees
+        @param time Integer time the measurement was taken, from utime.ticks_ms()
+        '''
+        dt = utime.ticks_diff(time, self.time)
+        if not self.count or dt > self.max_gap:
+            # New or lost target: start again from this measurement
+            self.x = x
+            self.y = y
+            self.vx = self.vy = 0.0
+            self.count = 1
+            self.time = time
+            return
+        if dt <= 0:
+            return
+
+        dt /= 1000
+        if self.count == 1:
+            # Two measurements give the first velocity
+            self.vx = self._clamp((x - self.x) / dt)
+            self.vy = self._clamp((y - self.y) / dt)
+            self.x = x
+            self.y = y
+        else:
+            px = self.x + self.vx * dt
+            py = self.y + self.vy * dt
+            rx = x - px
+            ry = y - py
+            self.x = px + self.alpha * rx
+            self.y = py + self.alpha * ry
+            self.vx = self._clamp(self.vx + self.beta * rx / dt)
+            self.vy = self._clamp(self.vy + self.beta * ry / dt)
+        self.count += 1
+        self.time = time
+
+    def predict(self, time):
+        '''!
+        Predicts where the target will be, assuming it keeps its current velocity.
+        @param time Integer time of the prediction, from utime.ticks_ms()
+        @returns A tuple of the horizontal and vertical target angle in degrees
+        '''
+        dt = utime.ticks_diff(time, self.time) / 1000
+        return self.x + self.vx * dt, self.y + self.vy * dt
@@ -0,0 +1,72 @@
+'''!
+@file turret_pose.py
+This file contains a class that records where the turret was pointing when each camera image
+was captured, so target angles measured in the image can be combined with the right turret angles.
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+import utime
+
+class TurretPose:
+    '''!
+    This class keeps the last two snapshots of both encoder positions with their times. A
+    snapshot is meant to be taken the moment the camera has new data, and the turret position
+    at any time around then is interpolated (or extrapolated) from the two snapshots.
+    '''
+
+    def __init__(self, encoder1, encoder2, shared=()):
+        '''!
+        Creates a pose recorder for two encoders.
+        @param encoder1 EncoderReader of the horizontal axis
+        @param encoder2 EncoderReader of the vertical axis
+        @param shared Encoders read by a ControlScheduler at its own rate; snapshots take their
+                      position from the last read instead of reading them
+        '''
+        ## EncoderReader of the horizontal axis
+        self.encoder1 = encoder1
+        ## EncoderReader of the vertical axis
+        self.encoder2 = encoder2
+        ## Time of the last snapshot, from utime.ticks_us()
+        self.time = 0
+        ## Time of the last snapshot, from utime.ticks_ms()
+        self.time_ms = 0
+        ## Horizontal encoder position at the last snapshot
+        self.pos1 = 0
+        ## Vertical encoder position at the last snapshot
+        self.pos2 = 0
+        self._poll1 = encoder1 not in shared
+        self._poll2 = encoder2 not in shared
+        self._prev_time = 0
+        self._prev_pos1 = 0
+        self._prev_pos2 = 0
+        self._count = 0
+
+    def capture(self):
+        '''!
+        Takes a snapshot of both encoder positions, keeping the one before it.
+        '''
+        self._prev_time = self.time
+        self._prev_pos1 = self.pos1
+        self._prev_pos2 = self.pos2
+        self.time = utime.ticks_us()
+        self.time_ms = utime.ticks_ms()
+        self.pos1 = self.encoder1.read() if self._poll1 else self.encoder1.position
+        self.pos2 = self.encoder2.read() if self._poll2 else self.encoder2.position
+        if self._count < 2:
+            self._count += 1
+
+    def at(self, time):
+        '''!
+        Estimates both encoder positions at a time near the last snapshot, assuming the turret
+        moved at a constant speed between the last two snapshots.
+        @param time Integer time from utime.ticks_us()
+        @returns A tuple of the horizontal and vertical encoder positions
+        '''
+        span = utime.ticks_diff(self.time, self._prev_time)
+        if self._count < 2 or span <= 0:
+            return self.pos1, self.pos2
+        frac = utime.ticks_diff(time, self.time) / span
+        return (self.pos1 + (self.pos1 - self._prev_pos1) * frac,
+                self.pos2 + (self.pos2 - self._prev_pos2) * frac)
@@ -0,0 +1,344 @@
+'''!
+@file turret_runtime.py
+This file contains an asyncio version of the turret program, in which the control loops, the
+camera and the firing sequence are coroutines that wait without holding each other up. It runs
+under MicroPython's uasyncio on the turret, and under CPython's asyncio with the stand-in
+hardware from stand_in.py (run this file on a computer to try it).
+
+@author Jackie Chen, Richard Kwan, Chayton Ritter
+@date 18-Oct-2026
+'''
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    # CPython: stand_in provides utime
+    import asyncio
+    import stand_in
+import utime
+
+class TurretRuntime:
+    '''!
+    This class runs a turret duel as coroutines. Each axis's controller runs in its own periodic
+    coroutine, and another keeps measuring the target in each new subpage. The duel itself turns
+    the turret around, measures the target's motion, aims where the target will be when the dart
+    leaves, waits for the horizontal axis to settle and awaits the firing sequence, while the
+    other coroutines keep running. A safety coroutine stops the duel and disables everything if
+    the horizontal axis turns too far or the camera stops sending subpages. The hardware is passed
+    in, so stand-ins can take its place.
+    '''
+
+    def __init__(self, measure, axes, servo, trigger_pin, target_tracker, lens,
+                 turn_angle=180, turn_time=5000, track_updates=8, adjust_timeout=500,
+                 spin_up_time=2000, plunger_step=200, plunger_sequence=(-100, 20, -100, 20, -100),
+                 control_period=5, pre_trigger=20, on_turned=None, on_aim=None, ready=None,
+                 travel_limit=None, camera_timeout=500, safety_period=50, relearns=0):
+        '''!
+        Creates a turret runtime.
+        @param measure Coroutine function which waits for the next subpage and returns a tuple of
+                       whether a target was found, its horizontal and vertical angle in degrees,
+                       and the time it was captured, from utime.ticks_ms()
+        @param axes Horizontal and vertical (MotorDriver, EncoderReader, pid_loop) tuples; a motor
+                    of None runs the controller without driving anything
+        @param servo ServoDriver of the plunger
+        @param trigger_pin Pin which turns the flywheels on
+        @param target_tracker TargetTracker which follows the target
+        @param lens CameraModel which converts angles into encoder ticks
+        @param turn_angle Angle the turret turns at the start, in degrees
+        @param turn_time Integer time allowed for the turn, in ms
+        @param track_updates Integer number of measurements used to find the target's motion before aiming
+        @param adjust_timeout Integer longest time to wait for the turret to settle on the target, in ms
+        @param spin_up_time Integer time for the flywheels to get to speed, in ms
+        @param plunger_step Integer time the plunger holds each position, in ms
+        @param plunger_sequence Plunger positions in turn
+        @param control_period Integer time between controller runs, in ms
+        @param pre_trigger Integer number of telemetry samples kept from before the aiming move
+        @param on_turned Function called with no arguments once the turret has turned, or None
+        @param on_aim Function called with no arguments when the turret starts aiming, or None
+        @param ready Function called with no arguments which returns whether measurements count
+                     towards track_updates yet, such as once a background has been learned, or None
+                     to count them all
+        @param travel_limit Furthest the horizontal axis may turn from zero, in encoder ticks, or
+                            None for no limit
+        @param camera_timeout Integer longest time without a measurement while tracking, in ms
+        @param safety_period Integer time between safety checks, in ms
+        @param relearns Integer number of times to call on_turned again, to learn the view again,
+                        if none of the measurements counted towards track_updates found the target
+        '''
+        ## Coroutine function which measures the target in the next subpage
+        self.measure = measure
+        ## Horizontal and vertical (motor, encoder, controller) tuples
+        self.axes = tuple(axes)
+        ## Servo of the plunger
+        self.servo = servo
+        ## Pin which turns the flywheels on
+        self.trigger_pin = trigger_pin
+        ## Tracker which follows the target
+        self.tracker = target_tracker
+        ## Camera model which converts angles into encoder ticks
+        self.lens = lens
+        ## Angle the turret turns at the start, in degrees
+        self.turn_angle = turn_angle
+        ## Time allowed for the turn, in ms
+        self.turn_time = turn_time
+        ## Measurements used to find the target's motion before aiming
+        self.track_updates = track_updates
+        ## Longest time to wait for the turret to settle, in ms
+        self.adjust_timeout = adjust_timeout
+        ## Time for the flywheels to get to speed, in ms
+        self.spin_up_time = spin_up_time
+        ## Time the plunger holds each position, in ms
+        self.plunger_step = plunger_step
+        ## Plunger positions in turn
+        self.plunger_sequence = plunger_sequence
+        ## Time from the turret settling to the dart leaving, in ms (spin up, first push)
+        self.shot_lead = spin_up_time + plunger_step
+        ## Time between controller runs, in ms
+        self.control_period = control_period
+        ## Telemetry samples kept from before the aiming move
+        self.pre_trigger = pre_trigger
+        ## Number of measurements counted towards track_updates since tracking started
+        self.updates = 0
+        ## Number of those measurements which found the target
+        self.finds = 0
+        ## Times to learn the view again if the counted measurements don't find the target
+        self.relearns = relearns
+        self._on_turned = on_turned
+        self._on_aim = on_aim
+        self._ready = ready
+        ## Furthest the horizontal axis may turn, in encoder ticks, or None
+        self.travel_limit = travel_limit
+        ## Longest time without a measurement while tracking, in ms
+        self.camera_timeout = camera_timeout
+        ## Time between safety checks, in ms
+        self.safety_period = safety_period
+        ## Reason the safety coroutine stopped the last duel, or None
+        self.fault = None
+        self._last_measured = None
+        self._follow = False
+        self._fire_time = None
+        self._last = (0.0, 0.0)
+        self._measured = None
+
+    def make_safe(self):
+        '''!
+        Disables everything.
+        '''
+        self.servo.set_position(20)
+        self.trigger_pin.low()
+        for motor, encoder, controller in self.axes:
+            if motor is not None:
+                motor.disable_motor()
+
+    async def control_loop(self, motor, encoder, controller):
+        '''!
+        Runs a controller every control period until cancelled. If it falls behind, it starts
+        again from the current time rather than running several times in a row.
+        @param motor MotorDriver the controller drives, or None
+        @param encoder EncoderReader of the axis
+        @param controller pid_loop of the axis
+        '''
+        next_time = utime.ticks_ms()
+        while True:
+            pwm = controller.run(encoder.read())
+            if motor is not None:
+                motor.set_duty_cycle(pwm)
+            next_time = utime.ticks_add(next_time, self.control_period)
+            delay = utime.ticks_diff(next_time, utime.ticks_ms())
+            if delay < 0:
+                next_time = utime.ticks_ms()
+                delay = 0
+            await asyncio.sleep(delay / 1000)
+
+    def _steer(self, fire_time, follow):
+        '''!
+        Sets the setpoints where the target will be when the dart leaves.
+        @param fire_time Integer time the dart leaves, from utime.ticks_ms()
+        @param follow If True, also feed the target's speed forward to the controllers
+        '''
+        if self.tracker.count:
+            x_angle, y_angle = self.tracker.predict(fire_time)
+        else:
+            x_angle, y_angle = self._last
+        setpoints = self.lens.to_ticks(x_angle, y_angle)
+        if follow:
+            velocities = (self.tracker.vx * self.lens.x_tick_ratio, self.tracker.vy * self.lens.y_tick_ratio)
+        else:
+            velocities = (0, 0)
+        for (motor, encoder, controller), setpoint, velocity in zip(self.axes, setpoints, velocities):
+            controller.set_setpoint(setpoint)
+            controller.set_velocity(velocity)
+
+    async def track(self):
+        '''!
+        Measures the target in every subpage until cancelled, and once the turret is aiming,
+        moves the setpoints with it.
+        '''
+        while True:
+            counts = self._ready is None or self._ready()
+            found, x_angle, y_angle, capture_time = await self.measure()
+            self._last_measured = utime.ticks_ms()
+            self._last = (x_angle, y_angle)
+            if counts:
+                self.updates += 1
+                if found:
+                    self.finds += 1
+            if found:
+                self.tracker.update(x_angle, y_angle, capture_time)
+                if self._follow:
+                    self._steer(utime.ticks_add(utime.ticks_ms(), self.shot_lead), True)
+                elif self._fire_time is not None:
+                    self._steer(self._fire_time, False)
+            self._measured.set()
+
+    async def watch(self, duel):
+        '''!
+        Checks every safety period until cancelled that the horizontal axis is within its travel
+        limit and, once tracking has started, that the camera keeps sending subpages. Otherwise it
+        disables everything and cancels the duel.
+        @param duel Task running the duel
+        '''
+        encoder = self.axes[0][1]
+        while True:
+            await asyncio.sleep(self.safety_period / 1000)
+            if self.travel_limit is not None and abs(encoder.position) > self.travel_limit:
+                self.fault = 'the horizontal axis turned too far'
+            elif (self._last_measured is not None
+                  and utime.ticks_diff(utime.ticks_ms(), self._last_measured) > self.camera_timeout):
+                self.fault = 'the camera stopped sending images'
+            if self.fault is not None:
+                print(f"Safety stop: {self.fault}")
+                self.make_safe()
+                duel.cancel()
+                return
+
+    async def fire(self):
+        '''!
+        Spins up the flywheels and pushes the dart, while the other coroutines keep running.
+        '''
+        self.trigger_pin.high()
+        await asyncio.sleep(self.spin_up_time / 1000)
+        # Shoot once (sometimes the dart needs extra encouragement so the plunger pushes twice)
+        for position in self.plunger_sequence:
+            self.servo.set_position(position)
+            await asyncio.sleep(self.plunger_step / 1000)
+
+    async def run(self):
+        '''!
+        Runs a duel: turns around, finds the target, aims and shoots, then disables everything.
+        '''
+        self._measured = asyncio.Event()
+        self._follow = False
+        self._fire_time = None
+        self._last_measured = None
+        self.fault = None
+        loops = [asyncio.create_task(self.control_loop(*axis)) for axis in self.axes]
+        safety = asyncio.create_task(self.watch(asyncio.current_task()))
+        tracking = None
+        x_controller = self.axes[0][2]
+        try:
+            # Turn the turret around
+            x_controller.set_setpoint(self.turn_angle * self.lens.x_tick_ratio)
+            await asyncio.sleep(self.turn_time / 1000)
+            if self._on_turned is not None:
+                self._on_turned()
+
+            # Measure the target over a few subpages
+            self.tracker.reset()
+            self.updates = self.finds = 0
+            self._last_measured = utime.ticks_ms()
+            tracking = asyncio.create_task(self.track())
+            relearned = 0
+            while True:
+                while self.updates < self.track_updates:
+                    await self._measured.wait()
+                    self._measured.clear()
+                if self.finds or relearned >= self.relearns or self._on_turned is None:
+                    break
+                # A target which stood still while the view was learned is part of it, so learn again
+                self._on_turned()
+                self.updates = self.finds = 0
+                relearned += 1
+
+            # Aim where the target will be when the dart leaves, capturing the move and timing it
+            # through the tracking corrections that follow
+            for motor, encoder, controller in self.axes:
+                controller.telemetry.arm(self.pre_trigger)
+                controller.start_move()
+            adjust_time = utime.ticks_ms()
+            self._steer(utime.ticks_add(adjust_time, self.adjust_timeout + self.shot_lead), False)
+            if self._on_aim is not None:
+                self._on_aim()
+
+            # Fire as soon as the horizontal axis settles, following the target's speed meanwhile
+            self._follow = True
+            adjusting = 0
+            while not x_controller.settled() and adjusting <= self.adjust_timeout:
+                await asyncio.sleep(self.control_period / 1000)
+                adjusting = utime.ticks_diff(utime.ticks_ms(), adjust_time)
+            print(f"Settle time: {x_controller.settle_time} ms (adjusted for {adjusting} ms)")
+
+            # Keep aiming where the target will be when the dart leaves while shooting
+            self._follow = False
+            self._fire_time = utime.ticks_add(utime.ticks_ms(), self.shot_lead)
+            self._steer(self._fire_time, False)
+            await self.fire()
+        except asyncio.CancelledError:
+            # Stopped by the safety coroutine, which has set the fault
+            if self.fault is None:
+                raise
+        finally:
+            if tracking is not None:
+                tracking.cancel()
+            for loop in loops:
+                loop.cancel()
+            safety.cancel()
+            self.make_safe()
+
+
+# Tries the runtime with stand-in hardware: the turret turns around and shoots at a moving target
+## @cond NO_DOXY don't document the demo
+if __name__ == '__main__':
+    import stand_in
+    import closedloopcontrol
+    import tracker
+    import camera_model
+    import turret_pose
+
+    tickratio = 194000 / 180
+    lens = camera_model.CameraModel(32, 24, 55, 35, 0, 0, 0, 0.5, 1, tickratio, tickratio)
+    axis1 = stand_in.Axis()
+    axis2 = stand_in.Axis()
+    M1 = stand_in.Motor(axis1)
+    E1 = stand_in.Encoder(axis1)
+    E2 = stand_in.Encoder(axis2)
+    C1 = closedloopcontrol.pid_loop(0.05, 0.01, 0.004, 0, kv=100 / axis1.max_speed, tolerance=1000)
+    C2 = closedloopcontrol.pid_loop(0.05, 0.01, 0.004, 0, tolerance=1000)
+    M1.enable_motor()
+    camera = stand_in.Camera(axis1, lens, target_angle=185, target_speed=2)
+    pose = turret_pose.TurretPose(E1, E2)
+
+    class Plunger(stand_in.Servo):
+        # Notes where the turret and target are at the first push
+        shot = None
+
+        def set_position(self, position):
+            if position < 0 and self.shot is None:
+                self.shot = (E1.read() / tickratio, camera.target_angle())
+            super().set_position(position)
+
+    async def measure():
+        # The hottest pixel is the target
+        image, subpage = await camera.next_frame(on_ready=pose.capture)
+        pix = image.pix
+        idx = max(range(len(pix)), key=pix.__getitem__)
+        x_turret, y_turret = lens.to_degrees(*pose.at(pose.time))
+        x_adj, y_adj = lens.angles(idx % lens.width + 0.5, idx // lens.width + 0.5)
+        return True, x_turret - x_adj, y_turret - y_adj, pose.time_ms
+
+    plunger = Plunger()
+    runtime = TurretRuntime(measure, ((M1, E1, C1), (None, E2, C2)), plunger, stand_in.Pin(),
+                            tracker.TargetTracker(beta=0.05), lens, turn_time=2000, spin_up_time=500)
+    asyncio.run(runtime.run())
+    print(f"Shot with the turret at {plunger.shot[0]:.2f} degrees and the target at {plunger.shot[1]:.2f} degrees")
+## @endcond
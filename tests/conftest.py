@@ -0,0 +1,46 @@
+"""
+@file conftest.py
+Lets the camera driver be imported under CPython for the tests, by providing
+the few MicroPython builtins and modules it uses.
+"""
+
+import binascii
+import builtins
+import collections
+import gc
+import os
+import sys
+import time
+import types
+
+builtins.const = lambda value: value
+sys.modules.setdefault('ubinascii', binascii)
+sys.modules.setdefault('ucollections', collections)
+
+# only the layout constants and a dummy struct; the tests don't do block reads
+uctypes = types.ModuleType('uctypes')
+for name in ('INT8', 'UINT8', 'INT16', 'UINT16', 'BFUINT16', 'BF_POS',
+             'BF_LEN', 'BIG_ENDIAN', 'ARRAY'):
+    setattr(uctypes, name, 0)
+uctypes.addressof = lambda buf: 0
+uctypes.struct = lambda *args: types.SimpleNamespace(pix=None)
+sys.modules.setdefault('uctypes', uctypes)
+
+utime = types.ModuleType('utime')
+utime.ticks_us = lambda: int(time.perf_counter() * 1_000_000)
+utime.ticks_ms = lambda: int(time.perf_counter() * 1000)
+utime.ticks_diff = lambda end, start: end - start
+utime.ticks_add = lambda ticks, delta: ticks + delta
+utime.sleep_us = lambda us: time.sleep(us / 1_000_000)
+utime.sleep_ms = lambda ms: time.sleep(ms / 1000)
+sys.modules.setdefault('utime', utime)
+
+# the tests pass fake cameras in, so the bus classes are never used
+machine = types.ModuleType('machine')
+machine.Pin = machine.I2C = object
+sys.modules.setdefault('machine', machine)
+
+if not hasattr(gc, 'mem_free'):
+    gc.mem_free = lambda: 0
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
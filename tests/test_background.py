@@ -0,0 +1,114 @@
+"""
+@file test_background.py
+Checks BackgroundModel's k-sigma test on synthetic images: a drift shared by
+the whole image is followed without false targets, and a warm patch is found
+in whole images, regions of interest and single subpages.
+"""
+
+import random
+
+from background import BackgroundModel, MEAN_FRAC
+from packed_mask import PackedMask
+
+WIDTH, HEIGHT = 32, 24
+NOISE = 1
+
+
+class Scene:
+    # a fixed background of different levels per pixel, plus noise and drift
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.level = [self.rng.randint(-200, 800) for _ in range(WIDTH * HEIGHT)]
+        self.drift = 0
+        self.patch = ()
+
+    def image(self):
+        rng = self.rng
+        data = [v + self.drift + round(rng.gauss(0, NOISE)) for v in self.level]
+        for idx in self.patch:
+            data[idx] += 60
+        return data
+
+
+def patch(col, row, size=3):
+    return {(row + r) * WIDTH + col + c for r in range(size) for c in range(size)}
+
+
+def learned(scene, model):
+    while not model.ready:
+        model.update(scene.image())
+
+
+def set_pixels(mask):
+    return {idx for idx in range(len(mask)) if mask[idx]}
+
+
+def test_follows_drift():
+    scene = Scene(1)
+    model = BackgroundModel()
+    learned(scene, model)
+    false = 0
+    for _ in range(60):
+        # the camera warms up by 2 counts an image
+        scene.drift += 2
+        false += model.update(scene.image())
+    assert false <= 2
+    # the means lag further behind than the k-sigma threshold of 6 counts,
+    # which only the drift taken out of the comparison makes up for
+    assert model.drift >> MEAN_FRAC > 3 * 2
+
+
+def test_finds_patch():
+    scene = Scene(2)
+    model = BackgroundModel()
+    learned(scene, model)
+    scene.patch = patch(10, 8)
+    mask = PackedMask()
+    heat = [0] * (WIDTH * HEIGHT)
+    assert model.update(scene.image(), mask, heat) == len(scene.patch)
+    assert set_pixels(mask) == scene.patch
+    assert all(heat[idx] > 40 for idx in scene.patch)
+
+
+def test_roi_clears_outside_and_keeps_drift():
+    scene = Scene(3)
+    model = BackgroundModel()
+    learned(scene, model)
+    mask = PackedMask()
+    heat = [7] * (WIDTH * HEIGHT)
+    mask.rows[0] = 0xFFFF
+    # a target filling most of the region must not pass for a drift
+    scene.patch = patch(4, 10, 4) | patch(9, 10, 4) | patch(14, 10, 4)
+    for _ in range(3):
+        model.update(scene.image(), mask, heat, rows=(10, 13))
+        assert set_pixels(mask) == scene.patch
+    assert abs(model.drift >> MEAN_FRAC) <= 1
+    assert all(heat[idx] == 0 for idx in range(WIDTH * HEIGHT)
+               if not 10 <= idx // WIDTH <= 13)
+
+
+def test_subpages():
+    scene = Scene(4)
+    model = BackgroundModel()
+    while not model.ready:
+        model.update(scene.image(), subpage=0)
+        model.update(scene.image(), subpage=1)
+    scene.patch = patch(20, 5)
+    mask = PackedMask()
+    model.update(scene.image(), mask, subpage=0)
+    chess0 = {idx for idx in scene.patch if ((idx // WIDTH) ^ idx) & 1 == 0}
+    assert set_pixels(mask) == chess0
+    # the other subpage adds its pixels and keeps the first one's bits
+    model.update(scene.image(), mask, subpage=1)
+    assert set_pixels(mask) == scene.patch
+
+
+def test_frozen_doesnt_learn():
+    scene = Scene(5)
+    model = BackgroundModel()
+    learned(scene, model)
+    model.freeze()
+    scene.patch = patch(0, 0)
+    for _ in range(30):
+        found = model.update(scene.image())
+    assert found == len(scene.patch)
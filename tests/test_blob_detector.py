@@ -0,0 +1,97 @@
+"""
+@file test_blob_detector.py
+Checks BlobDetector's single-pass union-find labelling against a plain flood
+fill, on random masks given as lists and as PackedMask rows.
+"""
+
+import random
+
+import pytest
+
+from blob_detector import BlobDetector
+from packed_mask import PackedMask
+
+WIDTH, HEIGHT = 32, 24
+
+
+def flood_fill(mask, heat):
+    # 8-connected components as lists of pixel indices, with their stats
+    seen = set()
+    blobs = []
+    for start in range(WIDTH * HEIGHT):
+        if not mask[start] or start in seen:
+            continue
+        seen.add(start)
+        stack, pixels = [start], []
+        while stack:
+            idx = stack.pop()
+            pixels.append(idx)
+            row, col = divmod(idx, WIDTH)
+            for r in (row - 1, row, row + 1):
+                for c in (col - 1, col, col + 1):
+                    near = r * WIDTH + c
+                    if (0 <= r < HEIGHT and 0 <= c < WIDTH and mask[near]
+                            and near not in seen):
+                        seen.add(near)
+                        stack.append(near)
+        blobs.append(pixels)
+    return blobs
+
+
+def describe(pixels, heat):
+    cols = [idx % WIDTH for idx in pixels]
+    rows = [idx // WIDTH for idx in pixels]
+    return (len(pixels), min(cols), max(cols), min(rows), max(rows),
+            sum(heat[idx] for idx in pixels), max(heat[idx] for idx in pixels))
+
+
+def random_mask(rng, density):
+    return [int(rng.random() < density) for _ in range(WIDTH * HEIGHT)]
+
+
+@pytest.mark.parametrize('packed', (False, True))
+@pytest.mark.parametrize('density', (0.1, 0.3, 0.55))
+def test_matches_flood_fill(packed, density):
+    rng = random.Random(int(density * 100))
+    detector = BlobDetector(WIDTH, HEIGHT, max_blobs=WIDTH * HEIGHT)
+    for _ in range(5):
+        bits = random_mask(rng, density)
+        heat = [rng.randint(1, 50) for _ in range(WIDTH * HEIGHT)]
+        mask = bits
+        if packed:
+            mask = PackedMask(WIDTH, HEIGHT)
+            mask.threshold(bits, 0)
+        found = detector.detect(mask, heat)
+        expected = flood_fill(bits, heat)
+        assert len(found) == len(expected)
+        assert sorted((blob.area, blob.x_min, blob.x_max, blob.y_min, blob.y_max,
+                       blob.heat, blob.peak) for blob in found) == sorted(
+            describe(pixels, heat) for pixels in expected)
+        # the label image groups the pixels the same way as the flood fill
+        for pixels in expected:
+            assert len({detector.labels[idx] for idx in pixels}) == 1
+        assert all(detector.labels[idx] == 0 for idx in range(WIDTH * HEIGHT)
+                   if not bits[idx])
+        heats = [blob.heat for blob in found]
+        assert heats == sorted(heats, reverse=True)
+
+
+def test_centroid_and_min_area():
+    bits = [0] * (WIDTH * HEIGHT)
+    for row, col in ((2, 3), (2, 4), (3, 3), (3, 4), (10, 20)):
+        bits[row * WIDTH + col] = 1
+    found = BlobDetector().detect(bits, min_area=2)
+    assert len(found) == 1
+    assert (found[0].x, found[0].y) == (4.0, 3.0)
+    assert found[0].area == found[0].heat == 4
+
+
+def test_keeps_hottest_when_full():
+    bits = [0] * (WIDTH * HEIGHT)
+    heat = [0] * (WIDTH * HEIGHT)
+    for n in range(6):
+        idx = 2 * n * WIDTH
+        bits[idx] = 1
+        heat[idx] = n + 1
+    found = BlobDetector(max_blobs=3).detect(bits, heat)
+    assert [blob.heat for blob in found] == [6, 5, 4]
@@ -0,0 +1,47 @@
+"""
+@file test_camera_model.py
+Checks CameraModel's interpolated angle tables against the pinhole model
+worked out directly.
+"""
+
+from math import atan, tan, radians, degrees
+
+import pytest
+
+from camera_model import CameraModel
+
+
+def pinhole(pos, size, fov, distortion=0, offset=0, scale=1):
+    r = (2 * pos / size - 1) * tan(radians(fov / 2))
+    r *= 1 + distortion * r * r
+    return (degrees(atan(r)) + offset) * scale
+
+
+def test_edges_and_centre():
+    model = CameraModel(x_fov=55, y_fov=35)
+    assert model.angles(16, 12) == pytest.approx((0, 0), abs=1e-6)
+    assert model.angles(0, 0) == pytest.approx((-27.5, -17.5))
+    assert model.angles(32, 24) == pytest.approx((27.5, 17.5))
+    # positions outside the image are clamped to its edges
+    assert model.angles(-3, 40) == pytest.approx((-27.5, 17.5))
+
+
+@pytest.mark.parametrize('distortion', (0, -0.2))
+def test_matches_pinhole(distortion):
+    model = CameraModel(distortion=distortion, x_offset=1.5, y_offset=-0.5,
+                        x_scale=1.1, y_scale=0.9)
+    for n in range(65):
+        x = n / 2
+        y = 24 * n / 64
+        angle_x, angle_y = model.angles(x, y)
+        # linear interpolation between pixel edges is good to a few
+        # hundredths of a degree
+        assert angle_x == pytest.approx(pinhole(x, 32, 55, distortion, 1.5, 1.1), abs=0.02)
+        assert angle_y == pytest.approx(pinhole(y, 24, 35, distortion, -0.5, 0.9), abs=0.02)
+
+
+def test_ticks_round_trip():
+    model = CameraModel(x_tick_ratio=194000 / 180, y_tick_ratio=50)
+    ticks = model.to_ticks(12.5, -3)
+    assert ticks == pytest.approx((12.5 * 194000 / 180, -150))
+    assert model.to_degrees(*ticks) == pytest.approx((12.5, -3))
@@ -0,0 +1,112 @@
+"""
+@file test_frame_stream.py
+Checks that FrameStream rotates its buffers, refuses to overwrite a held
+frame and never pairs subpages from different measurements, using a fake
+camera on a fake clock.
+"""
+
+import types
+
+import pytest
+
+import mlx_cam
+from mlx_cam import FrameStream, StreamOverrunError
+
+PERIOD_US = 15625
+
+
+class FakeCamera:
+    # measurement k is ready at k * PERIOD_US and is subpage k % 2
+    subpage_period_us = PERIOD_US
+
+    def __init__(self):
+        self.now = 0
+        self.last_read = -1
+
+    def _latest(self):
+        return self.now // PERIOD_US
+
+    def read_status(self):
+        k = self._latest()
+        return types.SimpleNamespace(ready=k > self.last_read, subpage=k % 2)
+
+    def read_image(self, sp_id, *, block=True, status=None, image=None, rows=None):
+        k = self._latest()
+        assert sp_id == k % 2
+        self.last_read = k
+        # tag each subpage's slot with the measurement it came from
+        image.pix[sp_id] = k
+
+
+@pytest.fixture
+def camera(monkeypatch):
+    cam = FakeCamera()
+    monkeypatch.setattr(mlx_cam.time, 'ticks_us', lambda: cam.now)
+    monkeypatch.setattr(mlx_cam.time, 'ticks_ms', lambda: cam.now // 1000)
+    return cam
+
+
+def poll_at(stream, camera, measurement, lag_us=0):
+    camera.now = measurement * PERIOD_US + lag_us
+    return stream.poll()
+
+
+def test_buffers_rotate(camera):
+    stream = FrameStream(camera, buffers=2)
+    frames, seqs = [], []
+    for k in range(6):
+        poll_at(stream, camera, k)
+        frame = stream.get()
+        if frame is not None:
+            frames.append(frame)
+            seqs.append(frame.seq)
+            assert frame.image.pix[1] == frame.image.pix[0] + 1
+            frame.release()
+    assert seqs == [0, 1, 2]
+    assert frames[0] is frames[2] and frames[0] is not frames[1]
+    assert stream.dropped == 0
+
+
+def test_nothing_ready(camera):
+    stream = FrameStream(camera)
+    poll_at(stream, camera, 0)
+    assert stream.poll() is None
+    assert stream.get() is None
+
+
+def test_overrun(camera):
+    stream = FrameStream(camera, buffers=2)
+    for k in range(4):
+        poll_at(stream, camera, k)
+    assert len(stream._done) == 2
+    # both buffers are held, so the next subpage has nowhere to go
+    with pytest.raises(StreamOverrunError):
+        poll_at(stream, camera, 4)
+    stream.get().release()
+    poll_at(stream, camera, 4)
+    assert poll_at(stream, camera, 5).seq == 2
+
+
+def test_skipped_measurements(camera):
+    stream = FrameStream(camera)
+    # 0, (1 missed), (0 missed), 1: the subpage numbers alternate but the
+    # gap shows the measurements aren't one frame
+    poll_at(stream, camera, 0)
+    assert poll_at(stream, camera, 3) is None
+    assert stream.dropped == 2
+    # 0, (1 missed), 0, 1 pairs only the last two
+    poll_at(stream, camera, 4)
+    poll_at(stream, camera, 6)
+    frame = poll_at(stream, camera, 7)
+    assert (frame.image.pix[0], frame.image.pix[1]) == (6, 7)
+    assert stream.dropped == 3
+
+
+def test_late_polls_still_pair(camera):
+    # a poll that lags up to almost a subpage period doesn't break a frame
+    stream = FrameStream(camera)
+    poll_at(stream, camera, 0, lag_us=0)
+    frame = poll_at(stream, camera, 1, lag_us=PERIOD_US - 1)
+    assert frame is not None and stream.dropped == 0
+    poll_at(stream, camera, 2, lag_us=PERIOD_US - 1)
+    assert poll_at(stream, camera, 3, lag_us=0) is not None
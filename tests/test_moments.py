@@ -0,0 +1,79 @@
+"""
+@file test_moments.py
+Checks Moments' row-by-row accumulation against direct sums over the pixels.
+"""
+
+import math
+import random
+
+import pytest
+
+from moments import Moments
+
+WIDTH, HEIGHT = 32, 24
+
+
+def direct(weights):
+    # mij as plain sums of weight * x**i * y**j over the pixels
+    sums = dict.fromkeys(('m00', 'm10', 'm01', 'm11', 'm20', 'm02'), 0)
+    for idx, w in enumerate(weights):
+        if w <= 0:
+            continue
+        y, x = divmod(idx, WIDTH)
+        sums['m00'] += w
+        sums['m10'] += w * x
+        sums['m01'] += w * y
+        sums['m11'] += w * x * y
+        sums['m20'] += w * x * x
+        sums['m02'] += w * y * y
+    return sums
+
+
+def check(moments, weights):
+    for name, value in direct(weights).items():
+        assert getattr(moments, name) == value, name
+
+
+def test_weighted_with_offset():
+    rng = random.Random(1)
+    image = [rng.randint(0, 200) for _ in range(WIDTH * HEIGHT)]
+    moments = Moments().accumulate(image, offset=50)
+    check(moments, [v - 50 for v in image])
+
+
+def test_mask_label_and_bounds():
+    rng = random.Random(2)
+    image = [rng.randint(1, 100) for _ in range(WIDTH * HEIGHT)]
+    labels = [rng.choice((0, 1, 2)) for _ in range(WIDTH * HEIGHT)]
+    bounds = (4, 20, 3, 15)
+
+    def inside(idx):
+        y, x = divmod(idx, WIDTH)
+        return bounds[0] <= x <= bounds[1] and bounds[2] <= y <= bounds[3]
+
+    moments = Moments().accumulate(image, labels, label=2, bounds=bounds)
+    check(moments, [v if labels[idx] == 2 and inside(idx) else 0
+                    for idx, v in enumerate(image)])
+    moments = Moments().accumulate(mask=labels)
+    check(moments, [1 if v else 0 for v in labels])
+
+
+def test_shape():
+    # a bar along the diagonal from top left to bottom right
+    image = [0] * (WIDTH * HEIGHT)
+    for n in range(10):
+        image[(5 + n) * WIDTH + 5 + n] = 1
+    moments = Moments().accumulate(image)
+    assert moments.centroid() == pytest.approx((10.0, 10.0))
+    major, minor = moments.spread()
+    assert minor == pytest.approx(0, abs=1e-6)
+    assert major == pytest.approx(math.sqrt(2 * (10**2 - 1) / 12))
+    assert moments.orientation() == pytest.approx(math.pi / 4)
+
+
+def test_empty():
+    moments = Moments()
+    assert moments.area() == 0
+    assert moments.centroid() is None
+    assert moments.spread() is None
+    assert moments.orientation() is None
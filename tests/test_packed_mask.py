@@ -0,0 +1,104 @@
+"""
+@file test_packed_mask.py
+Checks PackedMask's row-word operations against the same operations done
+pixel by pixel on a list of bits.
+"""
+
+import random
+
+import pytest
+
+from packed_mask import PackedMask, popcount
+
+
+def random_bits(rng, width, height, density):
+    return [[int(rng.random() < density) for _ in range(width)] for _ in range(height)]
+
+
+def pack(bits):
+    height, width = len(bits), len(bits[0])
+    mask = PackedMask(width, height)
+    mask.threshold([v for row in bits for v in row], 0)
+    return mask
+
+
+def unpack(mask):
+    return [[mask[row * mask.width + col] for col in range(mask.width)]
+            for row in range(mask.height)]
+
+
+def neighbours(bits, row, col):
+    height, width = len(bits), len(bits[0])
+    for dr in (-1, 0, 1):
+        for dc in (-1, 0, 1):
+            if dr or dc:
+                r, c = row + dr, col + dc
+                # pixels outside the image are background
+                yield bits[r][c] if 0 <= r < height and 0 <= c < width else 0
+
+
+def ref_dilate(bits):
+    return [[int(v or any(neighbours(bits, r, c))) for c, v in enumerate(line)]
+            for r, line in enumerate(bits)]
+
+
+def ref_erode(bits):
+    return [[int(v and all(neighbours(bits, r, c))) for c, v in enumerate(line)]
+            for r, line in enumerate(bits)]
+
+
+def ref_remove_isolated(bits):
+    return [[int(v and any(neighbours(bits, r, c))) for c, v in enumerate(line)]
+            for r, line in enumerate(bits)]
+
+
+SHAPES = [(32, 24), (20, 6), (16, 5), (9, 4)]
+
+
+def test_popcount():
+    for word in range(1 << 16):
+        assert popcount(word) == bin(word).count('1')
+
+
+@pytest.mark.parametrize('width, height', SHAPES)
+@pytest.mark.parametrize('density', (0.15, 0.5, 0.85))
+def test_morphology(width, height, density):
+    rng = random.Random(width * height)
+    for _ in range(5):
+        bits = random_bits(rng, width, height, density)
+        for method, ref in (('dilate', ref_dilate), ('erode', ref_erode),
+                            ('remove_isolated', ref_remove_isolated)):
+            mask = pack(bits)
+            getattr(mask, method)()
+            assert unpack(mask) == ref(bits), method
+
+
+@pytest.mark.parametrize('width, height', SHAPES)
+def test_counts_and_centroid(width, height):
+    rng = random.Random(width + height)
+    bits = random_bits(rng, width, height, 0.4)
+    mask = pack(bits)
+    assert mask.count() == sum(map(sum, bits))
+    assert list(mask.row_sums([0] * height)) == [sum(line) for line in bits]
+    assert list(mask.column_sums([0] * width)) == [sum(line[c] for line in bits)
+                                                  for c in range(width)]
+    area = sum(map(sum, bits))
+    x = sum(c for line in bits for c, v in enumerate(line) if v) / area + 0.5
+    y = sum(r for r, line in enumerate(bits) for v in line if v) / area + 0.5
+    assert mask.centroid() == pytest.approx((x, y))
+
+
+def test_threshold_rows():
+    image = list(range(32 * 24))
+    mask = PackedMask()
+    mask.threshold(image, 100, rows=(5, 9))
+    expected = [int(5 <= idx // 32 <= 9 and v > 100) for idx, v in enumerate(image)]
+    assert [mask[idx] for idx in range(len(mask))] == expected
+
+
+def test_empty():
+    mask = PackedMask()
+    assert mask.count() == 0
+    assert mask.centroid() is None
+    with pytest.raises(ValueError):
+        PackedMask(33, 2)
@@ -0,0 +1,31 @@
+"""
+@file test_pixel_runs.py
+Checks that the burst reads of one subpage transfer only that subpage's
+pixels, for the whole image and for a band of rows.
+"""
+
+import pytest
+
+from mlx90640.calibration import NUM_COLS, IMAGE_SIZE
+from mlx90640.image import ChessPattern, InterleavedPattern
+
+
+def covered(runs):
+    return [idx for start, length in runs for idx in range(start, start + length)]
+
+
+@pytest.mark.parametrize('pattern', (ChessPattern, InterleavedPattern))
+@pytest.mark.parametrize('sp_id', (0, 1))
+def test_runs_transfer_one_subpage(pattern, sp_id):
+    runs = pattern.sp_runs(sp_id)
+    words = covered(runs)
+    assert len(words) == IMAGE_SIZE // 2
+    assert words == list(pattern.sp_range(sp_id))
+    assert all(pattern.get_sp(idx) == sp_id for idx in words)
+
+
+@pytest.mark.parametrize('pattern', (ChessPattern, InterleavedPattern))
+def test_roi_runs(pattern):
+    first, last = 5, 9
+    words = covered(pattern.sp_runs(1, (first, last))) + covered(pattern.sp_runs(0, (first, last)))
+    assert sorted(words) == list(range(first * NUM_COLS, (last + 1) * NUM_COLS))
@@ -0,0 +1,57 @@
+"""
+@file test_pyramid.py
+Checks ImagePyramid's levels against block sums computed directly, with and
+without mirroring.
+"""
+
+import random
+
+import pytest
+
+from pyramid import ImagePyramid
+
+WIDTH, HEIGHT = 32, 24
+
+
+def block_sums(image, size, mirror):
+    cols = WIDTH // size
+    sums = []
+    for row in range(HEIGHT // size):
+        for col in range(cols):
+            # a mirrored cell holds the block at the other end of the row
+            src = cols - 1 - col if mirror else col
+            sums.append(sum(image[(row * size + r) * WIDTH + src * size + c]
+                            for r in range(size) for c in range(size)))
+    return sums
+
+
+@pytest.mark.parametrize('mirror', (False, True))
+def test_levels(mirror):
+    rng = random.Random(5)
+    image = [rng.randint(-500, 3000) for _ in range(WIDTH * HEIGHT)]
+    pyramid = ImagePyramid(mirror=mirror)
+    pyramid.build(image)
+    assert list(pyramid.level1) == block_sums(image, 2, mirror)
+    assert list(pyramid.level2) == block_sums(image, 4, mirror)
+    assert (pyramid.min, pyramid.max) == (min(image), max(image))
+    assert pyramid.mean(1) == pytest.approx(sum(image) / (16 * 12))
+
+
+def test_peak_and_window():
+    image = [10] * (WIDTH * HEIGHT)
+    # a hot pixel loses to a warm 4x4 block
+    image[0] = 400
+    for r in range(4):
+        for c in range(4):
+            image[(12 + r) * WIDTH + 20 + c] = 40
+    pyramid = ImagePyramid()
+    pyramid.build(image)
+    assert pyramid.peak(2) == (5, 3, 16 * 40)
+    assert pyramid.window(2, 5, 3, 2) == (18, 25, 10, 17)
+    assert pyramid.window(2, 0, 0, 2) == (0, 5, 0, 5)
+    assert pyramid.window(2, 7, 5, 2) == (26, 31, 18, 23)
+
+
+def test_size_check():
+    with pytest.raises(ValueError):
+        ImagePyramid(30, 24)
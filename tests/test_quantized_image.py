@@ -0,0 +1,117 @@
+"""
+@file test_quantized_image.py
+Checks the fixed-point QuantizedImage against the float ProcessedImage on a
+synthetic calibration, through the calibration cache as on the camera.
+"""
+
+import random
+from array import array
+
+import pytest
+
+from mlx90640 import CameraState
+from mlx90640.calibration import CameraCalibration, IMAGE_SIZE, TEMP_K
+from mlx90640.image import (
+    ProcessedImage,
+    QuantizedImage,
+    RawImage,
+    Subpage,
+    ChessPattern,
+    InterleavedPattern,
+)
+
+DEVICE_ID = b'\x01\x02\x03\x04\x05\x06'
+
+# error bound in ADC counts of v_ir documented on QuantizedImage (the worst
+# seen on this data is 0.84)
+MAX_ERROR = 1.0
+
+
+def make_calibration(rng, use_tgc):
+    # plausible coefficients for every field the cache holds
+    calib = object.__new__(CameraCalibration)
+    calib.emissivity = 0.95
+    calib.use_tgc = use_tgc
+    calib.quantized = False
+    calib.pix_data = None
+    for name in ('k_vdd', 'vdd_25', 'res_ee', 'ptat_25', 'gain',
+                 'kta_scale_1', 'kta_scale_2', 'kv_scale', 'ksto_scale'):
+        setattr(calib, name, 1)
+    calib.kv_ptat = calib.kt_ptat = calib.alpha_ptat = 1.0
+    calib.ksta = -0.002
+    calib.il_chess_c1, calib.il_chess_c2, calib.il_chess_c3 = 1.5, 0.5, 1.0
+    calib.drift = 0
+    calib.kv_avg = ((0.4, 0.5), (0.45, 0.55))
+    calib.ksto = (-0.0005, -0.0008, 0.0, 0.0)
+    calib.alpha_ext = (1.0, 1.0, 1.0, 1.0)
+    calib.ct = (-40, 0, 160, 320)
+    calib.tgc, calib.kta_cp, calib.kv_cp = 0.5, 0.003, 0.3
+    calib.pix_alpha_cp = (4e-9, 4.2e-9)
+    calib.pix_os_cp = (-50, -48)
+    calib.outliers = ()
+    calib.pix_os_ref = array('h', (rng.randint(-900, 900) for _ in range(IMAGE_SIZE)))
+    calib.pix_kta = array('f', (rng.uniform(0.002, 0.006) for _ in range(IMAGE_SIZE)))
+    calib.pix_alpha = array('f', (rng.uniform(1e-7, 2e-7) for _ in range(IMAGE_SIZE)))
+    calib.il_offset = array('f', (rng.choice((-2.5, -1, 0.5, 1.75)) for _ in range(IMAGE_SIZE)))
+    return calib
+
+
+@pytest.mark.parametrize('use_tgc', (False, True))
+@pytest.mark.parametrize('pattern', (ChessPattern, InterleavedPattern))
+def test_quantized_matches_processed(tmp_path, use_tgc, pattern):
+    rng = random.Random(2)
+    calib = make_calibration(rng, use_tgc)
+    alpha = array('f', calib.pix_alpha)
+    path = str(tmp_path / 'camera.cal')
+    calib.save(path, DEVICE_ID)
+
+    processed = ProcessedImage(
+        CameraCalibration.from_cache(path, DEVICE_ID, emissivity=0.95, use_tgc=use_tgc),
+        pattern)
+    quantized = QuantizedImage(
+        CameraCalibration.from_cache(path, DEVICE_ID, emissivity=0.95, use_tgc=use_tgc,
+                                     quantized=True),
+        pattern)
+
+    raw = RawImage()
+    for idx in range(IMAGE_SIZE):
+        raw.pix[idx] = int(calib.pix_os_ref[idx] * 1.03) + rng.randint(-50, 1500)
+    state = CameraState(vdd=0.05, ta=13.0, ta_r=(28 + TEMP_K)**4, gain=1.02,
+                        gain_cp=(-60.0, -58.0))
+    for sp in (0, 1):
+        processed.update(raw, Subpage(pattern, sp), state)
+        quantized.update(raw, Subpage(pattern, sp), state)
+
+    # the difference times alpha is the error in counts before the 1/alpha scaling
+    scale = 2.0**-quantized.exponent
+    worst = max(abs(quantized.buf[idx] * scale - processed.buf[idx]) * alpha[idx]
+                for idx in range(IMAGE_SIZE))
+    assert worst <= MAX_ERROR
+
+
+def test_quantized_calibration_saves_floats(tmp_path):
+    # a calibration loaded quantized writes the same cache, to within int16
+    # rounding, marked so that only a quantized load accepts it
+    calib = make_calibration(random.Random(3), False)
+    path = str(tmp_path / 'camera.cal')
+    calib.save(path, DEVICE_ID)
+    quantized = CameraCalibration.from_cache(path, DEVICE_ID, quantized=True)
+    assert quantized.pix_kta.typecode == 'h'
+    path2 = str(tmp_path / 'again.cal')
+    quantized.save(path2, DEVICE_ID)
+    with pytest.raises(ValueError):
+        CameraCalibration.from_cache(path2, DEVICE_ID)
+    again = CameraCalibration.from_cache(path2, DEVICE_ID, quantized=True)
+    for name in ('pix_kta', 'pix_alpha', 'il_offset'):
+        table = getattr(calib, name)
+        saved = getattr(again, name)
+        scale = 2.0**-getattr(again, name + '_exp')
+        peak = max(abs(v) for v in table)
+        assert max(abs(a - b * scale) for a, b in zip(table, saved)) <= peak * 2.0**-14
+
+
+def test_calibration_used_once(tmp_path):
+    calib = make_calibration(random.Random(4), False)
+    ProcessedImage(calib, ChessPattern)
+    with pytest.raises(ValueError):
+        ProcessedImage(calib, ChessPattern)
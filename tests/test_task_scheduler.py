@@ -0,0 +1,77 @@
+"""
+@file test_task_scheduler.py
+Checks TaskScheduler's ordering, periods, skipped runs and deadline misses on
+a fake clock.
+"""
+
+import pytest
+
+import task_scheduler
+from task_scheduler import Task, TaskScheduler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0]
+    monkeypatch.setattr(task_scheduler.utime, 'ticks_us', lambda: now[0])
+    return now
+
+
+def worker(clock, log, name, cost_us):
+    def gen():
+        while True:
+            log.append((name, clock[0]))
+            clock[0] += cost_us
+            yield
+    return gen
+
+
+def test_priority_and_period(clock):
+    log = []
+    scheduler = TaskScheduler()
+    scheduler.add(Task(worker(clock, log, 'slow', 100), 'slow', period=10))
+    scheduler.add(Task(worker(clock, log, 'fast', 100), 'fast', priority=1))
+    while clock[0] < 25_000:
+        scheduler.run_once()
+        clock[0] += 400
+    # the higher priority task runs first on each pass, and every pass
+    assert log[0][0] == 'fast' and log[1][0] == 'slow'
+    slow = [t for name, t in log if name == 'slow']
+    assert len(slow) == 3
+    assert all(b - a >= 10_000 for a, b in zip(slow, slow[1:]))
+
+
+def test_skips_and_misses(clock):
+    log = []
+    task = Task(worker(clock, log, 'late', 500), 'late', period=2, deadline=1)
+    task.run()
+    assert (task.runs, task.misses, task.skipped) == (1, 0, 0)
+    # the task is next due at 2 ms; run it 7.2 ms late
+    clock[0] = 9_200
+    assert task.ready(clock[0])
+    task.run()
+    assert task.misses == 1
+    assert task.skipped == 2
+    # it starts again a period after the late run instead of catching up
+    assert not task.ready(clock[0] + 1_000)
+    assert task.ready(clock[0] + 2_000)
+    assert (task.run_time, task.max_time) == (1_000, 500)
+
+
+def test_done_and_stop(clock):
+    scheduler = TaskScheduler()
+
+    def once():
+        yield 1
+
+    def stopper():
+        yield
+        scheduler.stop()
+        yield
+
+    first = scheduler.add(Task(once, 'once'))
+    scheduler.add(Task(stopper, 'stopper'))
+    scheduler.run()
+    assert first.done and not first.ready(clock[0])
+    report = scheduler.report()
+    assert 'once' in report and '(other)' in report
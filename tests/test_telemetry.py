@@ -0,0 +1,65 @@
+"""
+@file test_telemetry.py
+Checks TelemetryRecorder's ring buffer, decimation, triggered capture window
+and binary dump.
+"""
+
+import io
+import struct
+from array import array
+
+from telemetry import COLUMNS, DUMP_HEADER, DUMP_MAGIC, TelemetryRecorder
+
+
+def record(recorder, times):
+    for t in times:
+        recorder.record(t, 10 * t, -t, t / 4)
+
+
+def test_ring_keeps_newest():
+    recorder = TelemetryRecorder(capacity=8)
+    record(recorder, range(5))
+    assert list(recorder.samples('time')) == [0, 1, 2, 3, 4]
+    record(recorder, range(5, 20))
+    assert recorder.count == 8
+    assert list(recorder.samples('time')) == list(range(12, 20))
+    assert list(recorder.samples('setpoint')) == [10 * t for t in range(12, 20)]
+    assert list(recorder.samples(3)) == [t * 25 for t in range(12, 20)]
+
+
+def test_decimation():
+    recorder = TelemetryRecorder(capacity=10, decimation=3)
+    record(recorder, range(12))
+    assert list(recorder.samples('time')) == [0, 3, 6, 9]
+
+
+def test_trigger_window():
+    recorder = TelemetryRecorder(capacity=10)
+    recorder.arm(3)
+    record(recorder, range(20))
+    assert not recorder.stopped
+    recorder.trigger()
+    record(recorder, range(20, 40))
+    assert recorder.stopped
+    # three samples from before the trigger, then the buffer filled and stopped
+    assert list(recorder.samples('time')) == list(range(17, 27))
+    # a trigger that isn't armed does nothing
+    recorder.clear()
+    recorder.trigger()
+    record(recorder, range(5))
+    assert not recorder.stopped
+
+
+def test_dump():
+    recorder = TelemetryRecorder(capacity=6)
+    record(recorder, range(9))
+    stream = io.BytesIO()
+    recorder.dump(stream)
+    data = stream.getvalue()
+    size = struct.calcsize(DUMP_HEADER)
+    magic, count, columns, itemsize = struct.unpack(DUMP_HEADER, data[:size])
+    assert (magic, count, columns) == (DUMP_MAGIC, 6, len(COLUMNS))
+    values = array('l', data[size:])
+    assert values.itemsize == itemsize
+    assert list(values[:count]) == list(range(3, 9))
+    assert list(values[2 * count:3 * count]) == [-t for t in range(3, 9)]
@@ -0,0 +1,47 @@
+"""
+@file test_tracker.py
+Checks that TargetTracker follows a target moving at constant speed, limits
+the speed it believes and starts again after losing the target.
+"""
+
+import pytest
+
+from tracker import TargetTracker
+
+
+def test_constant_velocity():
+    tracker = TargetTracker()
+    # 20 degrees per second to the right, 5 up, one measurement every 30 ms
+    for n in range(20):
+        t = 1000 + 30 * n
+        tracker.update(-10 + 0.02 * (t - 1000), 3 + 0.005 * (t - 1000), t)
+    assert (tracker.vx, tracker.vy) == pytest.approx((20, 5))
+    x, y = tracker.predict(1000 + 30 * 19 + 250)
+    assert (x, y) == pytest.approx((-10 + 0.02 * (30 * 19 + 250), 3 + 0.005 * (30 * 19 + 250)))
+
+
+def test_first_measurements():
+    tracker = TargetTracker()
+    tracker.update(5, 0, 100)
+    assert (tracker.count, tracker.vx) == (1, 0)
+    assert tracker.predict(500) == (5, 0)
+    tracker.update(6, 0, 200)
+    assert tracker.vx == pytest.approx(10)
+    # a repeated time stamp is ignored
+    tracker.update(50, 0, 200)
+    assert (tracker.x, tracker.count) == (6, 2)
+
+
+def test_speed_limit():
+    tracker = TargetTracker(max_speed=90)
+    tracker.update(0, 0, 0)
+    tracker.update(10, -10, 10)
+    assert (tracker.vx, tracker.vy) == (90, -90)
+
+
+def test_lost_target():
+    tracker = TargetTracker(max_gap=500)
+    tracker.update(0, 0, 0)
+    tracker.update(1, 0, 100)
+    tracker.update(30, 4, 700)
+    assert (tracker.x, tracker.y, tracker.vx, tracker.count) == (30, 4, 0, 1)